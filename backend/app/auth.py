@@ -5,6 +5,11 @@ from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from datetime import datetime, timedelta, timezone
+from concurrent.futures import ProcessPoolExecutor
+import asyncio
+import multiprocessing
+import threading
+import time
 from .config import settings
 
 # --- Configurações de Segurança ---
@@ -24,6 +29,88 @@ def verify_password(plain_password, hashed_password):
     """Verifica se a senha em texto puro corresponde à senha criptografada."""
     return pwd_context.verify(plain_password, hashed_password)
 
+class PasswordHashPool:
+    """
+    Verificação de senha (bcrypt, CPU pura) num pool de processos próprio, fora
+    do GIL e da threadpool que atende as análises. No máximo max_concurrency
+    verificações rodam ao mesmo tempo; as demais esperam na fila, que é limitada
+    a max_queue (além disso o login responde 503 em vez de acumular).
+    """
+
+    def __init__(self, workers: int = 2, max_concurrency: int = 2, max_queue: int = 64):
+        self.workers = workers
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self._pool = None
+        self._semaforo = None
+        self._lock = threading.Lock()
+        self.em_fila = 0
+        self.em_execucao = 0
+        self.total = 0
+        self.rejeitadas = 0
+        self.segundos_total = 0.0
+
+    def _executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                # spawn: fork() de um processo com threads (threadpool, pools do
+                # SQLAlchemy) pode herdar locks travados e deixar o filho pendurado
+                self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                                 mp_context=multiprocessing.get_context("spawn"))
+            return self._pool
+
+    async def verify(self, plain_password, hashed_password) -> bool:
+        if self._semaforo is None:
+            self._semaforo = asyncio.Semaphore(self.max_concurrency)
+        if self.em_fila >= self.max_queue:
+            self.rejeitadas += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Muitos logins em andamento, tente novamente.",
+                headers={"Retry-After": "1"},
+            )
+
+        self.em_fila += 1
+        try:
+            await self._semaforo.acquire()
+        finally:
+            self.em_fila -= 1
+        self.em_execucao += 1
+        inicio = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor(), verify_password, plain_password, hashed_password)
+        finally:
+            self.segundos_total += time.perf_counter() - inicio
+            self.total += 1
+            self.em_execucao -= 1
+            self._semaforo.release()
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+    def stats(self) -> dict:
+        return {
+            "processos": self.workers,
+            "max_concorrencia": self.max_concurrency,
+            "max_fila": self.max_queue,
+            "em_fila": self.em_fila,
+            "em_execucao": self.em_execucao,
+            "verificacoes": self.total,
+            "rejeitadas": self.rejeitadas,
+            "ms_medio": round(self.segundos_total / self.total * 1000, 1) if self.total else 0.0,
+        }
+
+
+password_hash_pool = PasswordHashPool(
+    workers=settings.auth_hash_workers,
+    max_concurrency=settings.auth_hash_max_concurrency,
+    max_queue=settings.auth_hash_max_queue,
+)
+
 def get_password_hash(password):
     """Gera o hash de uma senha."""
     return pwd_context.hash(password)
@@ -0,0 +1,222 @@
+# backend/app/cache.py
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+from typing import Any, Callable, Hashable, Optional
+
+from . import schemas
+from .config import settings
+
+
+class QueryCache:
+    """
+    Cache LRU em memória com TTL para resultados de consultas.
+    Cada entrada guarda a versão dos dados em que foi gerada: se o ETL
+    carregar fatos novos a versão muda e a entrada deixa de ser servida.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl_seconds: float = 600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, data_version: int) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            value, version, expires_at = entry
+            if version != data_version or expires_at < time.monotonic():
+                # Entrada velha (TTL vencido ou carga nova no banco)
+                del self._entries[key]
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, data_version: int) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (value, data_version, time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entradas": len(self._entries),
+                "max_entradas": self.max_entries,
+                "ttl_segundos": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            }
+
+
+class PrincipalCache:
+    """
+    Cache LRU do usuário autenticado por token. A entrada vale pelo menor entre
+    o TTL configurado e a expiração do próprio JWT, e é removida na hora quando
+    o usuário é desativado (invalidate_user), então o get_current_user não
+    precisa ir ao banco a cada requisição. Desativações feitas em outro
+    processo (outro worker, scripts/set_user_active.py) chegam pela versão dos
+    usuários, conferida a cada revocation_check_seconds (check_revocations).
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 60,
+                 revocation_check_seconds: float = 5):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.revocation_check_seconds = revocation_check_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._versao_usuarios: Optional[int] = None
+        self._verificado_em = float("-inf")
+        self.hits = 0
+        self.misses = 0
+        self.revogacoes = 0
+
+    def get(self, token: str) -> Optional[schemas.User]:
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None or entry[1] < time.time():
+                self._entries.pop(token, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(token)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, token: str, user: schemas.User, token_exp: Optional[float] = None) -> None:
+        if self.max_entries <= 0:
+            return
+        expira_em = time.time() + self.ttl_seconds
+        if token_exp is not None:
+            expira_em = min(expira_em, token_exp)
+        with self._lock:
+            self._entries[token] = (user, expira_em)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate_user(self, username: str) -> None:
+        """Remove todos os tokens em cache do usuário (ex.: ao desativá-lo)."""
+        with self._lock:
+            for token in [t for t, (user, _) in self._entries.items() if user.username == username]:
+                del self._entries[token]
+
+    def check_revocations(self, load_version: Callable[[], int]) -> None:
+        """
+        No máximo a cada revocation_check_seconds, lê a versão dos usuários
+        (load_version) e esvazia o cache se ela mudou desde a última leitura.
+        """
+        agora = time.monotonic()
+        with self._lock:
+            if agora - self._verificado_em < self.revocation_check_seconds:
+                return
+            self._verificado_em = agora
+        versao = load_version()
+        with self._lock:
+            if self._versao_usuarios is not None and versao != self._versao_usuarios:
+                self._entries.clear()
+                self.revogacoes += 1
+            self._versao_usuarios = versao
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entradas": len(self._entries),
+                "max_entradas": self.max_entries,
+                "ttl_segundos": self.ttl_seconds,
+                "revogacoes": self.revogacoes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            }
+
+
+class VersionCache:
+    """
+    Último valor de uma leitura de versão (ex.: versões dos dados no banco),
+    reaproveitado por até ttl_seconds. Evita uma ida ao banco por requisição
+    só para conferir se houve carga nova; a carga passa a valer em até
+    ttl_seconds (0 = lê sempre).
+    """
+
+    def __init__(self, ttl_seconds: float = 2):
+        self.ttl_seconds = ttl_seconds
+        self._valor: Any = None
+        self._lido_em = float("-inf")
+        self._lock = threading.Lock()
+        self.leituras = 0
+
+    def get(self, load: Callable[[], Any]) -> Any:
+        with self._lock:
+            if time.monotonic() - self._lido_em < self.ttl_seconds:
+                return self._valor
+        valor = load()
+        with self._lock:
+            self._valor, self._lido_em = valor, time.monotonic()
+            self.leituras += 1
+        return valor
+
+    def clear(self) -> None:
+        with self._lock:
+            self._valor, self._lido_em = None, float("-inf")
+
+
+# Compartilhado entre main.py (autenticação) e crud.py (invalidação)
+principal_cache = PrincipalCache(
+    max_entries=settings.auth_cache_max_entries,
+    ttl_seconds=settings.auth_cache_ttl_seconds,
+    revocation_check_seconds=settings.auth_cache_revocation_check_seconds,
+)
+
+
+def make_query_key(query_request: schemas.QueryRequest) -> str:
+    """
+    Gera a forma canônica de um QueryRequest: dimensões, métricas e filtros
+    ordenados, para que pedidos equivalentes caiam na mesma entrada do cache.
+    """
+    payload = {
+        "data_inicial": query_request.data_inicial.isoformat(),
+        "data_final": query_request.data_final.isoformat(),
+        "dimensoes": sorted(query_request.dimensoes),
+        "metricas": sorted([m.nome, m.agregacao.upper()] for m in query_request.metricas),
+        "filtros": query_request.filtros or {},
+        "estoque_modo": query_request.estoque_modo,
+        "motor": query_request.motor,
+        # Caminho da união vendas + estoque: o X-Query-Merge da resposta sai do resultado em cache
+        "merge": settings.query_merge_mode,
+        # O estoque é resolvido pela data de hoje, então a chave vira à meia-noite
+        "hoje": date.today().isoformat(),
+    }
+    return json.dumps(payload, sort_keys=True, default=str)
@@ -0,0 +1,71 @@
+# backend/app/catalog.py
+import hashlib
+import json
+import threading
+from collections import Counter
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from . import models
+from .snapshots import snapshot_catalog
+
+
+class DimensionCatalog:
+    """
+    Valores possíveis de cada dimensão da análise dinâmica (as chaves aceitas
+    em 'dimensoes' e 'filtros'), com a quantidade de produtos/lojas de cada um.
+    É recalculado quando a versão dos dados muda, como o SnapshotCatalog, e
+    guarda um ETag para o cliente revalidar sem baixar tudo de novo.
+    """
+
+    def __init__(self):
+        # (versão, ETag, conteúdo), trocado de uma vez só: quem lê nunca pega o
+        # ETag de uma versão com o conteúdo de outra
+        self._atual: Tuple[Optional[int], Optional[str], Dict[str, Any]] = (None, None, {})
+        self._lock = threading.Lock()
+
+    def _membros(self, db: Session, coluna) -> list:
+        linhas = (
+            db.query(coluna, func.count())
+            .filter(coluna.isnot(None))
+            .group_by(coluna)
+            .order_by(coluna)
+            .all()
+        )
+        return [{"valor": valor, "quantidade": quantidade} for valor, quantidade in linhas]
+
+    def _meses(self, db: Session) -> list:
+        # Meses com venda (kpi_resumo_diario) ou snapshot de estoque; quantidade = dias com dados
+        dias = {data for (data,) in db.query(models.KpiResumoDiario.data)}
+        dias.update(snapshot_catalog.dates(db))
+        meses = Counter(f"{dia:%Y-%m}" for dia in dias)
+        return [{"valor": mes, "quantidade": meses[mes]} for mes in sorted(meses)]
+
+    def _refresh(self, db: Session) -> Tuple[Optional[int], Optional[str], Dict[str, Any]]:
+        from .crud import _DIM_LOJA, _DIM_PRODUTO, get_data_version
+
+        versao = get_data_version(db)
+        atual = self._atual
+        if versao == atual[0]:
+            return atual
+        with self._lock:
+            if versao == self._atual[0]:
+                return self._atual
+            dimensoes = {nome: self._membros(db, coluna) for nome, coluna in {**_DIM_PRODUTO, **_DIM_LOJA}.items()}
+            dimensoes["mes"] = self._meses(db)
+            conteudo = {"versao": versao, "dimensoes": dimensoes}
+
+            corpo = json.dumps(conteudo, sort_keys=True, default=str).encode()
+            etag = f'"dims-{versao}-{hashlib.sha1(corpo).hexdigest()[:16]}"'
+            self._atual = (versao, etag, conteudo)
+            return self._atual
+
+    def get(self, db: Session) -> Tuple[str, Dict[str, Any]]:
+        """(ETag, {"versao": ..., "dimensoes": {nome: [{"valor", "quantidade"}]}})"""
+        _, etag, conteudo = self._refresh(db)
+        return etag, conteudo
+
+
+dimension_catalog = DimensionCatalog()
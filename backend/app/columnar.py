@@ -0,0 +1,312 @@
+# backend/app/columnar.py
+# Motor colunar em processo para as vendas do /api/query.
+#
+# O ETL grava um retrato de fato_vendas (já ligado a dim_produto/dim_loja) em
+# arquivos .npy, com as dimensões codificadas por dicionário, numa pasta por
+# versão dos fatos (VersaoDados.versao_fatos: só a carga do Data Mart muda essa
+# versão, então cargas do histórico de produtos não invalidam o retrato):
+#   <diretorio>/v<versao>/data.npy, produto.npy, loja.npy, quantidade.npy, venda_centavos.npy,
+#   quantidade_nula.npy e venda_nula.npy (NULL no banco: a soma de um grupo só de NULLs é NULL, como no SQL)
+#   <diretorio>/v<versao>/dimensoes.npz (códigos por produto/loja) e manifesto.json
+#   <diretorio>/ATUAL (nome da pasta em uso)
+# A API abre os arquivos com mmap: as páginas ficam no cache do sistema
+# operacional e são compartilhadas entre os workers do uvicorn.
+import json
+import os
+import shutil
+import threading
+from datetime import date
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from . import models, schemas
+from .config import settings
+
+# Dimensões de produto/loja -> coluna da dimensão (mesmos nomes do crud._dim_map)
+DIMENSOES_PRODUTO = {
+    "nome_produto": "product_name",
+    "codigo_produto": "product_code",
+    "nome_marca": "marca",
+    "nome_departamento": "departamento",
+    "nome_classificacao": "classificacao",
+    "nome_grupo": "grupo",
+    "nome_modelo": "modelo",
+    "nome_fornecedor": "fornecedor",
+}
+DIMENSOES_LOJA = {"nome_loja": "store_name"}
+METRICAS_VENDAS = ("venda_liquida", "quantidade_vendida")
+# Colunas do retrato e seus tipos
+COLUNAS = {
+    "data": np.int32, "produto": np.int32, "loja": np.int32,
+    "quantidade": np.int64, "venda_centavos": np.int64, "quantidade_nula": np.bool_, "venda_nula": np.bool_,
+}
+# Muda quando as colunas mudam: retrato de formato antigo não é usado (a API cai no SQL até o próximo build)
+FORMATO = 2
+
+_EPOCA = date(1970, 1, 1)
+
+
+def diretorio() -> str:
+    return settings.columnar_dir or os.path.join(os.path.dirname(__file__), "..", "data", "colunar")
+
+
+def _codificar(valores: List[Any]):
+    """Codificação por dicionário: (códigos int32, lista de valores distintos)."""
+    dicionario: Dict[Any, int] = {}
+    codigos = np.fromiter((dicionario.setdefault(v, len(dicionario)) for v in valores),
+                          dtype=np.int32, count=len(valores))
+    return codigos, list(dicionario)
+
+
+# --- Construção do retrato (chamada pelo ETL / scripts/build_columnar.py) ---
+
+def build_snapshot(db: Session, destino: Optional[str] = None, lote: int = 500000) -> Dict[str, Any]:
+    """
+    Lê fato_vendas ligada às dimensões (ordenada por data) e grava o retrato da
+    versão atual dos fatos; no fim troca o ponteiro ATUAL. Devolve o manifesto.
+    """
+    from .crud import get_fact_version
+
+    destino = destino or diretorio()
+    if db.bind.dialect.name == "postgresql":
+        # Leitura longa: o statement_timeout das sessões da API não vale aqui
+        db.execute(text("SET LOCAL statement_timeout = 0"))
+    versao = get_fact_version(db)
+
+    p, l = models.DimProduto, models.DimLoja
+    produtos = db.query(p.id, *[getattr(p, c) for c in DIMENSOES_PRODUTO.values()]).order_by(p.id).all()
+    lojas = db.query(l.id, l.store_name).order_by(l.id).all()
+    produto_ids = np.array([r[0] for r in produtos], dtype=np.int64)
+    loja_ids = np.array([r[0] for r in lojas], dtype=np.int64)
+
+    dims: Dict[str, np.ndarray] = {}
+    valores: Dict[str, list] = {}
+    for i, nome in enumerate(DIMENSOES_PRODUTO, start=1):
+        dims[nome], valores[nome] = _codificar([r[i] for r in produtos])
+    dims["nome_loja"], valores["nome_loja"] = _codificar([r[1] for r in lojas])
+
+    f = models.FatoVendas
+    resultado = db.execute(
+        db.query(f.data_venda, f.produto_id, f.loja_id, f.quantidade_vendida, f.venda_liquida)
+        .join(p, f.produto_id == p.id)
+        .join(l, f.loja_id == l.id)
+        .order_by(f.data_venda)
+        .statement.execution_options(yield_per=lote)
+    )
+    partes = {coluna: [] for coluna in COLUNAS}
+    for linhas in resultado.partitions():
+        partes["data"].append(np.array([(r[0] - _EPOCA).days for r in linhas], dtype=np.int32))
+        partes["produto"].append(np.searchsorted(produto_ids, [r[1] for r in linhas]).astype(np.int32))
+        partes["loja"].append(np.searchsorted(loja_ids, [r[2] for r in linhas]).astype(np.int32))
+        partes["quantidade"].append(np.array([r[3] or 0 for r in linhas], dtype=np.int64))
+        partes["quantidade_nula"].append(np.array([r[3] is None for r in linhas], dtype=np.bool_))
+        # Numeric(12, 2) em centavos inteiros: as somas batem exatamente com o SQL
+        partes["venda_centavos"].append(np.array([int(round((r[4] or 0) * 100)) for r in linhas], dtype=np.int64))
+        partes["venda_nula"].append(np.array([r[4] is None for r in linhas], dtype=np.bool_))
+
+    nome_pasta = f"v{versao}"
+    temporaria = os.path.join(destino, f"{nome_pasta}.tmp")
+    shutil.rmtree(temporaria, ignore_errors=True)
+    os.makedirs(temporaria)
+    linhas_total = 0
+    for coluna, blocos in partes.items():
+        array = np.concatenate(blocos) if blocos else np.empty(0, dtype=COLUNAS[coluna])
+        np.save(os.path.join(temporaria, f"{coluna}.npy"), array)
+        linhas_total = len(array)
+    np.savez(os.path.join(temporaria, "dimensoes.npz"), **dims)
+
+    manifesto = {"versao": versao, "formato": FORMATO, "linhas": linhas_total, "valores": valores}
+    with open(os.path.join(temporaria, "manifesto.json"), "w", encoding="utf-8") as arquivo:
+        json.dump(manifesto, arquivo, ensure_ascii=False, default=str)
+
+    final = os.path.join(destino, nome_pasta)
+    shutil.rmtree(final, ignore_errors=True)
+    os.replace(temporaria, final)
+    ponteiro = os.path.join(destino, "ATUAL.tmp")
+    with open(ponteiro, "w") as arquivo:
+        arquivo.write(nome_pasta)
+    os.replace(ponteiro, os.path.join(destino, "ATUAL"))
+
+    # Mantém só a versão atual e a anterior (algum worker ainda pode estar com ela aberta)
+    antigas = sorted(
+        (d for d in os.listdir(destino) if d.startswith("v") and d[1:].isdigit() and d != nome_pasta),
+        key=lambda d: int(d[1:]),
+    )
+    for pasta in antigas[:-1]:
+        shutil.rmtree(os.path.join(destino, pasta), ignore_errors=True)
+    return {"versao": versao, "linhas": linhas_total, "pasta": final}
+
+
+# --- Leitura e consulta ---
+
+class ColumnarStore:
+    """Retrato aberto com mmap; reaberto quando o ponteiro ATUAL muda."""
+
+    def __init__(self):
+        # Trocado de uma vez só: uma consulta em andamento continua com o retrato que pegou
+        self._retrato: Optional[Dict[str, Any]] = None
+        self._lock = threading.Lock()
+
+    def _refresh(self) -> Optional[Dict[str, Any]]:
+        """O retrato apontado por ATUAL (aberto de novo só se o ponteiro mudou), ou None."""
+        base = diretorio()
+        try:
+            with open(os.path.join(base, "ATUAL")) as arquivo:
+                caminho = os.path.join(base, arquivo.read().strip())
+        except FileNotFoundError:
+            return None
+        retrato = self._retrato
+        if retrato is not None and retrato["pasta"] == caminho:
+            return retrato
+        with self._lock:
+            retrato = self._retrato
+            if retrato is not None and retrato["pasta"] == caminho:
+                return retrato
+            with open(os.path.join(caminho, "manifesto.json"), encoding="utf-8") as arquivo:
+                manifesto = json.load(arquivo)
+            if manifesto.get("formato") != FORMATO:
+                return None
+            colunas = {nome: np.load(os.path.join(caminho, f"{nome}.npy"), mmap_mode="r") for nome in COLUNAS}
+            with np.load(os.path.join(caminho, "dimensoes.npz")) as arquivo:
+                dims = {nome: arquivo[nome] for nome in arquivo.files}
+            self._retrato = retrato = {
+                "pasta": caminho, "versao": manifesto["versao"], "colunas": colunas, "dims": dims,
+                "valores": manifesto["valores"],
+            }
+        return retrato
+
+    def retrato(self, versao_fatos: int) -> Optional[Dict[str, Any]]:
+        """O retrato, se existir e for da versão atual dos fatos; senão None."""
+        retrato = self._refresh()
+        return retrato if retrato is not None and retrato["versao"] == versao_fatos else None
+
+    @staticmethod
+    def _codigos_linha(retrato, dimensao: str, linhas: slice, mascara=None) -> np.ndarray:
+        colunas = retrato["colunas"]
+        chave = colunas["loja"] if dimensao in DIMENSOES_LOJA else colunas["produto"]
+        codigos = retrato["dims"][dimensao][chave[linhas]]
+        return codigos if mascara is None else codigos[mascara]
+
+    def query(self, query_request: schemas.QueryRequest, retrato: Dict[str, Any]) -> Tuple[List[str], List[tuple]]:
+        """
+        Agrega as vendas do pedido (mesma semântica do SQL sobre fato_vendas)
+        no 'retrato' que o chamador conferiu (ColumnarStore.retrato).
+        Devolve (colunas, linhas em tuplas), como crud.run_dynamic_query_rows.
+        """
+        conhecidas = {**DIMENSOES_PRODUTO, **DIMENSOES_LOJA, "mes": None}
+        dimensoes = list(dict.fromkeys(d for d in query_request.dimensoes if d in conhecidas))
+        metricas = [m.nome for m in query_request.metricas]
+        nomes = dimensoes + [m for m in METRICAS_VENDAS if m in metricas]
+        colunas, valores_dims = retrato["colunas"], retrato["valores"]
+
+        # Fatos ordenados por data: o período vira uma fatia
+        data = colunas["data"]
+        ini = np.searchsorted(data, (query_request.data_inicial - _EPOCA).days, side="left")
+        fim = np.searchsorted(data, (query_request.data_final - _EPOCA).days, side="right")
+        linhas = slice(ini, fim)
+
+        mascara = None
+        for filtro, valor in (query_request.filtros or {}).items():
+            if filtro not in DIMENSOES_PRODUTO and filtro not in DIMENSOES_LOJA:
+                continue
+            if valor not in valores_dims[filtro]:
+                return nomes, []
+            condicao = self._codigos_linha(retrato, filtro, linhas) == valores_dims[filtro].index(valor)
+            mascara = condicao if mascara is None else mascara & condicao
+
+        # Código de cada dimensão do group by, linha a linha
+        colunas_grupo = []
+        for dimensao in dimensoes:
+            if dimensao == "mes":
+                meses = data[linhas].astype("datetime64[D]").astype("datetime64[M]").astype(np.int64)
+                colunas_grupo.append(meses if mascara is None else meses[mascara])
+            else:
+                colunas_grupo.append(self._codigos_linha(retrato, dimensao, linhas, mascara).astype(np.int64))
+
+        # Junta os códigos numa chave inteira (base mista) quando cabe em int64;
+        # senão agrupa pelas linhas da matriz de códigos
+        bases = [int(c.min()) if len(c) else 0 for c in colunas_grupo]
+        cardinalidades = [int(c.max()) - b + 1 if len(c) else 1 for c, b in zip(colunas_grupo, bases)]
+        if np.prod([float(c) for c in cardinalidades]) < 2 ** 62:
+            chave = np.zeros(len(colunas_grupo[0]), dtype=np.int64)
+            for codigos, base, cardinalidade in zip(colunas_grupo, bases, cardinalidades):
+                chave = chave * cardinalidade + (codigos - base)
+            grupos, inverso = np.unique(chave, return_inverse=True)
+            codigos_grupos = []
+            for base, cardinalidade in reversed(list(zip(bases, cardinalidades))):
+                codigos_grupos.insert(0, grupos % cardinalidade + base)
+                grupos = grupos // cardinalidade
+        else:
+            matriz, inverso = np.unique(np.stack(colunas_grupo, axis=1), axis=0, return_inverse=True)
+            codigos_grupos = [matriz[:, i] for i in range(len(dimensoes))]
+        inverso = inverso.reshape(-1)
+        total_grupos = len(codigos_grupos[0])
+
+        somas, com_valor = {}, {}
+        for metrica, coluna, nula in (("venda_liquida", "venda_centavos", "venda_nula"),
+                                      ("quantidade_vendida", "quantidade", "quantidade_nula")):
+            if metrica not in metricas:
+                continue
+            valores, nulos = colunas[coluna][linhas], colunas[nula][linhas]
+            if mascara is not None:
+                valores, nulos = valores[mascara], nulos[mascara]
+            somas[metrica] = np.bincount(inverso, weights=valores, minlength=total_grupos)
+            # Grupo sem nenhum valor não nulo: SUM dá NULL no SQL
+            com_valor[metrica] = np.bincount(inverso[~nulos], minlength=total_grupos) > 0
+
+        # Volta dos códigos para os valores das dimensões, coluna a coluna
+        valores_colunas = []
+        for dimensao, codigos in zip(dimensoes, codigos_grupos):
+            if dimensao == "mes":
+                valores_colunas.append([str(np.datetime64(int(c), "M")) for c in codigos])
+            else:
+                valores = valores_dims[dimensao]
+                valores_colunas.append([valores[c] for c in codigos])
+        # Centavos / 100 dá o mesmo float que o SUM(numeric) convertido no SQL
+        if "venda_liquida" in somas:
+            valores_colunas.append(_com_nulos((np.round(somas["venda_liquida"]) / 100).tolist(),
+                                              com_valor["venda_liquida"]))
+        if "quantidade_vendida" in somas:
+            valores_colunas.append(_com_nulos(somas["quantidade_vendida"].astype(np.int64).tolist(),
+                                              com_valor["quantidade_vendida"]))
+        return nomes, list(zip(*valores_colunas))
+
+
+def _com_nulos(valores: list, com_valor: np.ndarray) -> list:
+    if com_valor.all():
+        return valores
+    return [v if ok else None for v, ok in zip(valores, com_valor.tolist())]
+
+
+columnar_store = ColumnarStore()
+
+
+def suporta(query_request: schemas.QueryRequest) -> bool:
+    """O pedido cabe no motor colunar? (só métricas de vendas e alguma dimensão conhecida)"""
+    metricas = {m.nome for m in query_request.metricas}
+    if not metricas & set(METRICAS_VENDAS) or metricas - set(METRICAS_VENDAS):
+        return False
+    return any(d in DIMENSOES_PRODUTO or d in DIMENSOES_LOJA or d == "mes" for d in query_request.dimensoes)
+
+
+def run_query_version(versao_fatos: int, query_request: schemas.QueryRequest) -> Optional[Tuple[List[str], List[tuple]]]:
+    """Responde pelo retrato da versão 'versao_fatos', ou None se o retrato não for dessa versão."""
+    retrato = columnar_store.retrato(versao_fatos)
+    if retrato is None:
+        return None
+    return columnar_store.query(query_request, retrato)
+
+
+def run_query(db: Session, query_request: schemas.QueryRequest) -> Optional[Tuple[List[str], List[tuple]]]:
+    """
+    Responde pelo motor colunar, ou devolve None quando ele não atende
+    (métrica de estoque, nenhuma dimensão válida ou retrato desatualizado).
+    """
+    from .crud import get_data_state
+
+    if not suporta(query_request):
+        return None
+    return run_query_version(get_data_state(db).versao_fatos, query_request)
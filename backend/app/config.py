@@ -1,12 +1,103 @@
 # backend/app/config.py
 from pydantic_settings import BaseSettings
-from typing import List
+from typing import List, Optional
 
 class Settings(BaseSettings):
     secret_key: str
     database_url: str
     cors_origins: List[str] = []
 
+    # Camada async (asyncpg). Sem async_database_url, deriva da database_url
+    async_db_enabled: bool = False
+    async_database_url: Optional[str] = None
+
+    # Pool de conexões interativo (login, produtos, KPIs)
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_timeout: int = 30
+    db_pool_recycle: int = 1800
+    db_pool_pre_ping: bool = True
+    db_statement_timeout_ms: int = 5000
+
+    # Pool separado para a análise dinâmica (/api/query, streaming, exportação)
+    db_analytics_pool_size: int = 5
+    db_analytics_max_overflow: int = 5
+    db_analytics_statement_timeout_ms: int = 120000
+
+    # Aplica as migrações pendentes quando a API sobe. Desligado por padrão: no
+    # deploy, rode "python scripts/migrate.py" antes de subir a nova versão (uma
+    # migração longa não pode atrasar o boot nem cair no timeout do health check).
+    # Ligue (AUTO_MIGRATE=true) só no desenvolvimento local.
+    auto_migrate: bool = False
+
+    # Verificação de senha (bcrypt) no pool de processos do /token
+    auth_hash_workers: int = 2
+    auth_hash_max_concurrency: int = 2
+    auth_hash_max_queue: int = 64
+
+    # Rate limit do /token: tentativas por janela, por IP e por username
+    login_rate_limit_ip: int = 20
+    login_rate_limit_username: int = 5
+    login_rate_limit_window_seconds: int = 300
+    # Proxies (IPs separados por vírgula, ou "*") cujo X-Forwarded-For é aceito
+    # como IP do cliente no rate limit; o mesmo papel do --forwarded-allow-ips do uvicorn
+    forwarded_allow_ips: str = "127.0.0.1"
+
+    # Maior página aceita no histórico do produto (?limite=)
+    product_history_max_limit: int = 5000
+
+    # Máximo de códigos por chamada do /api/products/batch
+    products_batch_max_codes: int = 200
+
+    # Cache do usuário autenticado por token (get_current_user)
+    auth_cache_max_entries: int = 1024
+    auth_cache_ttl_seconds: int = 60
+    # De quanto em quanto tempo cada worker confere a versão dos usuários no
+    # banco (desativação feita em outro processo esvazia o cache)
+    auth_cache_revocation_check_seconds: float = 5
+
+    # Cache de resultados do /api/query
+    query_cache_max_entries: int = 256
+    query_cache_ttl_seconds: int = 600
+
+    # Por quanto tempo (s) cada worker reaproveita as versões dos dados lidas do
+    # banco no caminho do /api/query; uma carga nova aparece em até esse tempo
+    data_version_check_seconds: float = 2
+
+    # Linhas por lote no modo streaming do /api/query
+    query_stream_chunk_size: int = 2000
+
+    # Linhas por record batch / row group na exportação Arrow/Parquet
+    query_export_batch_size: int = 50000
+
+    # Onde unir vendas + estoque: "sql" (FULL OUTER JOIN no banco) ou "python"
+    query_merge_mode: str = "sql"
+
+    # Motor padrão do /api/query: "sql" ou "colunar" (retrato .npy de fato_vendas).
+    # columnar_build_on_load faz o ETL gravar o retrato depois de cada carga
+    query_engine: str = "sql"
+    columnar_dir: Optional[str] = None
+    columnar_build_on_load: bool = False
+
+    # No merge em Python, roda vendas e estoque em paralelo; a consulta de vendas
+    # usa um pool próprio com query_parallel_workers conexões
+    query_parallel_subqueries: bool = True
+    query_parallel_workers: int = 4
+
+    # Análises acima deste tempo (ms) vão para o log de consultas lentas (0 desliga)
+    query_slow_log_ms: int = 2000
+
+    # Expõe /metrics (formato Prometheus, sem autenticação, para o coletor)
+    metrics_enabled: bool = True
+
+    # Análises em segundo plano (/api/jobs): threads, fila máxima, statement_timeout
+    # próprio (ms, 0 = sem limite), pasta dos resultados e por quanto tempo ficam
+    jobs_workers: int = 2
+    jobs_max_pending: int = 20
+    jobs_statement_timeout_ms: int = 1800000
+    jobs_dir: Optional[str] = None
+    jobs_retention_seconds: int = 3600
+
     class Config:
         env_file = ".env"
 
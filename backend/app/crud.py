@@ -1,12 +1,23 @@
 # app/crud.py
 import sqlalchemy as sa
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, aliased, selectinload
+from sqlalchemy.ext.asyncio import AsyncSession
+from fastapi import HTTPException
 from sqlalchemy import func, text, select, and_
-from datetime import date
+from datetime import date, timedelta
+from bisect import bisect_left, bisect_right
 from datetime import datetime
-from typing import List, Dict, Any
+from typing import List, Dict, Any, NamedTuple, Optional, Tuple
+from sqlalchemy.exc import DBAPIError
 from . import models, schemas
-from decimal import Decimal
+from .config import settings
+from .snapshots import snapshot_catalog
+from .cache import VersionCache, principal_cache
+from . import columnar
+from . import profiling
+from concurrent.futures import ThreadPoolExecutor
+from fastapi.concurrency import run_in_threadpool
+import time
 
 def get_product_by_code(db: Session, product_code: str):
     """
@@ -19,7 +30,224 @@ def get_product_by_code(db: Session, product_code: str):
 
     # Gracas ao "relationship" que definimos em models.py,              ---lembrar--
     # ao buscar um produto, o SQLAlchemy já traz junto o seu historico
-    return db.query(models.Product).filter(models.Product.product_code == product_code).first()
+    # (selectinload: carrega o histórico numa query só, antes da sessão fechar)
+    return (
+        db.query(models.Product)
+        .options(selectinload(models.Product.history))
+        .filter(models.Product.product_code == product_code)
+        .first()
+    )
+
+
+async def get_product_by_code_async(db: AsyncSession, product_code: str):
+    """Versão async de get_product_by_code (o histórico vem junto, sem lazy load)."""
+    resultado = await db.execute(
+        select(models.Product)
+        .options(selectinload(models.Product.history))
+        .where(models.Product.product_code == product_code)
+    )
+    return resultado.scalars().first()
+
+
+# Agrupamentos aceitos no histórico do produto
+HISTORY_AGRUPAMENTOS = ("semana", "mes")
+
+
+def _inicio_periodo(dia: date, agrupar: str) -> date:
+    if agrupar == "mes":
+        return dia.replace(day=1)
+    return dia - timedelta(days=dia.weekday())  # semana começa na segunda
+
+
+def _proximo_periodo(inicio: date, agrupar: str) -> date:
+    if agrupar == "mes":
+        return (inicio.replace(day=1) + timedelta(days=32)).replace(day=1)
+    return _inicio_periodo(inicio, agrupar) + timedelta(days=7)
+
+
+def _resample_history(registros, agrupar: str) -> List[Dict[str, Any]]:
+    """
+    Agrupa o histórico diário (ordenado por data) por semana ou mês: vendas e
+    entradas somadas, estoque inicial do primeiro dia e final do último.
+    """
+    periodos: Dict[date, Dict[str, Any]] = {}
+    for h in registros:
+        inicio = _inicio_periodo(h.date, agrupar)
+        periodo = periodos.get(inicio)
+        if periodo is None:
+            periodos[inicio] = {
+                "id": None,
+                "date": inicio,
+                "opening_stock": h.opening_stock,
+                "inbound_quantity": h.inbound_quantity or 0,
+                "sold_quantity": h.sold_quantity or 0,
+                "closing_stock": h.closing_stock,
+            }
+        else:
+            periodo["inbound_quantity"] += h.inbound_quantity or 0
+            periodo["sold_quantity"] += h.sold_quantity or 0
+            periodo["closing_stock"] = h.closing_stock
+    return list(periodos.values())
+
+
+def _inicio_periodo_sql(coluna, agrupar: str, dialeto: str):
+    """Início da semana (segunda) ou do mês de 'coluna', em SQL (PostgreSQL ou SQLite local)."""
+    if dialeto == "postgresql":
+        # Unidade literal (sem parâmetro): o GROUP BY precisa repetir a mesma expressão do SELECT
+        unidade = sa.literal_column("'month'" if agrupar == "mes" else "'week'")
+        return sa.cast(func.date_trunc(unidade, coluna), sa.Date)
+    if agrupar == "mes":
+        return sa.type_coerce(func.date(coluna, sa.literal_column("'start of month'")), sa.Date)
+    return sa.type_coerce(
+        func.date(coluna, sa.literal_column("'-6 days'"), sa.literal_column("'weekday 1'")), sa.Date
+    )
+
+
+def _grouped_history_query(dialeto: str, filtros, product_id: int, agrupar: str, limite: Optional[int]):
+    """
+    Histórico agrupado por semana ou mês no banco: vendas e entradas somadas,
+    estoque inicial do primeiro dia e final do último (buscados pelo índice
+    (product_id, date)). Só os 'limite' + 1 períodos da página saem do banco.
+    """
+    h = models.ProductHistory
+    inicio = _inicio_periodo_sql(h.date, agrupar, dialeto).label("inicio")
+    periodos = (
+        select(
+            inicio,
+            func.min(h.date).label("primeiro_dia"),
+            func.max(h.date).label("ultimo_dia"),
+            func.sum(func.coalesce(h.inbound_quantity, 0)).label("inbound_quantity"),
+            func.sum(func.coalesce(h.sold_quantity, 0)).label("sold_quantity"),
+        )
+        .where(*filtros)
+        .group_by(inicio)
+        .order_by(inicio)
+    )
+    if limite:
+        periodos = periodos.limit(limite + 1)
+    periodos = periodos.subquery()
+
+    abertura = aliased(h)
+    fechamento = aliased(h)
+    return (
+        select(
+            sa.null().label("id"),
+            periodos.c.inicio.label("date"),
+            abertura.opening_stock,
+            periodos.c.inbound_quantity,
+            periodos.c.sold_quantity,
+            fechamento.closing_stock,
+        )
+        .join(abertura, and_(abertura.product_id == product_id, abertura.date == periodos.c.primeiro_dia))
+        .join(fechamento, and_(fechamento.product_id == product_id, fechamento.date == periodos.c.ultimo_dia))
+        .order_by(periodos.c.inicio)
+    )
+
+
+def _history_page_query(dialeto: str, product_id: int, data_inicial: Optional[date], data_final: Optional[date],
+                        apos: Optional[date], limite: Optional[int], agrupar: Optional[str]):
+    """SELECT de uma página do histórico pelo índice (product_id, date): dias, ou semanas/meses com 'agrupar'."""
+    h = models.ProductHistory
+    filtros = [h.product_id == product_id]
+    if data_inicial:
+        filtros.append(h.date >= data_inicial)
+    if data_final:
+        filtros.append(h.date <= data_final)
+    if apos:
+        # Com agrupamento o cursor é o início do último período: segue do período seguinte
+        filtros.append(h.date >= _proximo_periodo(apos, agrupar) if agrupar else h.date > apos)
+
+    if agrupar:
+        return _grouped_history_query(dialeto, filtros, product_id, agrupar, limite)
+    consulta = select(h.id, h.date, h.opening_stock, h.inbound_quantity, h.sold_quantity, h.closing_stock) \
+        .where(*filtros).order_by(h.date)
+    if limite:
+        consulta = consulta.limit(limite + 1)
+    return consulta
+
+
+def _history_page(linhas, limite: Optional[int]):
+    """Itens da página (o 'limite' + 1 só diz se há próxima) e o próximo cursor."""
+    itens = [row._asdict() for row in linhas]
+    proximo_cursor = None
+    if limite and len(itens) > limite:
+        itens = itens[:limite]
+        proximo_cursor = itens[-1]["date"]
+    return itens, proximo_cursor
+
+
+def get_product_history_page(db: Session, product_code: str, data_inicial: Optional[date] = None,
+                             data_final: Optional[date] = None, apos: Optional[date] = None,
+                             limite: Optional[int] = None, agrupar: Optional[str] = None):
+    """
+    Busca o produto e uma página do seu histórico, pelo índice (product_id,
+    date), sem passar pelo relationship.
+    'apos' é o cursor (data do último item da página anterior) e, com 'agrupar',
+    os itens são semanas/meses identificados pela data de início.
+    Devolve (produto, itens, próximo cursor) ou None se o produto não existir.
+    """
+    product = db.query(models.Product).filter(models.Product.product_code == product_code).first()
+    if product is None:
+        return None
+    consulta = _history_page_query(db.get_bind().dialect.name, product.id, data_inicial, data_final,
+                                   apos, limite, agrupar)
+    return (product, *_history_page(db.execute(consulta), limite))
+
+
+async def get_product_history_page_async(db: AsyncSession, product_code: str, data_inicial: Optional[date] = None,
+                                         data_final: Optional[date] = None, apos: Optional[date] = None,
+                                         limite: Optional[int] = None, agrupar: Optional[str] = None):
+    """Versão async de get_product_history_page (as mesmas consultas, aguardadas na AsyncSession)."""
+    product = (await db.execute(
+        select(models.Product).where(models.Product.product_code == product_code)
+    )).scalars().first()
+    if product is None:
+        return None
+    consulta = _history_page_query(db.get_bind().dialect.name, product.id, data_inicial, data_final,
+                                   apos, limite, agrupar)
+    return (product, *_history_page(await db.execute(consulta), limite))
+
+
+
+def get_products_with_history(db: Session, product_codes: List[str], data_inicial: Optional[date] = None,
+                              data_final: Optional[date] = None, agrupar: Optional[str] = None):
+    """
+    Vários produtos de uma vez: um IN para os produtos e uma query para os
+    históricos de todos, separados por produto aqui no Python.
+    Devolve [(produto, itens do histórico)] na ordem dos códigos pedidos.
+    """
+    codigos = list(dict.fromkeys(product_codes))
+    produtos = db.query(models.Product).filter(models.Product.product_code.in_(codigos)).all()
+    if not produtos:
+        return []
+
+    h = models.ProductHistory
+    query = db.query(h.product_id, h.id, h.date, h.opening_stock, h.inbound_quantity, h.sold_quantity,
+                     h.closing_stock) \
+        .filter(h.product_id.in_([p.id for p in produtos]))
+    if data_inicial:
+        query = query.filter(h.date >= data_inicial)
+    if data_final:
+        query = query.filter(h.date <= data_final)
+
+    historicos: Dict[int, list] = {p.id: [] for p in produtos}
+    for row in query.order_by(h.product_id, h.date):
+        historicos[row.product_id].append(row)
+
+    por_codigo = {p.product_code: p for p in produtos}
+    resultado = []
+    for codigo in codigos:
+        produto = por_codigo.get(codigo)
+        if produto is None:
+            continue
+        linhas = historicos[produto.id]
+        if agrupar:
+            itens = _resample_history(linhas, agrupar)
+        else:
+            itens = [{k: v for k, v in row._asdict().items() if k != "product_id"} for row in linhas]
+        resultado.append((produto, itens))
+    return resultado
+
 
 #
 def get_user_by_username(db: Session, username: str):
@@ -27,26 +255,456 @@ def get_user_by_username(db: Session, username: str):
     return db.query(models.User).filter(models.User.username == username).first()
 
 
+def set_user_active(db: Session, username: str, ativo: bool):
+    """
+    Ativa/desativa um usuário e tira os tokens dele do cache de autenticação:
+    na hora neste processo e, pela versão dos usuários, nos workers da API.
+    """
+    user = get_user_by_username(db, username)
+    if user is None:
+        return None
+    user.is_active = ativo
+    atualizadas = (
+        db.query(models.VersaoDados)
+        .filter(models.VersaoDados.id == 1)
+        .update({models.VersaoDados.versao_usuarios: models.VersaoDados.versao_usuarios + 1},
+                synchronize_session=False)
+    )
+    if not atualizadas:
+        db.add(models.VersaoDados(id=1, versao=0, versao_usuarios=1))
+    db.commit()
+    principal_cache.invalidate_user(username)
+    return user
+
+
+def get_user_version(db: Session) -> int:
+    """Versão dos usuários (muda a cada ativação/desativação)."""
+    versao = db.query(models.VersaoDados.versao_usuarios).filter(models.VersaoDados.id == 1).scalar()
+    return versao or 0
+
+
+def get_data_version(db: Session) -> int:
+    """Versão atual dos dados (incrementada por toda carga do ETL; invalida os caches)."""
+    versao = db.query(models.VersaoDados.versao).filter(models.VersaoDados.id == 1).scalar()
+    return versao or 0
+
+
+def get_fact_version(db: Session) -> int:
+    """Versão dos fatos do Data Mart (só muda com a carga do esquema estrela)."""
+    versao = db.query(models.VersaoDados.versao_fatos).filter(models.VersaoDados.id == 1).scalar()
+    return versao or 0
+
+
+class EstadoDados(NamedTuple):
+    versao: int
+    versao_fatos: int
+    rollups_atualizados: frozenset
+
+
+# Estado dos dados visto pelo caminho das consultas, relido a cada data_version_check_seconds
+estado_dados_cache = VersionCache(settings.data_version_check_seconds)
+
+
+def get_data_state(db: Session) -> EstadoDados:
+    """
+    Versão dos dados, versão dos fatos e rollups em dia com ela, lidos juntos e
+    reaproveitados por settings.data_version_check_seconds: cache, plano das
+    vendas, catálogo de snapshots e motor colunar não voltam ao banco a cada
+    requisição só para conferir versões.
+    """
+    def _ler() -> EstadoDados:
+        versoes = (
+            db.query(models.VersaoDados.versao, models.VersaoDados.versao_fatos)
+            .filter(models.VersaoDados.id == 1)
+            .first()
+        )
+        versao, versao_fatos = (versoes[0] or 0, versoes[1] or 0) if versoes else (0, 0)
+        atualizados = frozenset(
+            tabela for (tabela,) in db.query(models.ControleRollups.tabela)
+            .filter(models.ControleRollups.versao_dados == versao_fatos)
+        )
+        return EstadoDados(versao, versao_fatos, atualizados)
+    return estado_dados_cache.get(_ler)
+
+
+def _kpis_gerais_query(hoje: date):
+    primeiro_dia_mes = hoje.replace(day=1)
+    # A query agora é MUITO mais leve!
+    return select(
+        func.sum(models.KpiResumoDiario.total_venda_liquida),
+        func.max(models.KpiResumoDiario.lojas_ativas)  # Pega o pico de lojas ativas no mês
+    ).where(
+        models.KpiResumoDiario.data >= primeiro_dia_mes,
+        models.KpiResumoDiario.data <= hoje
+    )
+
+
+def _kpis_gerais_result(resultado) -> Dict[str, Any]:
+    vendas_mes_atual = resultado[0] or 0
+    lojas_ativas_no_mes = resultado[1] or 0
+
+    return {
+        "total_lojas": int(lojas_ativas_no_mes),
+        "vendas_mes_atual": float(vendas_mes_atual),
+        "meta_exemplo": 11390000
+    }
+
+
+def get_geral_kpis(db: Session) -> Dict[str, Any]:
+    """KPIs do mês corrente a partir de kpi_resumo_diario."""
+    return _kpis_gerais_result(db.execute(_kpis_gerais_query(date.today())).first())
+
+
+async def get_geral_kpis_async(db: AsyncSession) -> Dict[str, Any]:
+    return _kpis_gerais_result((await db.execute(_kpis_gerais_query(date.today()))).first())
+
+
+
+
+# Dimensões que vêm das tabelas de dimensão (iguais para fatos e agregados)
+_DIM_PRODUTO = {
+    "nome_produto": models.DimProduto.product_name,
+    "codigo_produto": models.DimProduto.product_code,
+    "nome_marca": models.DimProduto.marca,
+    "nome_departamento": models.DimProduto.departamento,
+    "nome_classificacao": models.DimProduto.classificacao,
+    "nome_grupo": models.DimProduto.grupo,
+    "nome_modelo": models.DimProduto.modelo,
+    "nome_fornecedor": models.DimProduto.fornecedor,
+}
+_DIM_LOJA = {
+    "nome_loja": models.DimLoja.store_name,
+}
+
+# Rollups de vendas, do mais agregado para o mais detalhado, com as
+# dimensões (e filtros) que cada um consegue responder
+ROLLUPS_VENDAS = [
+    (models.AggVendasMesLoja, {"mes", "nome_loja"}),
+    (models.AggVendasMesLojaDepartamento, {"mes", "nome_loja", "nome_departamento"}),
+    (models.AggVendasMesLojaProduto, {"mes", *_DIM_LOJA, *_DIM_PRODUTO}),
+]
+
+
+def _dim_map(coluna_data) -> Dict[str, Any]:
+    """Mapa nome da dimensão -> expressão SQL, com 'mes' derivado da coluna de data informada."""
+    return {**_DIM_PRODUTO, **_DIM_LOJA, "mes": func.to_char(coluna_data, 'YYYY-MM')}
+
+
+def _rollup_dim_map(rollup) -> Dict[str, Any]:
+    dim_map = {**_DIM_LOJA, "mes": func.to_char(rollup.mes, 'YYYY-MM')}
+    if hasattr(rollup, "produto_id"):
+        dim_map.update(_DIM_PRODUTO)
+    if hasattr(rollup, "departamento"):
+        dim_map["nome_departamento"] = rollup.departamento
+    return dim_map
+
+
+def _periodo_em_meses_inteiros(query_request: schemas.QueryRequest) -> bool:
+    """True se o período começa no dia 1 e termina no último dia de um mês."""
+    if query_request.data_inicial.day != 1:
+        return False
+    dia_seguinte = query_request.data_final + timedelta(days=1)
+    return dia_seguinte.day == 1 and query_request.data_inicial <= query_request.data_final
+
+
+def _plan_sales_source(db: Session, query_request: schemas.QueryRequest):
+    """
+    Escolhe o rollup mais agregado capaz de responder às vendas do pedido.
+    Retorna None quando só a tabela de fatos atende (período quebrado, dimensão
+    ou filtro não coberto, ou rollup desatualizado em relação à versão dos fatos).
+    """
+    if not _periodo_em_meses_inteiros(query_request):
+        return None
+
+    conhecidas = _dim_map(models.FatoVendas.data_venda)
+    pedidas = {d for d in query_request.dimensoes if d in conhecidas}
+    pedidas |= {f for f in (query_request.filtros or {}) if f in conhecidas}
+
+    atualizados = get_data_state(db).rollups_atualizados
+    for rollup, dimensoes in ROLLUPS_VENDAS:
+        if rollup.__tablename__ in atualizados and pedidas <= dimensoes:
+            return rollup
+    return None
+
+
+def _build_sales_query(db: Session, query_request: schemas.QueryRequest, metricas_pedidas: List[str]):
+    """Monta a agregação de vendas sobre o melhor rollup disponível ou sobre FatoVendas."""
+    rollup = _plan_sales_source(db, query_request)
+    fonte = rollup if rollup is not None else models.FatoVendas
+    dim_map = _rollup_dim_map(rollup) if rollup is not None else _dim_map(models.FatoVendas.data_venda)
+
+    dimensoes_selecionadas = [dim_map[d].label(d) for d in query_request.dimensoes if d in dim_map]
+
+    metricas_selecionadas_sql = []
+    if 'venda_liquida' in metricas_pedidas:
+        metricas_selecionadas_sql.append(
+            func.sum(fonte.venda_liquida).label("venda_liquida")
+        )
+    if 'quantidade_vendida' in metricas_pedidas:
+        metricas_selecionadas_sql.append(
+            func.sum(fonte.quantidade_vendida).label("quantidade_vendida")
+        )
+
+    sales_query = (
+        db.query(
+            *dimensoes_selecionadas,
+            *metricas_selecionadas_sql  # <-- Usa a lista que contém SÓ o que foi pedido
+        )
+        .select_from(fonte)
+        .join(models.DimLoja, fonte.loja_id == models.DimLoja.id)
+    )
+    if hasattr(fonte, "produto_id"):
+        sales_query = sales_query.join(models.DimProduto, fonte.produto_id == models.DimProduto.id)
+
+    if rollup is not None:
+        # Rollups guardam o primeiro dia do mês
+        sales_query = sales_query.filter(
+            rollup.mes.between(query_request.data_inicial, query_request.data_final.replace(day=1))
+        )
+    else:
+        sales_query = sales_query.filter(
+            models.FatoVendas.data_venda.between(query_request.data_inicial, query_request.data_final)
+        )
+
+    # Aplica filtros nas vendas (OK)
+    if query_request.filtros:
+        sales_query = _apply_filters(sales_query, query_request.filtros, dim_map)
+    return sales_query.group_by(*dimensoes_selecionadas)
+
+
+# Motores aceitos em QueryRequest.motor
+MOTORES = ("sql", "colunar")
+
+
+def run_dynamic_query(db: Session, query_request: schemas.QueryRequest, estoque_sempre_atual: bool = True,
+                      detalhes: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """QUERY DINÂMICA DE VERDADE - resultado como lista de dicts (ver run_dynamic_query_rows)."""
+    colunas, linhas = run_dynamic_query_rows(db, query_request, estoque_sempre_atual, detalhes)
+    return [dict(zip(colunas, linha)) for linha in linhas]
 
 
-def run_dynamic_query(db: Session, query_request: schemas.QueryRequest, estoque_sempre_atual: bool = True) -> List[Dict[str, Any]]:
+def run_dynamic_query_rows(db: Session, query_request: schemas.QueryRequest, estoque_sempre_atual: bool = True,
+                           detalhes: Optional[Dict[str, Any]] = None) -> Tuple[List[str], List[tuple]]:
     """
-    QUERY DINÂMICA DE VERDADE - VERSÃO CORRIGIDA
+    Executa a query dinâmica e devolve (colunas, linhas em tuplas), sem montar
+    um dict por linha; métricas monetárias já vêm como float.
+    Se 'detalhes' for informado, recebe em "merge" o caminho usado para unir
+    vendas e estoque ("sql", "python" ou "python_fallback") e em "motor" quem
+    respondeu ("sql" ou "colunar").
     """
+    motor = query_request.motor or settings.query_engine
+    if motor not in MOTORES:
+        raise HTTPException(status_code=400, detail=f"motor inválido: {motor}")
+    if motor == "colunar":
+        # Só vendas e com retrato da versão atual; senão segue pelo SQL
+        with profiling.fase("colunar"):
+            resultado = columnar.run_query(db, query_request)
+        if resultado is not None:
+            if detalhes is not None:
+                detalhes["motor"] = "colunar"
+            return resultado
+    if detalhes is not None:
+        detalhes["motor"] = "sql"
+
+    with profiling.fase("plano"):
+        sales_cte, stock_cte, metricas_pedidas = _build_query_ctes(db, query_request, estoque_sempre_atual)
+
+    # --- QUERY FINAL ---
+    return _build_final_query(db, sales_cte, stock_cte, query_request, metricas_pedidas, detalhes)
+
+
+async def run_dynamic_query_rows_async(db: AsyncSession, query_request: schemas.QueryRequest,
+                                       estoque_sempre_atual: bool = True,
+                                       detalhes: Optional[Dict[str, Any]] = None) -> Tuple[List[str], List[tuple]]:
+    """
+    Versão async de run_dynamic_query_rows. As consultas são aguardadas na
+    AsyncSession e o que gasta CPU (motor colunar, merge em Python, conversão
+    das linhas) roda na threadpool, sem segurar o event loop. Só o plano
+    (montar as consultas e ler as versões, que quase sempre vêm da memória)
+    passa pelo run_sync.
+    """
+    motor = query_request.motor or settings.query_engine
+    if motor not in MOTORES:
+        raise HTTPException(status_code=400, detail=f"motor inválido: {motor}")
+    if motor == "colunar" and columnar.suporta(query_request):
+        versao_fatos = (await db.run_sync(get_data_state)).versao_fatos
+        with profiling.fase("colunar"):
+            resultado = await run_in_threadpool(columnar.run_query_version, versao_fatos, query_request)
+        if resultado is not None:
+            if detalhes is not None:
+                detalhes["motor"] = "colunar"
+            return resultado
+    if detalhes is not None:
+        detalhes["motor"] = "sql"
+
+    with profiling.fase("plano"):
+        sales_cte, stock_cte, metricas_pedidas = await db.run_sync(
+            lambda sync_db: _build_query_ctes(sync_db, query_request, estoque_sempre_atual)
+        )
+
+    if sales_cte is None or stock_cte is None:
+        cte, nome_fase = (sales_cte, "sql_vendas") if sales_cte is not None else (stock_cte, "sql_estoque")
+        resultado = await _executar_async(db, nome_fase, _float_select(cte))
+        return await run_in_threadpool(_as_tuples, resultado)
+
+    caminho = "python"
+    if settings.query_merge_mode == "sql":
+        try:
+            resultado = await _executar_async(db, "sql_uniao", _merged_select(sales_cte, stock_cte, metricas_pedidas))
+            if detalhes is not None:
+                detalhes["merge"] = "sql"
+            return await run_in_threadpool(_as_tuples, resultado)
+        except DBAPIError:
+            # Banco sem suporte ao FULL OUTER JOIN
+            await db.rollback()
+            caminho = "python_fallback"
+    if detalhes is not None:
+        detalhes["merge"] = caminho
+    # Mesma sessão async: as duas consultas vão em sequência
+    vendas, _ = await _executar_async(db, "sql_vendas", _float_select(sales_cte))
+    estoque, _ = await _executar_async(db, "sql_estoque", _float_select(stock_cte))
+    return await run_in_threadpool(_merge_rows, vendas, estoque, sales_cte, stock_cte, query_request, metricas_pedidas)
+
+
+def stream_dynamic_query(db: Session, query_request: schemas.QueryRequest, chunk_size: int = 2000,
+                         estoque_sempre_atual: bool = True):
+    """
+    Versão em streaming da query dinâmica: usa cursor no servidor (yield_per)
+    e devolve (colunas, iterador de lotes de tuplas), sem materializar o resultado.
+    A query é executada aqui mesmo, então erros aparecem antes do primeiro lote.
+    """
+    with profiling.fase("plano"):
+        sales_cte, stock_cte, metricas_pedidas = _build_query_ctes(db, query_request, estoque_sempre_atual)
+
+    if sales_cte is not None and stock_cte is not None and settings.query_merge_mode == "sql":
+        final_query = _merged_select(sales_cte, stock_cte, metricas_pedidas)
+        try:
+            result = db.execute(final_query.execution_options(yield_per=chunk_size))
+            return list(result.keys()), result.partitions()
+        except DBAPIError:
+            # Mesmo fallback do _build_final_query: banco sem FULL OUTER JOIN
+            db.rollback()
+
+    if sales_cte is not None and stock_cte is not None:
+        # Modo "python" (ou fallback): a união é feita em memória, então o resultado é materializado
+        colunas, linhas = _merge_in_python(db, sales_cte, stock_cte, query_request, metricas_pedidas)
+        return colunas, (linhas[i:i + chunk_size] for i in range(0, len(linhas), chunk_size))
+
+    cte = sales_cte if sales_cte is not None else stock_cte
+    result = db.execute(select(cte).execution_options(yield_per=chunk_size))
+    return list(result.keys()), result.partitions()
+
+
+# Modos de cálculo do estoque (QueryRequest.estoque_modo)
+ESTOQUE_MODOS = ("atual", "data_final", "fim_do_mes", "media_mes")
+
+
+def _snapshot_dates(db: Session, data_inicial: date, data_final: date) -> List[date]:
+    """Datas de snapshot no período, pelo catálogo em memória (ou DISTINCT no fato, se vazio)."""
+    datas = snapshot_catalog.dates(db)
+    if datas:
+        return datas[bisect_left(datas, data_inicial):bisect_right(datas, data_final)]
+    return [
+        d for (d,) in db.query(models.FatoEstoque.data_snapshot)
+        .filter(models.FatoEstoque.data_snapshot.between(data_inicial, data_final))
+        .distinct()
+        .order_by(models.FatoEstoque.data_snapshot)
+    ]
+
+
+def _build_stock_query(db: Session, query_request: schemas.QueryRequest, metricas_pedidas: List[str],
+                       estoque_sempre_atual: bool = True):
+    """
+    Monta a agregação de estoque conforme o modo pedido:
+      - atual: último snapshot até hoje (ou até data_final, se estoque_sempre_atual=False)
+      - data_final: último snapshot até data_final
+      - fim_do_mes: último snapshot de cada mês do período (com 'mes', vira série mensal)
+      - media_mes: média dos snapshots de cada mês (ou do período, sem 'mes')
+    Sem modo informado, usa atual (o comportamento de antes do estoque_modo),
+    mesmo com 'mes' nas dimensões: a série mensal é pedida com fim_do_mes.
+    """
+    modo = query_request.estoque_modo or "atual"
+    if modo not in ESTOQUE_MODOS:
+        raise HTTPException(status_code=400, detail=f"estoque_modo inválido: {modo}")
+    por_mes = "mes" in query_request.dimensoes
+
+    dim_map = _dim_map(models.FatoEstoque.data_snapshot)
+    dimensoes_selecionadas = [dim_map[d].label(d) for d in query_request.dimensoes if d in dim_map]
+
+    peso = None
+    if modo in ("atual", "data_final") or (modo == "fim_do_mes" and not por_mes):
+        # PASSO 1: Achar a DATA MÁXIMA GERAL (independente das dimensões)
+        data_limite = datetime.now().date() if modo == "atual" and estoque_sempre_atual else query_request.data_final
+
+        # Bisect no catálogo em memória; o MAX() só roda se o catálogo estiver vazio
+        data_maxima_geral = snapshot_catalog.latest_on_or_before(db, data_limite)
+        if data_maxima_geral is None:
+            data_maxima_geral = db.query(
+                func.max(models.FatoEstoque.data_snapshot)
+            ).filter(
+                models.FatoEstoque.data_snapshot <= data_limite
+            ).scalar()
+        filtro_datas = models.FatoEstoque.data_snapshot == data_maxima_geral  # ⬅️ SÓ ESSA DATA!
+    else:
+        datas = _snapshot_dates(db, query_request.data_inicial, query_request.data_final)
+        if modo == "fim_do_mes":
+            # Último snapshot de cada mês: a lista está ordenada, o último de cada mês sobrescreve
+            datas = list({d.strftime('%Y-%m'): d for d in datas}.values())
+        else:
+            # media_mes: cada linha pesa 1 / (nº de snapshots do mês, ou do período sem 'mes')
+            if por_mes:
+                contagem = {}
+                for d in datas:
+                    contagem[d.strftime('%Y-%m')] = contagem.get(d.strftime('%Y-%m'), 0) + 1
+                peso = sa.case(
+                    {mes: 1.0 / n for mes, n in contagem.items()},
+                    value=dim_map["mes"],
+                    else_=0.0,
+                ) if contagem else sa.literal(0.0)
+            else:
+                peso = sa.literal(1.0 / len(datas)) if datas else sa.literal(0.0)
+        filtro_datas = models.FatoEstoque.data_snapshot.in_(datas)
+
+    def _metrica(coluna):
+        return func.sum(coluna * peso) if peso is not None else func.sum(coluna)
+
+    metricas_estoque_sql = []
+    if 'estoque_atual' in metricas_pedidas:
+        # A métrica principal do estoque (SUM do closing_stock_quantity)
+        metricas_estoque_sql.append(
+            _metrica(models.FatoEstoque.closing_stock_quantity).label("estoque_atual")
+        )
+
+    if 'estoque_pdv' in metricas_pedidas:
+        # Exemplo: Se estoque_final for o AVG do estoque no último dia (adapte a regra real)
+        metricas_estoque_sql.append(
+            _metrica(models.FatoEstoque.closing_stock_sale_price).label("estoque_pdv")
+        )
+        # [ADICIONE OUTRAS MÉTRICAS DE ESTOQUE AQUI]
+
+    stock_query = (
+        db.query(
+            *dimensoes_selecionadas,
+            *metricas_estoque_sql
+        )
+        .select_from(models.FatoEstoque)
+        .join(models.DimProduto, models.FatoEstoque.produto_id == models.DimProduto.id)
+        .join(models.DimLoja, models.FatoEstoque.loja_id == models.DimLoja.id)
+        .filter(filtro_datas)
+    )
+
+    # Aplica filtros do usuário
+    if query_request.filtros:
+        stock_query = _apply_filters(stock_query, query_request.filtros)
+
+    return stock_query.group_by(*dimensoes_selecionadas)
+
+
+def _build_query_ctes(db: Session, query_request: schemas.QueryRequest, estoque_sempre_atual: bool = True):
+    """Valida o pedido e monta as CTEs de vendas e de estoque (None quando não pedidas)."""
 
     # Mapas de dimensões disponíveis
-    dim_map = {
-        "nome_produto": models.DimProduto.product_name,
-        "codigo_produto": models.DimProduto.product_code,
-        "nome_marca": models.DimProduto.marca,
-        "nome_departamento": models.DimProduto.departamento,
-        "nome_classificacao": models.DimProduto.classificacao,
-        "nome_grupo": models.DimProduto.grupo,
-        "nome_modelo": models.DimProduto.modelo,
-        "nome_fornecedor": models.DimProduto.fornecedor,
-        "nome_loja": models.DimLoja.store_name,
-        "mes": func.to_char(models.FatoVendas.data_venda, 'YYYY-MM')
-    }
+    dim_map = _dim_map(models.FatoVendas.data_venda)
 
     # Identifica quais métricas o usuário quer
     metricas_pedidas = [m.nome for m in query_request.metricas]
@@ -62,184 +720,243 @@ def run_dynamic_query(db: Session, query_request: schemas.QueryRequest, estoque_
         raise HTTPException(status_code=400, detail="Pelo menos uma dimensão válida é necessária.")
 
     # --- QUERY DE VENDAS (se solicitada) ---
+    # Usa o rollup mensal mais agregado que atenda ao pedido; senão, a tabela de fatos
     sales_cte = None
     if quer_vendas:
-        metricas_selecionadas_sql = []
-
-        if 'venda_liquida' in metricas_pedidas:
-            metricas_selecionadas_sql.append(
-                func.sum(models.FatoVendas.venda_liquida).label("venda_liquida")
-            )
-        if 'quantidade_vendida' in metricas_pedidas:
-            metricas_selecionadas_sql.append(
-                func.sum(models.FatoVendas.quantidade_vendida).label("quantidade_vendida")
-            )
-
-        sales_query = (
-            db.query(
-                *dimensoes_selecionadas,
-                *metricas_selecionadas_sql  # <-- Usa a lista que contém SÓ o que foi pedido
-            )
-            .join(models.DimProduto, models.FatoVendas.produto_id == models.DimProduto.id)
-            .join(models.DimLoja, models.FatoVendas.loja_id == models.DimLoja.id)
-            .filter(models.FatoVendas.data_venda.between(query_request.data_inicial, query_request.data_final))
-        )
-
-        # Aplica filtros nas vendas (OK)
-        if query_request.filtros:
-            sales_query = _apply_filters(sales_query, query_request.filtros)
-        sales_cte = sales_query.group_by(*dimensoes_selecionadas).cte('sales_data')
+        sales_cte = _build_sales_query(db, query_request, metricas_pedidas).cte('sales_data')
 
 
     # --- QUERY DE ESTOQUE (se solicitada) ---
     stock_cte = None
     if quer_estoque:
-        # PASSO 1: Achar a DATA MÁXIMA GERAL (independente das dimensões)
-        data_limite = datetime.now().date() if estoque_sempre_atual else query_request.data_final
-
-        data_maxima_geral = db.query(
-            func.max(models.FatoEstoque.data_snapshot)
-        ).filter(
-            models.FatoEstoque.data_snapshot <= data_limite
-        ).scalar()
-
-        metricas_estoque_sql = []
-        if 'estoque_atual' in metricas_pedidas:
-            # A métrica principal do estoque (SUM do closing_stock_quantity)
-            metricas_estoque_sql.append(
-                func.sum(models.FatoEstoque.closing_stock_quantity).label("estoque_atual")
-            )
-
-        if 'estoque_pdv' in metricas_pedidas:
-            # Exemplo: Se estoque_final for o AVG do estoque no último dia (adapte a regra real)
-            metricas_estoque_sql.append(
-                func.sum(models.FatoEstoque.closing_stock_sale_price).label("estoque_pdv")
-            )
-            # [ADICIONE OUTRAS MÉTRICAS DE ESTOQUE AQUI]
-
-        stock_query = (
-            db.query(
-                *dimensoes_selecionadas,
-                *metricas_estoque_sql
-            )
-            .join(models.DimProduto, models.FatoEstoque.produto_id == models.DimProduto.id)
-            .join(models.DimLoja, models.FatoEstoque.loja_id == models.DimLoja.id)
-            .filter(models.FatoEstoque.data_snapshot == data_maxima_geral)  # ⬅️ SÓ ESSA DATA!
-        )
+        stock_cte = _build_stock_query(db, query_request, metricas_pedidas, estoque_sempre_atual).cte('stock_data')
 
-        # Aplica filtros do usuário
-        if query_request.filtros:
-            stock_query = _apply_filters(stock_query, query_request.filtros)
+    return sales_cte, stock_cte, metricas_pedidas
 
-        stock_cte = stock_query.group_by(*dimensoes_selecionadas).cte('stock_data')
-
-    # --- QUERY FINAL ---
-    return _build_final_query(db, sales_cte, stock_cte, query_request, metricas_pedidas)
 
-
-def _apply_filters(query, filtros: Dict):
+def _apply_filters(query, filtros: Dict, dim_map: Dict[str, Any] = None):
     """Aplica filtros dinamicamente na query"""
+    colunas = {**_DIM_PRODUTO, **_DIM_LOJA}
+    if dim_map is not None:
+        colunas = {nome: col for nome, col in dim_map.items() if nome in colunas}
     for coluna, valor in filtros.items():
-        if coluna == "nome_loja":
-            query = query.filter(models.DimLoja.store_name == valor)
-        elif coluna == "nome_marca":
-            query = query.filter(models.DimProduto.marca == valor)
-        elif coluna == "nome_produto":
-            query = query.filter(models.DimProduto.product_name == valor)
-        elif coluna == "nome_departamento":
-            query = query.filter(models.DimProduto.departamento == valor)
-        elif coluna == "nome_classificacao":
-            query = query.filter(models.DimProduto.classificacao == valor)
-        elif coluna == "nome_grupo":
-            query = query.filter(models.DimProduto.grupo == valor)
-        elif coluna == "codigo_produto":
-            query = query.filter(models.DimProduto.product_code == valor)
-        elif coluna == "nome_fornecedor":
-            query = query.filter(models.DimProduto.fornecedor == valor)
+        if coluna in colunas:
+            query = query.filter(colunas[coluna] == valor)
     return query
 
 
-def _build_final_query(db, sales_cte, stock_cte, query_request, metricas_pedidas):
+def _build_final_query(db, sales_cte, stock_cte, query_request, metricas_pedidas, detalhes=None):
 
     # CASO 1: Só vendas
     if sales_cte is not None and stock_cte is None:
-        final_query = select(sales_cte)
-        resultados = db.execute(final_query).fetchall()
-        return [dict(row._mapping) for row in resultados]
+        resultados = _executar(db, "sql_vendas", _float_select(sales_cte))
+        return _as_tuples(resultados)
 
     # CASO 2: Só estoque
     elif stock_cte is not None and sales_cte is None:
-        final_query = select(stock_cte)
-        resultados = db.execute(final_query).fetchall()
-        return [dict(row._mapping) for row in resultados]
+        resultados = _executar(db, "sql_estoque", _float_select(stock_cte))
+        return _as_tuples(resultados)
 
-    # CASO 3: Une no Python (MAIS LEVE PARA RENDER)
+    # CASO 3: Une no banco com FULL OUTER JOIN; o merge no Python fica como alternativa
     elif sales_cte is not None and stock_cte is not None:
+        caminho = "python"
+        if settings.query_merge_mode == "sql":
+            try:
+                resultados = _executar(db, "sql_uniao", _merged_select(sales_cte, stock_cte, metricas_pedidas))
+                if detalhes is not None:
+                    detalhes["merge"] = "sql"
+                return _as_tuples(resultados)
+            except DBAPIError:
+                # Banco sem suporte ao FULL OUTER JOIN
+                db.rollback()
+                caminho = "python_fallback"
+        if detalhes is not None:
+            detalhes["merge"] = caminho
         return _merge_in_python(db, sales_cte, stock_cte, query_request, metricas_pedidas)
 
 
-def _merge_in_python(db, sales_cte, stock_cte, query_request, metricas_pedidas):
-    """Une resultados no Python - OTIMIZADO"""
-
-    # Executa queries SEPARADAS (leves para o banco)
-    vendas_result = db.execute(select(sales_cte)).fetchall()
-    estoque_result = db.execute(select(stock_cte)).fetchall()
-
-    # Converte para dicionários com chave das dimensões
-    vendas_map = {}
-    for row in vendas_result:
-        row_dict = dict(row._mapping)
-        key = tuple(row_dict.get(d) for d in query_request.dimensoes)
-        vendas_map[key] = row_dict
-
-    estoque_map = {}
-    for row in estoque_result:
-        row_dict = dict(row._mapping)
-        key = tuple(row_dict.get(d) for d in query_request.dimensoes)
-        estoque_map[key] = row_dict
-
-    # Une os resultados
-    merged = []
-    all_keys = set(vendas_map.keys()) | set(estoque_map.keys())
-
-    for key in all_keys:
-        merged_row = {}
-
-        # Copia dimensões da chave
-        for i, dim in enumerate(query_request.dimensoes):
-            if i < len(key) and key[i] is not None:
-                merged_row[dim] = key[i]
-
-        # Métricas de vendas (com fallback para 0)
-        venda_data = vendas_map.get(key, {})
-        if 'venda_liquida' in metricas_pedidas:
-            merged_row['venda_liquida'] = venda_data.get('venda_liquida', 0)
-        if 'quantidade_vendida' in metricas_pedidas:
-            merged_row['quantidade_vendida'] = venda_data.get('quantidade_vendida', 0)
-
-        # Métricas de estoque (com fallback para 0)
-        estoque_data = estoque_map.get(key, {})
-        if 'estoque_atual' in metricas_pedidas:
-            merged_row['estoque_atual'] = estoque_data.get('estoque_atual', 0)
-
-        if 'estoque_pdv' in metricas_pedidas:
-            merged_row['estoque_pdv'] = estoque_data.get('estoque_pdv', 0)
-
-        merged.append(merged_row)
-
-    final_results_cleaned = []
-    for row in merged:
-        cleaned_row = {}
-        for key, value in row.items():
-            if isinstance(value, Decimal):
-                cleaned_row[key] = float(value)
-            else:
-                cleaned_row[key] = value
-        final_results_cleaned.append(cleaned_row)
+# Métricas somadas sobre colunas Numeric, devolvidas como float (como no merge em Python)
+_METRICAS_DECIMAIS = {'venda_liquida', 'estoque_pdv'}
+
+
+def _float_select(cte):
+    """SELECT da CTE com as métricas Numeric já em float (evita montar um Decimal por célula)."""
+    return select(*[
+        sa.cast(coluna, sa.Float).label(coluna.name) if coluna.name in _METRICAS_DECIMAIS else coluna
+        for coluna in cte.c
+    ])
 
-    return final_results_cleaned
 
-#obs.: falta ajustar a logica de pedir dimensão mes, a natureza da venda é diaria e o estoque é uma foto do passad fixa, nao existe mes no estoque no modelo atual
-# Esta configurado apenas para buscar o estoque atual, os estoques retroativos esta pendente desenvolver a logica de analise para essa coluna
-# Necessario incluir metricas de entrada custo
+def _join_key_conditions(sales_cte, stock_cte, dimensoes):
+    """
+    Condições do FULL OUTER JOIN que também casam chaves nulas. O PostgreSQL só
+    aceita FULL JOIN com igualdades simples (hash/merge join), então em vez de
+    IS NOT DISTINCT FROM compara COALESCE(dim, '') e, à parte, se a dimensão é
+    nula dos dois lados (para '' não casar com NULL). As dimensões são texto.
+    """
+    condicoes = []
+    for d in dimensoes:
+        vendas, estoque = sales_cte.c[d], stock_cte.c[d]
+        condicoes.append(func.coalesce(vendas, '') == func.coalesce(estoque, ''))
+        condicoes.append(vendas.is_(None) == estoque.is_(None))
+    return condicoes
+
+
+def _merged_select(sales_cte, stock_cte, metricas_pedidas):
+    """
+    SELECT que une vendas e estoque no servidor: FULL OUTER JOIN pelas dimensões
+    (chaves nulas casam entre si), dimensões via COALESCE e métricas ausentes
+    como 0, já com os tipos finais.
+    """
+    dimensoes = [nome for nome in sales_cte.c.keys() if nome in stock_cte.c]
+
+    condicao = and_(*_join_key_conditions(sales_cte, stock_cte, dimensoes))
+    colunas = [func.coalesce(sales_cte.c[d], stock_cte.c[d]).label(d) for d in dimensoes]
+
+    for metrica in ('venda_liquida', 'quantidade_vendida', 'estoque_atual', 'estoque_pdv'):
+        if metrica not in metricas_pedidas:
+            continue
+        cte = sales_cte if metrica in sales_cte.c else stock_cte
+        coluna = func.coalesce(cte.c[metrica], 0)
+        if metrica in _METRICAS_DECIMAIS:
+            coluna = sa.cast(coluna, sa.Float)
+        colunas.append(coluna.label(metrica))
+
+    return select(*colunas).select_from(sales_cte.join(stock_cte, condicao, full=True))
+
+
+# Threads que rodam a consulta de vendas em paralelo com a de estoque
+_subquery_pool = ThreadPoolExecutor(max_workers=settings.query_parallel_workers,
+                                    thread_name_prefix="subquery")
+
+
+def _timed_fetch(db: Session, consulta):
+    """Executa a consulta e devolve (linhas, milissegundos)."""
+    inicio = time.perf_counter()
+    linhas = db.execute(consulta).fetchall()
+    return linhas, (time.perf_counter() - inicio) * 1000
+
+
+def _executar(db: Session, nome_fase: str, consulta):
+    """
+    Executa a consulta registrando tempo e linhas no perfil da requisição (e
+    o plano, se pedido). Devolve (linhas, nomes das colunas).
+    """
+    linhas, ms = _timed_fetch(db, consulta)
+    profiling.registrar(nome_fase, ms, len(linhas))
+    profiling.capturar_explain(db, nome_fase, consulta)
+    # str(): os nomes vêm como quoted_name (subclasse de str), que o orjson não aceita como chave
+    return linhas, [str(coluna.name) for coluna in consulta.selected_columns]
+
+
+async def _executar_async(db: AsyncSession, nome_fase: str, consulta):
+    """_executar na AsyncSession: a consulta é aguardada, sem ocupar o event loop."""
+    inicio = time.perf_counter()
+    linhas = (await db.execute(consulta)).fetchall()
+    profiling.registrar(nome_fase, (time.perf_counter() - inicio) * 1000, len(linhas))
+    await db.run_sync(lambda sync_db: profiling.capturar_explain(sync_db, nome_fase, consulta))
+    return linhas, [str(coluna.name) for coluna in consulta.selected_columns]
+
+
+def _as_tuples(resultado) -> Tuple[List[str], List[tuple]]:
+    linhas, colunas = resultado
+    with profiling.fase("conversao"):
+        return colunas, [tuple(row) for row in linhas]
+
+
+def _fetch_in_new_session(consulta, statement_timeout: Optional[str], interrompiveis=None):
+    from .db import SubquerySessionLocal
+
+    with SubquerySessionLocal() as db:
+        if statement_timeout is not None:
+            # Mesmo limite da sessão que pediu (os jobs usam um timeout maior que o do pool)
+            db.execute(text("SELECT set_config('statement_timeout', :valor, true)"), {"valor": statement_timeout})
+        if interrompiveis is None:
+            return _timed_fetch(db, consulta)
+        # Conexão registrada enquanto a consulta roda: cancelar o job interrompe ela também
+        with interrompiveis.usando(db.connection().connection.dbapi_connection):
+            return _timed_fetch(db, consulta)
+
+
+def _fetch_sales_and_stock(db: Session, sales_cte, stock_cte):
+    """
+    Executa as consultas de vendas e de estoque ao mesmo tempo: vendas numa
+    sessão do pool de subconsultas (nunca do pool da sessão atual, que pode
+    estar esgotado por requisições esperando por ela) na threadpool e estoque
+    na sessão atual. Sessões do driver async (run_sync) não podem ser usadas
+    em outra thread, então ali as duas rodam em sequência.
+    Se db.info["interrompiveis"] existir (jobs.JobManager), a conexão das
+    vendas é registrada nele, para o cancelamento do job alcançá-la.
+    """
+    bind = db.get_bind()
+    if not settings.query_parallel_subqueries or bind.dialect.is_async:
+        return _timed_fetch(db, _float_select(sales_cte)), _timed_fetch(db, _float_select(stock_cte))
+
+    statement_timeout = None
+    if bind.dialect.name == "postgresql":
+        statement_timeout = db.execute(text("SHOW statement_timeout")).scalar()
+    futuro_vendas = _subquery_pool.submit(_fetch_in_new_session, _float_select(sales_cte), statement_timeout,
+                                          db.info.get("interrompiveis"))
+    estoque = _timed_fetch(db, _float_select(stock_cte))
+    return futuro_vendas.result(), estoque
+
+
+def _registrar_subconsultas(db: Session, sales_cte, stock_cte, vendas, estoque) -> None:
+    """Tempos/linhas das duas consultas do merge em Python no perfil (e os planos, se pedidos)."""
+    for nome_fase, cte, (linhas, ms) in (("sql_vendas", sales_cte, vendas), ("sql_estoque", stock_cte, estoque)):
+        profiling.registrar(nome_fase, ms, len(linhas))
+        profiling.capturar_explain(db, nome_fase, _float_select(cte))
+
+
+def _merge_in_python(db, sales_cte, stock_cte, query_request, metricas_pedidas) -> Tuple[List[str], List[tuple]]:
+    """Une resultados no Python - OTIMIZADO (devolve colunas + tuplas, como run_dynamic_query_rows)"""
+
+    # Executa queries SEPARADAS (leves para o banco), em paralelo
+    vendas, estoque = _fetch_sales_and_stock(db, sales_cte, stock_cte)
+    _registrar_subconsultas(db, sales_cte, stock_cte, vendas, estoque)
+    return _merge_rows(vendas[0], estoque[0], sales_cte, stock_cte, query_request, metricas_pedidas)
+
+
+def _merge_rows(vendas, estoque, sales_cte, stock_cte, query_request, metricas_pedidas) -> Tuple[List[str], List[tuple]]:
+    """
+    União em memória das linhas de vendas e de estoque pelas dimensões (só
+    CPU, sem banco). Mesmo formato do merge em SQL (QUERY_MERGE_MODE=sql) e
+    das consultas de um lado só: colunas = dimensões pedidas (na ordem do
+    pedido, sem as que nenhum dos lados tem) + venda_liquida,
+    quantidade_vendida, estoque_atual, estoque_pdv (nessa ordem, só as
+    pedidas); dimensão sem valor vem como None (null no JSON), em vez de a
+    chave ser omitida da linha como nos dicts da versão antiga.
+    """
+    inicio_merge = time.perf_counter()
+
+    dimensoes = [d for d in dict.fromkeys(query_request.dimensoes) if d in sales_cte.c or d in stock_cte.c]
+    metricas = [m for m in ('venda_liquida', 'quantidade_vendida', 'estoque_atual', 'estoque_pdv')
+                if m in metricas_pedidas]
+    metricas_vendas = [m for m in metricas if m in sales_cte.c]
+    metricas_estoque = [m for m in metricas if m not in sales_cte.c]
+
+    def _por_chave(linhas, cte, nomes_metricas):
+        # Chave = valores das dimensões; valor = tupla das métricas
+        posicao = {nome: i for i, nome in enumerate(cte.c.keys())}
+        dims = [posicao.get(d) for d in dimensoes]
+        mets = [posicao[m] for m in nomes_metricas]
+        return {
+            tuple(None if i is None else row[i] for i in dims): tuple(row[i] for i in mets)
+            for row in linhas
+        }
+
+    vendas_map = _por_chave(vendas, sales_cte, metricas_vendas)
+    estoque_map = _por_chave(estoque, stock_cte, metricas_estoque)
+
+    # Une os resultados (métrica ausente de um dos lados vale 0)
+    sem_vendas = (0,) * len(metricas_vendas)
+    sem_estoque = (0,) * len(metricas_estoque)
+    linhas = [
+        chave + vendas_map.get(chave, sem_vendas) + estoque_map.get(chave, sem_estoque)
+        for chave in vendas_map.keys() | estoque_map.keys()
+    ]
+    profiling.registrar("merge", (time.perf_counter() - inicio_merge) * 1000)
+    return dimensoes + metricas_vendas + metricas_estoque, linhas
+
+#obs.: Necessario incluir metricas de entrada custo
 # versão de protótipo, será necesario validar metricas e refatorar
@@ -3,16 +3,98 @@
 from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from .config import settings
 
 # URL de conexão com o banco de dados PostgreSQL
 SQLALCHEMY_DATABASE_URL = settings.database_url
 
-# Cria o "motor" de conexão com o banco
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+
+def _is_postgres_url(url: str) -> bool:
+    return url.split("://", 1)[0].split("+")[0] in ("postgres", "postgresql")
+
+
+def _async_database_url(url: str) -> str:
+    """Troca o driver síncrono da URL pelo asyncpg (postgresql://... -> postgresql+asyncpg://...)."""
+    esquema, resto = url.split("://", 1)
+    if _is_postgres_url(url):
+        return f"postgresql+asyncpg://{resto}"
+    return url
+
+
+def _engine_options(url: str, pool_size: int, max_overflow: int, statement_timeout_ms: int,
+                    async_driver: bool = False) -> dict:
+    """
+    Parâmetros do pool e o statement_timeout (em ms, 0 = sem limite) aplicado em
+    cada conexão aberta. Fora do PostgreSQL (ex.: SQLite local) usa o padrão.
+    """
+    if not _is_postgres_url(url):
+        return {}
+    opcoes = {
+        "pool_size": pool_size,
+        "max_overflow": max_overflow,
+        "pool_timeout": settings.db_pool_timeout,
+        "pool_recycle": settings.db_pool_recycle,
+        "pool_pre_ping": settings.db_pool_pre_ping,
+    }
+    if statement_timeout_ms:
+        if async_driver:
+            opcoes["connect_args"] = {"server_settings": {"statement_timeout": str(statement_timeout_ms)}}
+        else:
+            opcoes["connect_args"] = {"options": f"-c statement_timeout={statement_timeout_ms}"}
+    return opcoes
+
+
+# Pool interativo: login, produtos, KPIs (consultas curtas, timeout curto)
+engine = create_engine(
+    SQLALCHEMY_DATABASE_URL,
+    **_engine_options(SQLALCHEMY_DATABASE_URL, settings.db_pool_size, settings.db_max_overflow,
+                      settings.db_statement_timeout_ms),
+)
+
+# Pool analítico: /api/query, streaming e exportação. Separado para um relatório
+# pesado não esgotar as conexões do login e das consultas de produto
+analytics_engine = create_engine(
+    SQLALCHEMY_DATABASE_URL,
+    **_engine_options(SQLALCHEMY_DATABASE_URL, settings.db_analytics_pool_size,
+                      settings.db_analytics_max_overflow, settings.db_analytics_statement_timeout_ms),
+)
+
+# Pool das subconsultas paralelas do merge em Python. A requisição já segura uma
+# conexão do pool analítico enquanto espera a subconsulta; se a segunda conexão
+# viesse do mesmo pool, requisições simultâneas poderiam esgotá-lo esperando umas
+# pelas outras até o pool_timeout. Uma conexão por thread do pool de subconsultas.
+subquery_engine = create_engine(
+    SQLALCHEMY_DATABASE_URL,
+    **_engine_options(SQLALCHEMY_DATABASE_URL, settings.query_parallel_workers, 0,
+                      settings.db_analytics_statement_timeout_ms),
+)
 
 # Cria sessões
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+AnalyticsSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=analytics_engine)
+SubquerySessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=subquery_engine)
+
+
+# Motores/sessões async (opcional), com a mesma divisão interativo x analítico
+async_engine = None
+async_analytics_engine = None
+AsyncSessionLocal = None
+AsyncAnalyticsSessionLocal = None
+if settings.async_db_enabled:
+    _ASYNC_URL = settings.async_database_url or _async_database_url(SQLALCHEMY_DATABASE_URL)
+    async_engine = create_async_engine(
+        _ASYNC_URL,
+        **_engine_options(_ASYNC_URL, settings.db_pool_size, settings.db_max_overflow,
+                          settings.db_statement_timeout_ms, async_driver=True),
+    )
+    async_analytics_engine = create_async_engine(
+        _ASYNC_URL,
+        **_engine_options(_ASYNC_URL, settings.db_analytics_pool_size, settings.db_analytics_max_overflow,
+                          settings.db_analytics_statement_timeout_ms, async_driver=True),
+    )
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+    AsyncAnalyticsSessionLocal = async_sessionmaker(async_analytics_engine, autoflush=False, expire_on_commit=False)
 
 # Uma classe base que nossos modelos de tabela irão herdar
-Base = declarative_base()
\ No newline at end of file
+Base = declarative_base()
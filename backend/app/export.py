@@ -0,0 +1,147 @@
+# backend/app/export.py
+# Serialização do resultado da query dinâmica: JSON (linhas ou colunar) e
+# exportação colunar (Apache Arrow IPC / Parquet).
+import io
+import json
+from datetime import date
+from decimal import Decimal
+from typing import Iterable, List
+
+try:
+    import orjson
+except ImportError:  # orjson é opcional; sem ele o JSON sai pelo json da biblioteca padrão
+    orjson = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow é opcional; sem ele o endpoint responde 501
+    pa = None
+
+MEDIA_TYPES = {
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
+}
+EXTENSOES = {"arrow": "arrows", "parquet": "parquet"}
+
+
+# Formatos do JSON do /api/query: uma lista de objetos ou colunas + arrays de valores
+FORMATOS_JSON = ("linhas", "colunar")
+
+
+def disponivel() -> bool:
+    return pa is not None
+
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f"Tipo não serializável: {type(value)}")
+
+
+def json_bytes(conteudo) -> bytes:
+    """JSON compacto; com orjson int/float/str/date/tuplas são codificados em C, sem passar por Python."""
+    if orjson is not None:
+        return orjson.dumps(conteudo, default=_json_default)
+    return json.dumps(conteudo, default=_json_default, separators=(",", ":")).encode()
+
+
+def json_resultado(colunas: List[str], linhas: List[tuple], formato: str = "linhas") -> bytes:
+    """
+    Corpo JSON do resultado direto das tuplas, sem validação por linha.
+    "linhas": [{"coluna": valor, ...}, ...] (o formato de sempre).
+    "colunar": {"colunas": [...], "total": n, "valores": [[coluna 1], [coluna 2], ...]},
+    sem repetir os nomes das colunas em cada linha.
+    """
+    if formato == "colunar":
+        valores = list(zip(*linhas)) if linhas else [() for _ in colunas]
+        return json_bytes({"colunas": colunas, "total": len(linhas), "valores": valores})
+    return json_bytes([dict(zip(colunas, linha)) for linha in linhas])
+
+
+def _tipo_coluna(nome: str, amostra: List[tuple] = (), posicao: int = 0):
+    # Métricas monetárias viram float64, contagens int64 e dimensões texto.
+    # Contagens médias (estoque_modo=media_mes) chegam fracionárias e viram float64.
+    if nome in ("venda_liquida", "estoque_pdv"):
+        return pa.float64()
+    if nome in ("quantidade_vendida", "estoque_atual"):
+        if any(isinstance(row[posicao], float) for row in amostra):
+            return pa.float64()
+        return pa.int64()
+    return pa.string()
+
+
+class _ChunkSink(io.RawIOBase):
+    """Destino de escrita que acumula os bytes até serem drenados para a resposta."""
+
+    def __init__(self):
+        self._partes = []
+        self._posicao = 0
+
+    def writable(self):
+        return True
+
+    def write(self, dados):
+        self._partes.append(bytes(dados))
+        self._posicao += len(dados)
+        return len(dados)
+
+    def tell(self):
+        # O writer de Parquet usa a posição absoluta para os offsets do rodapé
+        return self._posicao
+
+    def drain(self) -> bytes:
+        dados = b"".join(self._partes)
+        self._partes.clear()
+        return dados
+
+
+def _to_batch(schema, lote: List[tuple]):
+    arrays = []
+    for i, campo in enumerate(schema):
+        valores = [row[i] for row in lote]
+        if pa.types.is_floating(campo.type):
+            valores = [float(v) if isinstance(v, Decimal) else v for v in valores]
+        elif pa.types.is_integer(campo.type):
+            valores = [int(v) if v is not None else None for v in valores]
+        elif pa.types.is_string(campo.type):
+            valores = [str(v) if v is not None else None for v in valores]
+        arrays.append(pa.array(valores, type=campo.type))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def _open_writer(destino, schema, formato: str):
+    if formato == "parquet":
+        return pq.ParquetWriter(destino, schema)
+    return ipc.new_stream(destino, schema)
+
+
+def iter_export(colunas: List[str], lotes: Iterable[List[tuple]], formato: str):
+    """
+    Converte os lotes vindos do cursor em record batches e gera os bytes do
+    arquivo (stream IPC ou Parquet, um row group por lote) conforme são escritos.
+    """
+    sink = _ChunkSink()
+    destino = pa.PythonFile(sink, mode="w")
+    schema = writer = None
+
+    for lote in lotes:
+        if not lote:
+            continue
+        if writer is None:
+            # O schema sai do primeiro lote (tipo das contagens depende do modo de estoque)
+            schema = pa.schema([pa.field(nome, _tipo_coluna(nome, lote, i)) for i, nome in enumerate(colunas)])
+            writer = _open_writer(destino, schema, formato)
+        writer.write_batch(_to_batch(schema, lote))
+        dados = sink.drain()
+        if dados:
+            yield dados
+
+    if writer is None:
+        schema = pa.schema([pa.field(nome, _tipo_coluna(nome)) for nome in colunas])
+        writer = _open_writer(destino, schema, formato)
+    writer.close()
+    yield sink.drain()
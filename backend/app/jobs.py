@@ -0,0 +1,457 @@
+# backend/app/jobs.py
+import hashlib
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional
+
+from fastapi import HTTPException
+from sqlalchemy import func, text
+from sqlalchemy.exc import IntegrityError
+
+from . import export, models, schemas
+from .cache import make_query_key
+from .config import settings
+
+STATUS_PENDENTE = "pendente"
+STATUS_EXECUTANDO = "executando"
+STATUS_CONCLUIDO = "concluido"
+STATUS_ERRO = "erro"
+STATUS_CANCELADO = "cancelado"
+STATUS_EM_ANDAMENTO = (STATUS_PENDENTE, STATUS_EXECUTANDO)
+
+# Intervalo mínimo (s) entre duas limpezas de jobs vencidos no mesmo processo
+INTERVALO_LIMPEZA = 60
+ERRO_ABANDONADO = "Job abandonado (worker encerrado durante a execução)."
+
+logger = logging.getLogger("analisador.jobs")
+
+
+def diretorio() -> str:
+    return settings.jobs_dir or os.path.join(os.path.dirname(__file__), "..", "data", "jobs")
+
+
+def arquivo(job_id: str) -> str:
+    return os.path.join(diretorio(), f"{job_id}.json")
+
+
+def _agora() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _worker_atual() -> str:
+    """host:pid deste processo (lido na hora: os workers podem ser forks de um mesmo import)."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _processo_vivo(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Existe, só é de outro usuário
+        return True
+    return True
+
+
+def _to_dict(job: models.JobAnalise) -> Dict[str, Any]:
+    return {
+        "id": job.id,
+        "status": job.status,
+        "formato": job.formato,
+        "criado_em": job.criado_em,
+        "iniciado_em": job.iniciado_em,
+        "concluido_em": job.concluido_em,
+        "linhas": job.linhas,
+        "erro": job.erro,
+        **(job.detalhes or {}),
+    }
+
+
+class JobManager:
+    """
+    Fila de análises longas (/api/jobs): um pool limitado de threads executa
+    crud.run_dynamic_query_rows e grava o JSON do resultado em disco, de onde
+    é baixado depois. Os metadados ficam na tabela jobs_analise, então status,
+    download e cancelamento funcionam em qualquer worker (o diretório dos
+    resultados precisa ser compartilhado entre eles). Pedidos iguais
+    (make_query_key + formato) enquanto o primeiro ainda roda viram o mesmo
+    job. Jobs terminados e seus arquivos somem depois de
+    settings.jobs_retention_seconds.
+    """
+
+    def __init__(self, workers: int = 2, max_pending: int = 20, retention_seconds: float = 3600):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.retention_seconds = retention_seconds
+        self._executor: Optional[ThreadPoolExecutor] = None
+        # Jobs executando neste processo: futuro e conexões com consulta em andamento (para o cancelamento)
+        self._locais: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._ultima_limpeza = 0.0
+        self.submetidos = 0
+        self.deduplicados = 0
+        self.rejeitados = 0
+
+    @staticmethod
+    def _sessao():
+        from .db import SessionLocal
+        return SessionLocal()
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            os.makedirs(diretorio(), exist_ok=True)
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="job")
+        return self._executor
+
+    @staticmethod
+    def _em_andamento(db, chave: str) -> Optional[models.JobAnalise]:
+        return (
+            db.query(models.JobAnalise)
+            .filter(models.JobAnalise.chave == chave, models.JobAnalise.status.in_(STATUS_EM_ANDAMENTO))
+            .with_for_update()
+            .first()
+        )
+
+    @staticmethod
+    def _adicionar_dono(job: models.JobAnalise, usuario: str) -> None:
+        if usuario not in job.donos:
+            # Lista nova: o tipo JSON só percebe a mudança se o valor for trocado
+            job.donos = [*job.donos, usuario]
+
+    def submit(self, query_request: schemas.QueryRequest, formato: str, usuario: str) -> Dict[str, Any]:
+        """Enfileira o pedido (ou devolve o job idêntico que ainda está rodando)."""
+        self._limpar()
+        chave = hashlib.sha256(f"{make_query_key(query_request)}|{formato}".encode()).hexdigest()
+        with self._sessao() as db:
+            job = self._em_andamento(db, chave)
+            if job is None:
+                pendentes = (
+                    db.query(func.count(models.JobAnalise.id))
+                    .filter(models.JobAnalise.status.in_(STATUS_EM_ANDAMENTO))
+                    .scalar()
+                )
+                if pendentes >= self.max_pending:
+                    self.rejeitados += 1
+                    raise HTTPException(status_code=503, detail="Fila de análises cheia, tente novamente mais tarde.",
+                                        headers={"Retry-After": "30"})
+                job = models.JobAnalise(
+                    id=uuid.uuid4().hex, chave=chave, formato=formato,
+                    status=STATUS_PENDENTE, donos=[usuario], criado_em=_agora(), worker=_worker_atual(),
+                )
+                db.add(job)
+                try:
+                    db.commit()
+                except IntegrityError:
+                    # Outro worker criou o mesmo pedido ao mesmo tempo (índice único parcial)
+                    db.rollback()
+                    job = self._em_andamento(db, chave)
+                    if job is None:
+                        raise
+                else:
+                    self.submetidos += 1
+                    with self._lock:
+                        futuro = self._get_executor().submit(self._executar, job.id, query_request, formato)
+                        self._locais[job.id] = {"futuro": futuro, "interrompiveis": _Interrompiveis()}
+                    return _to_dict(job)
+
+            self._adicionar_dono(job, usuario)
+            db.commit()
+            self.deduplicados += 1
+            return _to_dict(job)
+
+    def get(self, job_id: str, usuario: str) -> Dict[str, Any]:
+        """O job, se existir e for de 'usuario'; senão 404."""
+        self._limpar()
+        with self._sessao() as db:
+            job = db.get(models.JobAnalise, job_id)
+            if job is None or usuario not in job.donos:
+                raise HTTPException(status_code=404, detail="Job não encontrado")
+            return _to_dict(job)
+
+    def cancel(self, job_id: str, usuario: str) -> Dict[str, Any]:
+        """
+        Tira 'usuario' do job; quando ninguém mais espera por ele, cancela
+        (ainda na fila ou interrompendo a consulta em andamento, mesmo que ela
+        rode em outro worker) ou apaga o resultado.
+        """
+        with self._sessao() as db:
+            job = db.get(models.JobAnalise, job_id, with_for_update=True)
+            if job is None or usuario not in job.donos:
+                raise HTTPException(status_code=404, detail="Job não encontrado")
+            job.donos = [dono for dono in job.donos if dono != usuario]
+            if job.donos:
+                db.commit()
+                return _to_dict(job)
+
+            if job.status in STATUS_EM_ANDAMENTO:
+                pid = job.backend_pid
+                job.status, job.concluido_em, job.backend_pid = STATUS_CANCELADO, _agora(), None
+                resultado = _to_dict(job)
+                with self._lock:
+                    local = self._locais.get(job_id)
+                if local is not None:
+                    if local["futuro"].cancel():
+                        with self._lock:
+                            self._locais.pop(job_id, None)
+                    else:
+                        local["interrompiveis"].interromper()
+                elif pid is not None and db.get_bind().dialect.name == "postgresql":
+                    # Executando em outro worker: cancela pelo PID da conexão, com a linha ainda travada
+                    db.execute(text("SELECT pg_cancel_backend(:pid)"), {"pid": pid})
+                db.commit()
+            else:
+                resultado = _to_dict(job)
+                db.delete(job)
+                db.commit()
+        self._remover_arquivo(job_id)
+        return resultado
+
+    def _executar(self, job_id: str, query_request: schemas.QueryRequest, formato: str) -> None:
+        from . import crud
+        from .db import AnalyticsSessionLocal
+
+        try:
+            with self._sessao() as meta:
+                job = meta.get(models.JobAnalise, job_id, with_for_update=True)
+                if job is None or job.status != STATUS_PENDENTE:
+                    return
+                job.status, job.iniciado_em = STATUS_EXECUTANDO, _agora()
+                meta.commit()
+
+            db = AnalyticsSessionLocal()
+            detalhes: Dict[str, Any] = {}
+            try:
+                if db.get_bind().dialect.name == "postgresql":
+                    # Jobs existem justamente para as consultas longas: timeout próprio
+                    db.execute(text(f"SET LOCAL statement_timeout = {int(settings.jobs_statement_timeout_ms)}"))
+                    pid = db.execute(text("SELECT pg_backend_pid()")).scalar()
+                    if not self._atualizar(job_id, backend_pid=pid):
+                        return
+                with self._lock:
+                    interrompiveis = self._locais[job_id]["interrompiveis"]
+                # A subconsulta de vendas do merge em Python roda noutra conexão e se registra também
+                db.info["interrompiveis"] = interrompiveis
+                with interrompiveis.usando(db.connection().connection.dbapi_connection):
+                    colunas, linhas = crud.run_dynamic_query_rows(db, query_request, detalhes=detalhes)
+
+                destino = arquivo(job_id)
+                temporario = f"{destino}.tmp"
+                with open(temporario, "wb") as saida:
+                    saida.write(export.json_resultado(colunas, linhas, formato))
+                os.replace(temporario, destino)
+                if not self._atualizar(job_id, status=STATUS_CONCLUIDO, linhas=len(linhas), detalhes=detalhes):
+                    self._remover_arquivo(job_id)
+            except Exception as e:
+                erro = e.detail if isinstance(e, HTTPException) else f"{type(e).__name__}: {e}"
+                self._atualizar(job_id, status=STATUS_ERRO, erro=erro)
+            finally:
+                db.close()
+        finally:
+            with self._lock:
+                self._locais.pop(job_id, None)
+
+    def _atualizar(self, job_id: str, **campos) -> bool:
+        """
+        Grava 'campos' no job, a menos que ele tenha sido cancelado nesse meio
+        tempo (aí devolve False). Com 'status', o job é dado como terminado.
+        """
+        with self._sessao() as meta:
+            job = meta.get(models.JobAnalise, job_id, with_for_update=True)
+            if job is None or job.status == STATUS_CANCELADO:
+                return False
+            if "status" in campos:
+                campos.update(concluido_em=_agora(), backend_pid=None)
+            for campo, valor in campos.items():
+                setattr(job, campo, valor)
+            meta.commit()
+            return True
+
+    @staticmethod
+    def _remover_arquivo(job_id: str) -> None:
+        try:
+            os.remove(arquivo(job_id))
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def _abandonar_orfaos(db) -> int:
+        """
+        Dá como abandonados os jobs em andamento cujo worker morreu: os de um
+        processo deste host que não existe mais e, no PostgreSQL, os que
+        executavam numa conexão que sumiu do pg_stat_activity. Sem isso, um
+        pedido igual ficaria preso ao job órfão (deduplicação) até a janela
+        de abandono do _limpar.
+        """
+        j = models.JobAnalise
+        em_andamento = db.query(j.id, j.worker, j.backend_pid).filter(j.status.in_(STATUS_EM_ANDAMENTO)).all()
+        conexoes_vivas = None
+        if any(pid is not None for _, _, pid in em_andamento) and db.get_bind().dialect.name == "postgresql":
+            conexoes_vivas = {pid for (pid,) in db.execute(text("SELECT pid FROM pg_stat_activity"))}
+
+        host = socket.gethostname()
+        orfaos = []
+        for job_id, worker, backend_pid in em_andamento:
+            nome, _, pid = (worker or "").rpartition(":")
+            if nome == host and pid.isdigit() and int(pid) != os.getpid() and not _processo_vivo(int(pid)):
+                orfaos.append(job_id)
+            elif conexoes_vivas is not None and backend_pid is not None and backend_pid not in conexoes_vivas:
+                orfaos.append(job_id)
+        if orfaos:
+            db.query(j).filter(j.id.in_(orfaos), j.status.in_(STATUS_EM_ANDAMENTO)).update(
+                {"status": STATUS_ERRO, "erro": ERRO_ABANDONADO, "concluido_em": _agora(), "backend_pid": None},
+                synchronize_session=False,
+            )
+        return len(orfaos)
+
+    def recuperar_orfaos(self) -> None:
+        """Na subida do worker: libera os jobs deixados por processos que morreram."""
+        with self._sessao() as db:
+            orfaos = self._abandonar_orfaos(db)
+            db.commit()
+        if orfaos:
+            logger.warning("%d job(s) de workers encerrados marcados como abandonados", orfaos)
+
+    def _limpar(self) -> None:
+        """
+        Apaga os jobs terminados há mais de retention_seconds (e os arquivos
+        deles) e dá como abandonados os órfãos (_abandonar_orfaos) e os que
+        estão em andamento há mais que o timeout da consulta (worker de outro
+        host que morreu no meio). No máximo uma vez por INTERVALO_LIMPEZA em
+        cada processo.
+        """
+        agora = time.monotonic()
+        with self._lock:
+            if agora - self._ultima_limpeza < INTERVALO_LIMPEZA:
+                return
+            self._ultima_limpeza = agora
+
+        limite = _agora() - timedelta(seconds=self.retention_seconds)
+        limite_andamento = limite - timedelta(milliseconds=settings.jobs_statement_timeout_ms)
+        with self._sessao() as db:
+            vencidos = [
+                job_id for (job_id,) in db.query(models.JobAnalise.id).filter(
+                    models.JobAnalise.status.notin_(STATUS_EM_ANDAMENTO),
+                    models.JobAnalise.concluido_em < limite,
+                )
+            ]
+            if vencidos:
+                db.query(models.JobAnalise).filter(models.JobAnalise.id.in_(vencidos)).delete(
+                    synchronize_session=False
+                )
+            self._abandonar_orfaos(db)
+            db.query(models.JobAnalise).filter(
+                models.JobAnalise.status.in_(STATUS_EM_ANDAMENTO),
+                models.JobAnalise.criado_em < limite_andamento,
+            ).update(
+                {"status": STATUS_ERRO, "erro": ERRO_ABANDONADO, "concluido_em": _agora(), "backend_pid": None},
+                synchronize_session=False,
+            )
+            db.commit()
+        for job_id in vencidos:
+            self._remover_arquivo(job_id)
+
+    def limpar_diretorio(self) -> None:
+        """
+        Apaga do diretório compartilhado só os arquivos (inclusive .tmp de
+        execuções interrompidas) mais velhos que retention_seconds: os demais
+        podem ser resultados de jobs de outros workers.
+        """
+        pasta = diretorio()
+        if not os.path.isdir(pasta):
+            return
+        limite = time.time() - self.retention_seconds
+        for nome in os.listdir(pasta):
+            caminho = os.path.join(pasta, nome)
+            try:
+                if os.path.getmtime(caminho) < limite:
+                    os.remove(caminho)
+            except FileNotFoundError:
+                pass
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> dict:
+        with self._sessao() as db:
+            por_status = dict(
+                db.query(models.JobAnalise.status, func.count(models.JobAnalise.id))
+                .group_by(models.JobAnalise.status)
+                .all()
+            )
+        with self._lock:
+            executando_aqui = len(self._locais)
+        return {
+            "workers": self.workers,
+            "max_pendentes": self.max_pending,
+            "retencao_segundos": self.retention_seconds,
+            "submetidos": self.submetidos,
+            "deduplicados": self.deduplicados,
+            "rejeitados": self.rejeitados,
+            "neste_processo": executando_aqui,
+            "por_status": por_status,
+        }
+
+
+class JobCancelado(Exception):
+    pass
+
+
+class _Interrompiveis:
+    """
+    Conexões DBAPI com consulta de um job em andamento: a da sessão do job e
+    as do pool de subconsultas (crud._fetch_in_new_session). interromper()
+    cancela as registradas e recusa as que chegarem depois.
+    """
+
+    def __init__(self):
+        self._conexoes = set()
+        self._lock = threading.Lock()
+        self.cancelado = False
+
+    @contextmanager
+    def usando(self, conexao):
+        with self._lock:
+            if self.cancelado:
+                raise JobCancelado("Job cancelado")
+            self._conexoes.add(conexao)
+        try:
+            yield
+        finally:
+            # Devolvida ao pool, a conexão pode passar a outra requisição: não é mais do job
+            with self._lock:
+                self._conexoes.discard(conexao)
+
+    def interromper(self) -> None:
+        with self._lock:
+            self.cancelado = True
+            for conexao in self._conexoes:
+                _interromper(conexao)
+
+
+def _interromper(conexao) -> None:
+    """Interrompe a consulta em andamento: cancel() no psycopg2, interrupt() no sqlite3."""
+    for metodo in ("cancel", "interrupt"):
+        interromper = getattr(conexao, metodo, None)
+        if interromper is not None:
+            try:
+                interromper()
+            except Exception:
+                logger.exception("Não foi possível interromper a consulta do job")
+            return
+
+
+job_manager = JobManager(
+    workers=settings.jobs_workers,
+    max_pending=settings.jobs_max_pending,
+    retention_seconds=settings.jobs_retention_seconds,
+)
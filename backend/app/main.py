@@ -6,21 +6,69 @@
 
 
 
-from fastapi import FastAPI, Depends, HTTPException, status
+import os
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response, status
 from sqlalchemy.orm import Session
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordRequestForm  # Importamos o formulário de login
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from .config import settings
 from datetime import timedelta, date
-from sqlalchemy import func, distinct
 
-from . import crud, models, schemas, auth
-from .db import SessionLocal, engine
+from contextlib import asynccontextmanager
 
-models.Base.metadata.create_all(bind=engine)
+from . import crud, schemas, auth, export, migrations, profiling
+from .search import search_index
+from .catalog import dimension_catalog
+from . import jobs
+from .jobs import STATUS_CONCLUIDO, job_manager
+from .cache import QueryCache, make_query_key, principal_cache
+from .ratelimit import SlidingWindowLimiter, client_ip
+from .db import SessionLocal, AnalyticsSessionLocal, AsyncSessionLocal, AsyncAnalyticsSessionLocal, engine
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # O esquema é gerenciado por migrações (app/migrations.py / scripts/migrate.py)
+    if settings.auto_migrate:
+        aplicadas = migrations.run_migrations(engine)
+        if aplicadas:
+            print(f"Migrações aplicadas: {', '.join(aplicadas)}")
+    # Já sobe com o catálogo de dimensões calculado (depois só muda com carga nova)
+    db = SessionLocal()
+    try:
+        dimension_catalog.get(db)
+    except Exception as e:
+        print(f"Catálogo de dimensões não pré-carregado: {e}")
+    finally:
+        db.close()
+    # Arquivos de jobs vencidos (o diretório é compartilhado entre os workers)
+    job_manager.limpar_diretorio()
+    # Jobs em andamento de workers que morreram (senão seguram a deduplicação)
+    try:
+        job_manager.recuperar_orfaos()
+    except Exception as e:
+        print(f"Jobs órfãos não verificados: {e}")
+    yield
+    auth.password_hash_pool.shutdown()
+    job_manager.shutdown()
+
+
+app = FastAPI(lifespan=lifespan)
+
+# Cache dos resultados da análise dinâmica (por processo)
+query_cache = QueryCache(
+    max_entries=settings.query_cache_max_entries,
+    ttl_seconds=settings.query_cache_ttl_seconds,
+)
+
+# Rate limit do login: todas as tentativas por IP e as que falham por username
+login_limiter_ip = SlidingWindowLimiter(settings.login_rate_limit_ip, settings.login_rate_limit_window_seconds)
+login_limiter_username = SlidingWindowLimiter(
+    settings.login_rate_limit_username, settings.login_rate_limit_window_seconds
+)
 
 # --- Configuração do CORS (para permitir o front-end) ---
 origins = settings.cors_origins
@@ -31,8 +79,13 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Cabeçalhos próprios da API que o front-end precisa ler
+    expose_headers=["X-Next-Cursor", "X-Cache", "X-Query-Merge", "Server-Timing", "ETag", "X-Query-Engine"],
 )
 
+# Tempos por fase de cada requisição (Server-Timing) e métricas do /metrics
+app.add_middleware(profiling.ProfilingMiddleware)
+
 
 # --- Dependência para obter a sessão do banco de dados ---
 def get_db():
@@ -43,20 +96,70 @@ def get_db():
         db.close()
 
 
+async def _with_db(sync_fn, async_fn=None, analytics: bool = False):
+    """
+    Executa um acesso ao banco a partir de um endpoint async.
+    Com a camada async ligada usa AsyncSession (async_fn, ou sync_fn via run_sync),
+    sem ocupar thread; senão roda sync_fn com uma Session síncrona na threadpool.
+    O run_sync executa sync_fn no event loop: só serve para acessos curtos; o
+    que gasta CPU (análise dinâmica, histórico) tem async_fn próprio.
+    analytics=True usa o pool da análise dinâmica em vez do interativo.
+    """
+    async_session = AsyncAnalyticsSessionLocal if analytics else AsyncSessionLocal
+    if async_session is not None:
+        async with async_session() as adb:
+            if async_fn is not None:
+                return await async_fn(adb)
+            return await adb.run_sync(sync_fn)
+
+    session_factory = AnalyticsSessionLocal if analytics else SessionLocal
+
+    def _run():
+        db = session_factory()
+        try:
+            return sync_fn(db)
+        finally:
+            db.close()
+    return await run_in_threadpool(_run)
+
+
 # --- Endpoint de Login ---
+def _too_many_attempts(retry_after: int):
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail="Muitas tentativas de login, tente novamente mais tarde.",
+        headers={"Retry-After": str(retry_after)},
+    )
+
+
 @app.post("/token", response_model=schemas.Token)
-def login_for_access_token(db: Session = Depends(get_db), form_data: OAuth2PasswordRequestForm = Depends()):
+async def login_for_access_token(request: Request, form_data: OAuth2PasswordRequestForm = Depends()):
     """
     Recebe username e password e retorna um Token JWT.
+    O bcrypt roda no pool de processos do auth (fora da threadpool) e as
+    tentativas que falham são limitadas por IP e por username (429 com
+    Retry-After); logins corretos não contam.
     """
-    user = crud.get_user_by_username(db, username=form_data.username)
+    ip = client_ip(
+        request.client.host if request.client else None,
+        request.headers.get("x-forwarded-for"),
+        settings.forwarded_allow_ips.split(","),
+    )
+    espera = login_limiter_ip.check(ip) or login_limiter_username.check(form_data.username)
+    if espera is not None:
+        raise _too_many_attempts(espera)
 
-    if not user or not auth.verify_password(form_data.password, user.hashed_password):
+    user = await _with_db(lambda db: crud.get_user_by_username(db, username=form_data.username))
+
+    if not user or not await auth.password_hash_pool.verify(form_data.password, user.hashed_password):
+        login_limiter_ip.hit(ip)
+        login_limiter_username.hit(form_data.username)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    login_limiter_username.reset(form_data.username)
 
     access_token_expires = timedelta(minutes=auth.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = auth.create_access_token(
@@ -66,11 +169,22 @@ def login_for_access_token(db: Session = Depends(get_db), form_data: OAuth2Passw
     return {"access_token": access_token, "token_type": "bearer"}
 
 
+def _user_version() -> int:
+    db = SessionLocal()
+    try:
+        return crud.get_user_version(db)
+    finally:
+        db.close()
+
+
 # ---  Função para obter o usuario logado ---
-def get_current_user(db: Session = Depends(get_db), token: str = Depends(auth.oauth2_scheme)):
+def get_current_user(token: str = Depends(auth.oauth2_scheme)):
     """
     Verifica o token e retorna os dados do usuário.
     Esta função será nosso "segurança" de porta.
+    O usuário fica em cache por token (principal_cache): requisições seguidas
+    com o mesmo token não abrem sessão nem pegam conexão do pool (a não ser
+    a leitura periódica da versão dos usuários, que traz as desativações).
     """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -86,69 +200,422 @@ def get_current_user(db: Session = Depends(get_db), token: str = Depends(auth.oa
     except auth.JWTError:
         raise credentials_exception
 
-    user = crud.get_user_by_username(db, username=token_data.username)
-    if user is None:
-        raise credentials_exception
-    return user
+    with profiling.fase("auth"):
+        principal_cache.check_revocations(_user_version)
+        user = principal_cache.get(token)
+        if user is not None:
+            return user
+
+        db = SessionLocal()
+        try:
+            db_user = crud.get_user_by_username(db, username=token_data.username)
+            if db_user is None or db_user.is_active is False:
+                raise credentials_exception
+            user = schemas.User.model_validate(db_user)
+        finally:
+            db.close()
+        principal_cache.set(token, user, payload.get("exp"))
+        return user
 
 
 # --- Endpoint de Produtos PROTEGIDO ---
+@app.post("/api/products/batch", response_model=schemas.ProductBatchResponse)
+async def read_products_batch(
+        batch: schemas.ProductBatchRequest,
+        current_user: schemas.User = Depends(get_current_user)
+):
+    """
+    Vários produtos (com histórico) numa chamada só: uma query para os
+    produtos e outra para os históricos, em vez de uma requisição por SKU.
+    """
+    if not batch.codigos:
+        raise HTTPException(status_code=400, detail="Informe ao menos um código de produto.")
+    if len(batch.codigos) > settings.products_batch_max_codes:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Máximo de {settings.products_batch_max_codes} códigos por chamada.",
+        )
+    if batch.agrupar is not None and batch.agrupar not in crud.HISTORY_AGRUPAMENTOS:
+        raise HTTPException(status_code=400, detail=f"agrupar inválido: {batch.agrupar}")
+
+    encontrados = await _with_db(lambda db: crud.get_products_with_history(
+        db, batch.codigos, data_inicial=batch.data_inicial, data_final=batch.data_final, agrupar=batch.agrupar,
+    ))
+    produtos = [
+        schemas.Product(
+            id=p.id, product_code=p.product_code, product_name=p.product_name,
+            created_at=p.created_at, history=historico,
+        )
+        for p, historico in encontrados
+    ]
+    codigos_encontrados = {p.product_code for p in produtos}
+    return schemas.ProductBatchResponse(
+        produtos=produtos,
+        nao_encontrados=[c for c in dict.fromkeys(batch.codigos) if c not in codigos_encontrados],
+    )
+
+
 @app.get("/api/products/{product_code}", response_model=schemas.Product)
-def read_product(
+async def read_product(
         product_code: str,
-        db: Session = Depends(get_db),
+        response: Response,
+        data_inicial: Optional[date] = None,
+        data_final: Optional[date] = None,
+        apos: Optional[date] = Query(None, description="Cursor: data do último item da página anterior"),
+        limite: Optional[int] = Query(None, ge=1, le=settings.product_history_max_limit),
+        agrupar: Optional[str] = Query(None, pattern="^(semana|mes)$"),
         current_user: schemas.User = Depends(get_current_user)
 ):
     """
     Endpoint para buscar um produto.
+    O histórico pode ser recortado por período (data_inicial/data_final),
+    paginado (limite + apos, com o próximo cursor no cabeçalho X-Next-Cursor)
+    e agrupado por semana ou mês. Sem parâmetros vem o histórico completo.
     """
-    db_product = crud.get_product_by_code(db, product_code=product_code)
-    if db_product is None:
+    pagina = dict(data_inicial=data_inicial, data_final=data_final, apos=apos, limite=limite, agrupar=agrupar)
+    resultado = await _with_db(
+        lambda db: crud.get_product_history_page(db, product_code, **pagina),
+        lambda adb: crud.get_product_history_page_async(adb, product_code, **pagina),
+    )
+    if resultado is None:
         raise HTTPException(status_code=404, detail="Produto não encontrado")
-    return db_product
+
+    db_product, historico, proximo_cursor = resultado
+    if proximo_cursor is not None:
+        response.headers["X-Next-Cursor"] = proximo_cursor.isoformat()
+    return schemas.Product(
+        id=db_product.id,
+        product_code=db_product.product_code,
+        product_name=db_product.product_name,
+        created_at=db_product.created_at,
+        history=historico,
+    )
 
 
 
+# --- Busca de produtos (autocomplete) ---
+@app.get("/api/search/produtos", response_model=List[schemas.DimProduto])
+async def search_products(
+        q: str = Query(..., min_length=1, max_length=100),
+        limite: int = Query(10, ge=1, le=50),
+        current_user: schemas.User = Depends(get_current_user)
+):
+    """
+    Busca por prefixo e aproximada (trigramas) no código, nome, marca e
+    fornecedor da dim_produto, servida pelo índice em memória (app/search.py).
+    """
+    return await _with_db(lambda db: search_index.search(db, q, limite))
+
+
+# --- Catálogo de dimensões (valores para os filtros) ---
+def _etag_corresponde(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    If-None-Match com comparação fraca (RFC 9110): "*" casa com qualquer
+    representação e W/"x" vale o mesmo que "x" (proxies e CDNs enfraquecem o
+    ETag ao comprimir a resposta).
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaco = etag[2:] if etag.startswith("W/") else etag
+    for candidato in if_none_match.split(","):
+        candidato = candidato.strip()
+        if candidato.startswith("W/"):
+            candidato = candidato[2:]
+        if candidato == opaco:
+            return True
+    return False
+
+
+@app.get("/api/catalogo/dimensoes")
+async def get_dimension_catalog(
+        request: Request,
+        dimensoes: Optional[List[str]] = Query(None, description="Só estas dimensões (padrão: todas)"),
+        current_user: schemas.User = Depends(get_current_user)
+):
+    """
+    Valores distintos (e quantidade de produtos/lojas) de cada dimensão aceita
+    em 'dimensoes'/'filtros' do /api/query. Responde com ETag; se o cliente
+    mandar o mesmo valor em If-None-Match recebe 304 sem corpo.
+    """
+    etag, conteudo = await _with_db(dimension_catalog.get)
+    if dimensoes:
+        etag = f'{etag[:-1]}-{"+".join(sorted(dimensoes))}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if _etag_corresponde(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    if dimensoes:
+        conteudo = {**conteudo, "dimensoes": {d: v for d, v in conteudo["dimensoes"].items() if d in dimensoes}}
+    return JSONResponse(conteudo, headers=headers)
+
+
 # --- NOVO ENDPOINT PARA ANÁLISE DINÂMICA ---
 
+def _stream_rows(colunas: List[str], lotes, formato: str):
+    """Gera o corpo da resposta (NDJSON ou array JSON) lote a lote."""
+    if formato == "json":
+        yield b"["
+    primeiro = True
+    for lote in lotes:
+        linhas = [export.json_bytes(dict(zip(colunas, row))) for row in lote]
+        if not linhas:
+            continue
+        if formato == "json":
+            yield (b"" if primeiro else b",") + b",".join(linhas)
+        else:
+            yield b"\n".join(linhas) + b"\n"
+        primeiro = False
+    if formato == "json":
+        yield b"]"
+
+
+def _close_when_done(corpo, stream_db: Session):
+    """Repassa o corpo do streaming e fecha a sessão própria dele ao terminar."""
+    try:
+        yield from corpo
+    finally:
+        stream_db.close()
+
+
+def _open_query_stream(query_request: schemas.QueryRequest, chunk_size: int):
+    """
+    Abre uma sessão própria e já executa a query em modo cursor.
+    A sessão do get_db fecha antes do corpo ser enviado, então o streaming usa a sua
+    (do pool analítico).
+    """
+    stream_db = AnalyticsSessionLocal()
+    try:
+        colunas, lotes = crud.stream_dynamic_query(stream_db, query_request, chunk_size=chunk_size)
+    except Exception:
+        stream_db.close()
+        raise
+    return stream_db, colunas, lotes
+
+
+def _answer_query(db: Session, query_request: schemas.QueryRequest, detalhes: Dict[str, Any]):
+    """
+    Resolve o pedido pelo cache ou executando a query dinâmica (numa sessão só).
+    Devolve (colunas, linhas em tuplas), que é também o que fica no cache.
+    """
+    # Pedidos equivalentes reaproveitam o resultado enquanto a versão dos dados não mudar
+    with profiling.fase("cache"):
+        cache_key = make_query_key(query_request)
+        data_version = crud.get_data_state(db).versao
+        results = query_cache.get(cache_key, data_version)
+    if results is not None:
+        detalhes["cache"] = "HIT"
+        return results
+
+    # Chama nossa nova função do crud.py para fazer o trabalho pesado
+    results = crud.run_dynamic_query_rows(db, query_request=query_request, detalhes=detalhes)
+    query_cache.set(cache_key, results, data_version)
+    detalhes["cache"] = "MISS"
+    return results
+
+
+async def _answer_query_async(adb, query_request: schemas.QueryRequest, detalhes: Dict[str, Any]):
+    """_answer_query na AsyncSession (camada async ligada)."""
+    with profiling.fase("cache"):
+        cache_key = make_query_key(query_request)
+        data_version = (await adb.run_sync(crud.get_data_state)).versao
+        results = query_cache.get(cache_key, data_version)
+    if results is not None:
+        detalhes["cache"] = "HIT"
+        return results
+
+    results = await crud.run_dynamic_query_rows_async(adb, query_request=query_request, detalhes=detalhes)
+    query_cache.set(cache_key, results, data_version)
+    detalhes["cache"] = "MISS"
+    return results
+
+
+def _describe_query(query_request: schemas.QueryRequest, current_user: schemas.User,
+                    detalhes: Dict[str, Any]) -> Dict[str, Any]:
+    """Resumo do pedido que acompanha o perfil no log de consultas lentas."""
+    return {
+        "usuario": current_user.username,
+        "dimensoes": query_request.dimensoes,
+        "metricas": [m.nome for m in query_request.metricas],
+        "filtros": query_request.filtros,
+        "periodo": [query_request.data_inicial, query_request.data_final],
+        **detalhes,
+    }
+
+
 @app.post("/api/query", response_model=List[Dict[str, Any]])
-def run_analysis_query(
+async def run_analysis_query(
     query_request: schemas.QueryRequest,
-    db: Session = Depends(get_db),
+    stream: Optional[str] = Query(None, pattern="^(ndjson|json)$"),
+    formato: str = Query("linhas", pattern="^(linhas|colunar)$"),
     current_user: schemas.User = Depends(get_current_user)
 ):
     """
     Recebe um pedido de análise dinâmica, executa a consulta no Data Mart
     e retorna o resultado agregado.
+    Com ?stream=ndjson (uma linha JSON por registro) ou ?stream=json (array
+    enviado em partes) as linhas são enviadas conforme saem do cursor.
+    Sem stream o JSON é montado direto das tuplas do resultado (sem validar
+    linha a linha); ?formato=colunar devolve {"colunas", "total", "valores"}
+    com um array por coluna, bem menor em resultados largos.
+    Os tempos por fase (auth, cache, plano, sql_*, merge, conversao,
+    serializacao) saem no cabeçalho Server-Timing.
     """
-    # Chama nossa nova função do crud.py para fazer o trabalho pesado
-    results = crud.run_dynamic_query(db, query_request=query_request)
-    return results
+    if stream:
+        stream_db, colunas, lotes = await run_in_threadpool(
+            _open_query_stream, query_request, settings.query_stream_chunk_size
+        )
+        media_type = "application/x-ndjson" if stream == "ndjson" else "application/json"
+        return StreamingResponse(
+            _close_when_done(_stream_rows(colunas, lotes, stream), stream_db), media_type=media_type
+        )
+
+    detalhes = {}
+    colunas, linhas = await _with_db(
+        lambda db: _answer_query(db, query_request, detalhes),
+        lambda adb: _answer_query_async(adb, query_request, detalhes),
+        analytics=True,
+    )
+    headers = {"X-Cache": detalhes["cache"]}
+    if "merge" in detalhes:
+        headers["X-Query-Merge"] = detalhes["merge"]
+    if "motor" in detalhes:
+        headers["X-Query-Engine"] = detalhes["motor"]
+    with profiling.fase("serializacao"):
+        corpo = export.json_resultado(colunas, linhas, formato)
+    profiling.registrar_linhas("resultado", len(linhas))
+    profiling.marcar_fim_endpoint(_describe_query(query_request, current_user, detalhes))
+    return Response(content=corpo, media_type="application/json", headers=headers)
+
+
+@app.post("/api/query/perfil")
+async def profile_analysis_query(
+    query_request: schemas.QueryRequest,
+    current_user: schemas.User = Depends(get_current_user)
+):
+    """
+    Executa a análise sem cache e devolve só o diagnóstico: tempos e linhas
+    por fase e, no PostgreSQL, o EXPLAIN (ANALYZE, BUFFERS) de cada consulta.
+    """
+    perfil = profiling.perfil_atual()
+    perfil.explain = True
+    detalhes = {}
+    _, linhas = await _with_db(
+        lambda db: crud.run_dynamic_query_rows(db, query_request=query_request, detalhes=detalhes),
+        lambda adb: crud.run_dynamic_query_rows_async(adb, query_request=query_request, detalhes=detalhes),
+        analytics=True,
+    )
+    profiling.marcar_fim_endpoint(_describe_query(query_request, current_user, detalhes))
+    return {
+        **detalhes,
+        "linhas_resultado": len(linhas),
+        "fases_ms": {nome: round(ms, 2) for nome, ms in perfil.fases.items()},
+        "linhas": perfil.linhas,
+        "planos": perfil.planos,
+    }
+
+
+# --- Análises em segundo plano (jobs) ---
+@app.post("/api/jobs", status_code=status.HTTP_202_ACCEPTED)
+def submit_analysis_job(
+    query_request: schemas.QueryRequest,
+    response: Response,
+    formato: str = Query("linhas", pattern="^(linhas|colunar)$"),
+    current_user: schemas.User = Depends(get_current_user)
+):
+    """
+    Enfileira a análise e responde na hora com o id do job (Location aponta
+    para o status). Para relatórios que passam do timeout do balanceador.
+    Um pedido igual a outro ainda em execução devolve o mesmo job.
+    """
+    job = job_manager.submit(query_request, formato, current_user.username)
+    response.headers["Location"] = f"/api/jobs/{job['id']}"
+    return job
+
+
+@app.get("/api/jobs/{job_id}")
+def get_analysis_job(job_id: str, current_user: schemas.User = Depends(get_current_user)):
+    """Status do job: pendente, executando, concluido, erro ou cancelado."""
+    return job_manager.get(job_id, current_user.username)
+
+
+@app.get("/api/jobs/{job_id}/resultado")
+def download_analysis_job(job_id: str, current_user: schemas.User = Depends(get_current_user)):
+    """Resultado do job concluído (o mesmo JSON do /api/query), lido do disco."""
+    job = job_manager.get(job_id, current_user.username)
+    if job["status"] != STATUS_CONCLUIDO:
+        raise HTTPException(status_code=409, detail=f"Job {job['status']}: resultado indisponível.")
+    arquivo = jobs.arquivo(job_id)
+    if not os.path.exists(arquivo):
+        raise HTTPException(status_code=410, detail="Resultado do job não está mais disponível.")
+    return FileResponse(arquivo, media_type="application/json")
+
+
+@app.delete("/api/jobs/{job_id}")
+def cancel_analysis_job(job_id: str, current_user: schemas.User = Depends(get_current_user)):
+    """Cancela o job (se mais ninguém esperar por ele) ou descarta o resultado guardado."""
+    return job_manager.cancel(job_id, current_user.username)
+
+
+@app.post("/api/query/export")
+def export_analysis_query(
+    query_request: schemas.QueryRequest,
+    formato: str = Query("arrow", pattern="^(arrow|parquet)$"),
+    current_user: schemas.User = Depends(get_current_user)
+):
+    """
+    Mesma análise do /api/query, mas devolvida em formato colunar
+    (Arrow IPC stream ou Parquet), montado lote a lote a partir do cursor.
+    """
+    if not export.disponivel():
+        raise HTTPException(status_code=501, detail="Exportação colunar indisponível (pyarrow não instalado).")
+
+    stream_db, colunas, lotes = _open_query_stream(query_request, settings.query_export_batch_size)
+    return StreamingResponse(
+        _close_when_done(export.iter_export(colunas, lotes, formato), stream_db),
+        media_type=export.MEDIA_TYPES[formato],
+        headers={"Content-Disposition": f'attachment; filename="analise.{export.EXTENSOES[formato]}"'},
+    )
+
+
+@app.get("/metrics", include_in_schema=False)
+def get_metrics():
+    """Métricas no formato texto do Prometheus (requisições, fases da análise, caches)."""
+    if not settings.metrics_enabled:
+        raise HTTPException(status_code=404, detail="Not Found")
+    cache = query_cache.stats()
+    extras = {
+        "cache_consultas_hits": cache["hits"],
+        "cache_consultas_misses": cache["misses"],
+        "cache_consultas_entradas": cache["entradas"],
+        "hash_senha_em_fila": auth.password_hash_pool.stats()["em_fila"],
+    }
+    for situacao, quantidade in job_manager.stats()["por_status"].items():
+        extras[f"jobs_{situacao}"] = quantidade
+    return PlainTextResponse(profiling.metrics.render(extras), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/api/cache/stats")
+def get_cache_stats(current_user: schemas.User = Depends(get_current_user)):
+    """Contadores do cache de consultas (hits, misses, tamanho) e do cache de autenticação."""
+    return {**query_cache.stats(), "autenticacao": principal_cache.stats()}
+
+
+@app.get("/api/auth/stats")
+def get_auth_stats(current_user: schemas.User = Depends(get_current_user)):
+    """Fila/uso do pool de verificação de senha e bloqueios do rate limit do login."""
+    return {
+        "hash_senha": auth.password_hash_pool.stats(),
+        "rate_limit_ip": login_limiter_ip.stats(),
+        "rate_limit_username": login_limiter_username.stats(),
+    }
 
 
 @app.get("/api/kpis/gerais")
-def get_geral_kpis(db: Session = Depends(get_db), current_user: schemas.User = Depends(get_current_user)):
+async def get_geral_kpis(current_user: schemas.User = Depends(get_current_user)):
     try:
-        hoje = date.today()
-        primeiro_dia_mes = hoje.replace(day=1)
-
-        # A query agora é MUITO mais leve!
-        resultado = db.query(
-            func.sum(models.KpiResumoDiario.total_venda_liquida),
-            func.max(models.KpiResumoDiario.lojas_ativas) # Pega o pico de lojas ativas no mês
-        ).filter(
-            models.KpiResumoDiario.data >= primeiro_dia_mes,
-            models.KpiResumoDiario.data <= hoje
-        ).first()
-
-        vendas_mes_atual = resultado[0] or 0
-        lojas_ativas_no_mes = resultado[1] or 0
-
-        return {
-            "total_lojas": int(lojas_ativas_no_mes),
-            "vendas_mes_atual": float(vendas_mes_atual),
-            "meta_exemplo": 11390000
-        }
+        return await _with_db(crud.get_geral_kpis, crud.get_geral_kpis_async)
     except Exception as e:
         print(f"Erro ao buscar KPIs: {e}")
-        raise HTTPException(status_code=500, detail="Erro interno ao buscar KPIs.")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail="Erro interno ao buscar KPIs.")
@@ -0,0 +1,181 @@
+# backend/app/migrations.py
+# Migrações do esquema, aplicadas em ordem e registradas em 'schema_migrations'.
+# Substitui o Base.metadata.create_all que rodava no import do main.py.
+from datetime import date, timedelta
+from typing import List
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection, Engine
+
+from . import models
+
+
+def month_partition_ddl(tabela: str, mes: date) -> str:
+    """DDL da partição mensal de 'tabela' que contém 'mes' (ex.: fato_vendas_2025_01)."""
+    inicio = mes.replace(day=1)
+    fim = (inicio + timedelta(days=32)).replace(day=1)
+    return (
+        f"CREATE TABLE IF NOT EXISTS {tabela}_{inicio:%Y_%m} PARTITION OF {tabela} "
+        f"FOR VALUES FROM ('{inicio}') TO ('{fim}');"
+    )
+
+
+def month_partitions_ddl(tabela: str, data_inicial: date, data_final: date) -> List[str]:
+    """DDL de todas as partições mensais entre as duas datas (inclusive)."""
+    ddls = []
+    mes = data_inicial.replace(day=1)
+    while mes <= data_final:
+        ddls.append(month_partition_ddl(tabela, mes))
+        mes = (mes + timedelta(days=32)).replace(day=1)
+    return ddls
+
+
+def _is_postgres(conn: Connection) -> bool:
+    return conn.dialect.name == "postgresql"
+
+
+# --- Migrações ---
+
+def _0001_esquema_inicial(conn: Connection):
+    # Cria as tabelas que ainda não existem (bancos antigos já têm a maioria)
+    models.Base.metadata.create_all(bind=conn)
+
+
+def _particionar_por_mes(conn: Connection, tabela: str, coluna: str):
+    """
+    Converte 'tabela' em particionada por RANGE(coluna), com uma partição por
+    mês já existente nos dados mais a DEFAULT, e copia os dados para ela.
+    """
+    if not _is_postgres(conn):
+        return
+
+    relkind = conn.execute(
+        text("SELECT relkind FROM pg_class WHERE oid = to_regclass(:tabela)"), {"tabela": tabela}
+    ).scalar()
+
+    if relkind == "r":
+        legado = f"{tabela}_legado"
+        conn.execute(text(f"ALTER TABLE {tabela} RENAME TO {legado}"))
+        conn.execute(text(f"ALTER TABLE {legado} RENAME CONSTRAINT {tabela}_pkey TO {legado}_pkey"))
+        conn.execute(text(
+            f"CREATE TABLE {tabela} (LIKE {legado} INCLUDING DEFAULTS) PARTITION BY RANGE ({coluna})"
+        ))
+        # A sequence do SERIAL passa para a tabela nova antes do DROP da antiga
+        conn.execute(text(f"ALTER SEQUENCE {tabela}_id_seq OWNED BY {tabela}.id"))
+        conn.execute(text(f"ALTER TABLE {tabela} ADD PRIMARY KEY (id, {coluna})"))
+        conn.execute(text(f"ALTER TABLE {tabela} ADD FOREIGN KEY (produto_id) REFERENCES dim_produto (id)"))
+        conn.execute(text(f"ALTER TABLE {tabela} ADD FOREIGN KEY (loja_id) REFERENCES dim_loja (id)"))
+
+        inicio, fim = conn.execute(text(f"SELECT min({coluna}), max({coluna}) FROM {legado}")).one()
+        if inicio is not None:
+            for ddl in month_partitions_ddl(tabela, inicio, fim):
+                conn.execute(text(ddl))
+        conn.execute(text(f"CREATE TABLE IF NOT EXISTS {tabela}_default PARTITION OF {tabela} DEFAULT"))
+        conn.execute(text(f"INSERT INTO {tabela} SELECT * FROM {legado}"))
+        conn.execute(text(f"DROP TABLE {legado}"))
+
+
+def _0002_particionar_fatos(conn: Connection):
+    _particionar_por_mes(conn, "fato_vendas", "data_venda")
+    _particionar_por_mes(conn, "fato_estoque", "data_snapshot")
+
+
+def _0003_indices_fatos(conn: Connection):
+    # Mesmos nomes declarados em models.py; os índices da tabela antiga
+    # foram embora com o DROP da 0002 e são recriados aqui na particionada
+    if not _is_postgres(conn):
+        return
+    for ddl in (
+        "CREATE INDEX IF NOT EXISTS ix_fato_vendas_data_brin ON fato_vendas USING brin (data_venda)",
+        "CREATE INDEX IF NOT EXISTS ix_fato_vendas_produto_data ON fato_vendas (produto_id, data_venda) "
+        "INCLUDE (quantidade_vendida, venda_liquida)",
+        "CREATE INDEX IF NOT EXISTS ix_fato_vendas_loja_data ON fato_vendas (loja_id, data_venda) "
+        "INCLUDE (quantidade_vendida, venda_liquida)",
+        "CREATE INDEX IF NOT EXISTS ix_fato_estoque_data_brin ON fato_estoque USING brin (data_snapshot)",
+        "CREATE INDEX IF NOT EXISTS ix_fato_estoque_snapshot ON fato_estoque (data_snapshot, produto_id, loja_id) "
+        "INCLUDE (closing_stock_quantity, closing_stock_sale_price)",
+        # Chave do upsert da carga incremental. Cargas completas antigas podiam
+        # gravar o mesmo produto/dia duas vezes: fica a linha carregada por último
+        "DELETE FROM product_history h USING product_history d "
+        "WHERE d.product_id = h.product_id AND d.date = h.date AND d.id > h.id",
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_product_history_product_date ON product_history (product_id, date)",
+        "ANALYZE fato_vendas",
+        "ANALYZE fato_estoque",
+    ):
+        conn.execute(text(ddl))
+
+
+def _0004_catalogo_snapshots(conn: Connection):
+    models.CatalogoSnapshotEstoque.__table__.create(bind=conn, checkfirst=True)
+    conn.execute(text(
+        "INSERT INTO catalogo_snapshot_estoque (data_snapshot, linhas) "
+        "SELECT data_snapshot, count(*) FROM fato_estoque GROUP BY data_snapshot"
+    ))
+
+
+def _0005_jobs_analise(conn: Connection):
+    models.JobAnalise.__table__.create(bind=conn, checkfirst=True)
+
+
+def _0006_versao_fatos(conn: Connection):
+    colunas = {c["name"] for c in inspect(conn).get_columns("versao_dados")}
+    if "versao_fatos" not in colunas:
+        conn.execute(text("ALTER TABLE versao_dados ADD COLUMN versao_fatos INTEGER NOT NULL DEFAULT 0"))
+        # Os rollups carimbados até aqui seguiam a versão geral
+        conn.execute(text("UPDATE versao_dados SET versao_fatos = versao"))
+
+
+def _0007_versao_usuarios(conn: Connection):
+    colunas = {c["name"] for c in inspect(conn).get_columns("versao_dados")}
+    if "versao_usuarios" not in colunas:
+        conn.execute(text("ALTER TABLE versao_dados ADD COLUMN versao_usuarios INTEGER NOT NULL DEFAULT 0"))
+
+
+def _0008_jobs_worker(conn: Connection):
+    colunas = {c["name"] for c in inspect(conn).get_columns("jobs_analise")}
+    if "worker" not in colunas:
+        conn.execute(text("ALTER TABLE jobs_analise ADD COLUMN worker VARCHAR(100)"))
+
+
+MIGRATIONS = [
+    ("0001_esquema_inicial", _0001_esquema_inicial),
+    ("0002_particionar_fatos", _0002_particionar_fatos),
+    ("0003_indices_fatos", _0003_indices_fatos),
+    ("0004_catalogo_snapshots", _0004_catalogo_snapshots),
+    ("0005_jobs_analise", _0005_jobs_analise),
+    ("0006_versao_fatos", _0006_versao_fatos),
+    ("0007_versao_usuarios", _0007_versao_usuarios),
+    ("0008_jobs_worker", _0008_jobs_worker),
+]
+
+
+def applied_migrations(conn: Connection) -> List[str]:
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        "versao VARCHAR(100) PRIMARY KEY, aplicada_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP)"
+    ))
+    return [v for (v,) in conn.execute(text("SELECT versao FROM schema_migrations ORDER BY versao"))]
+
+
+def run_migrations(engine: Engine) -> List[str]:
+    """
+    Aplica as migrações pendentes numa única transação (o DDL do PostgreSQL é
+    transacional, então uma falha não deixa o esquema pela metade).
+    Devolve as versões aplicadas agora.
+    """
+    aplicadas_agora = []
+    with engine.begin() as conn:
+        if _is_postgres(conn):
+            # Vários workers do uvicorn sobem juntos: só um migra por vez
+            conn.execute(text("SELECT pg_advisory_xact_lock(hashtext('schema_migrations'))"))
+            # O pool interativo tem statement_timeout curto; a cópia dos fatos não pode cair nele
+            conn.execute(text("SET LOCAL statement_timeout = 0"))
+        ja_aplicadas = set(applied_migrations(conn))
+
+        for versao, migracao in MIGRATIONS:
+            if versao in ja_aplicadas:
+                continue
+            migracao(conn)
+            conn.execute(text("INSERT INTO schema_migrations (versao) VALUES (:versao)"), {"versao": versao})
+            aplicadas_agora.append(versao)
+    return aplicadas_agora
@@ -1,6 +1,6 @@
 
 # app/models.py
-from sqlalchemy import Column, Integer, String, Date, ForeignKey, DateTime, Boolean, Numeric
+from sqlalchemy import Column, Integer, String, Date, ForeignKey, DateTime, Boolean, Numeric, UniqueConstraint, Index, Text, JSON, text
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from .db import Base
@@ -18,6 +18,8 @@ class Product(Base):
 # em models.py
 class ProductHistory(Base):
     __tablename__ = "product_history"
+    # Um registro por produto e dia (chave do upsert da carga incremental)
+    __table_args__ = (UniqueConstraint("product_id", "date", name="uq_product_history_product_date"),)
 
     id = Column(Integer, primary_key=True, index=True)
     date = Column(Date, nullable=False)
@@ -59,8 +61,19 @@ class DimLoja(Base):
     store_id = Column(Integer, unique=True, nullable=False)
     store_name = Column(String(255))
 
+# No PostgreSQL os fatos são particionados por mês (RANGE na data) pela migração
+# 0002 de app/migrations.py, que também troca a chave primária por (id, data);
+# as partições de meses novos são criadas pelo ETL (scripts/etl_utils.py).
+
 class FatoVendas(Base):
     __tablename__ = "fato_vendas"
+    __table_args__ = (
+        Index("ix_fato_vendas_data_brin", "data_venda", postgresql_using="brin"),
+        Index("ix_fato_vendas_produto_data", "produto_id", "data_venda",
+              postgresql_include=["quantidade_vendida", "venda_liquida"]),
+        Index("ix_fato_vendas_loja_data", "loja_id", "data_venda",
+              postgresql_include=["quantidade_vendida", "venda_liquida"]),
+    )
     id = Column(Integer, primary_key=True, autoincrement=True)
     data_venda = Column(Date, nullable=False)
     produto_id = Column(Integer, ForeignKey('dim_produto.id'))
@@ -74,6 +87,11 @@ class FatoVendas(Base):
 
 class FatoEstoque(Base):
     __tablename__ = "fato_estoque"
+    __table_args__ = (
+        Index("ix_fato_estoque_data_brin", "data_snapshot", postgresql_using="brin"),
+        Index("ix_fato_estoque_snapshot", "data_snapshot", "produto_id", "loja_id",
+              postgresql_include=["closing_stock_quantity", "closing_stock_sale_price"]),
+    )
     id = Column(Integer, primary_key=True, autoincrement=True)
     data_snapshot = Column(Date, nullable=False)
     produto_id = Column(Integer, ForeignKey('dim_produto.id'))
@@ -82,8 +100,106 @@ class FatoEstoque(Base):
     closing_stock_cost = Column(Numeric(12, 2))
     closing_stock_sale_price = Column(Numeric(12, 2))
 
+class CatalogoSnapshotEstoque(Base):
+    """Datas de snapshot disponíveis em fato_estoque, mantidas pelo ETL."""
+    __tablename__ = "catalogo_snapshot_estoque"
+    data_snapshot = Column(Date, primary_key=True)
+    linhas = Column(Integer, nullable=False)
+    atualizado_em = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
 class KpiResumoDiario(Base):
     __tablename__ = "kpi_resumo_diario"
     data = Column(Date, primary_key=True)
     total_venda_liquida = Column(Numeric)
-    lojas_ativas = Column(Integer)
\ No newline at end of file
+    lojas_ativas = Column(Integer)
+
+# --- TABELAS DE AGREGADOS (ROLLUPS MENSAIS DE VENDAS) ---
+# Recalculadas pelo ETL (scripts/etl_utils.refresh_rollups). A coluna 'mes'
+# guarda o primeiro dia do mês.
+
+class AggVendasMesLoja(Base):
+    __tablename__ = "agg_vendas_mes_loja"
+    mes = Column(Date, primary_key=True)
+    loja_id = Column(Integer, ForeignKey('dim_loja.id'), primary_key=True)
+    quantidade_vendida = Column(Integer)
+    venda_liquida = Column(Numeric(14, 2))
+
+class AggVendasMesLojaDepartamento(Base):
+    __tablename__ = "agg_vendas_mes_loja_departamento"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    mes = Column(Date, nullable=False, index=True)
+    loja_id = Column(Integer, ForeignKey('dim_loja.id'), nullable=False)
+    departamento = Column(String(100))
+    quantidade_vendida = Column(Integer)
+    venda_liquida = Column(Numeric(14, 2))
+
+class AggVendasMesLojaProduto(Base):
+    __tablename__ = "agg_vendas_mes_loja_produto"
+    mes = Column(Date, primary_key=True)
+    loja_id = Column(Integer, ForeignKey('dim_loja.id'), primary_key=True)
+    produto_id = Column(Integer, ForeignKey('dim_produto.id'), primary_key=True)
+    quantidade_vendida = Column(Integer)
+    venda_liquida = Column(Numeric(14, 2))
+
+class ControleRollups(Base):
+    """Versão dos fatos (VersaoDados.versao_fatos) refletida por cada tabela de agregado."""
+    __tablename__ = "controle_rollups"
+    tabela = Column(String(100), primary_key=True)
+    versao_dados = Column(Integer, nullable=False)
+    atualizado_em = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+class EtlWatermark(Base):
+    """Até onde cada tabela já foi carregada pelo ETL incremental."""
+    __tablename__ = "etl_watermark"
+    tabela = Column(String(100), primary_key=True)
+    ultima_data = Column(Date)
+    linhas_carregadas = Column(Integer)
+    carregado_em = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+class VersaoDados(Base):
+    """
+    Linha única com a versão dos dados, incrementada a cada carga do ETL (e
+    usada para descartar caches). 'versao_fatos' só muda com a carga do Data
+    Mart (fatos e dimensões): é a que os rollups e o retrato colunar seguem.
+    'versao_usuarios' muda quando um usuário é desativado/reativado: os workers
+    da API esvaziam o cache de autenticação ao vê-la mudar.
+    """
+    __tablename__ = "versao_dados"
+    id = Column(Integer, primary_key=True)
+    versao = Column(Integer, nullable=False, default=0)
+    versao_fatos = Column(Integer, nullable=False, default=0, server_default="0")
+    versao_usuarios = Column(Integer, nullable=False, default=0, server_default="0")
+    atualizado_em = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+class JobAnalise(Base):
+    """
+    Job do /api/jobs. Os metadados ficam no banco para que qualquer worker
+    responda por ele; o resultado fica em arquivo em settings.jobs_dir.
+    """
+    __tablename__ = "jobs_analise"
+    __table_args__ = (
+        # No máximo um job em andamento por pedido (deduplicação entre processos)
+        Index(
+            "uq_jobs_analise_chave_em_andamento", "chave", unique=True,
+            postgresql_where=text("status IN ('pendente', 'executando')"),
+            sqlite_where=text("status IN ('pendente', 'executando')"),
+        ),
+    )
+    id = Column(String(32), primary_key=True)
+    chave = Column(String(64), nullable=False)
+    formato = Column(String(10), nullable=False)
+    status = Column(String(12), nullable=False, index=True)
+    donos = Column(JSON, nullable=False)
+    criado_em = Column(DateTime(timezone=True), nullable=False)
+    iniciado_em = Column(DateTime(timezone=True))
+    concluido_em = Column(DateTime(timezone=True))
+    linhas = Column(Integer)
+    erro = Column(Text)
+    detalhes = Column(JSON)
+    # PID da conexão que executa a consulta (pg_cancel_backend a partir de outro processo)
+    backend_pid = Column(Integer)
+    # Processo (host:pid) que executa o job: se ele morrer, o job é dado como abandonado
+    worker = Column(String(100))
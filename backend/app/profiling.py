@@ -0,0 +1,259 @@
+# backend/app/profiling.py
+import bisect
+import contextvars
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+from .config import settings
+
+logger = logging.getLogger("analisador.consultas_lentas")
+
+
+class Perfil:
+    """
+    Tempos por fase (ms), linhas por fase e planos (EXPLAIN ANALYZE) de uma
+    requisição. Fica num contextvar, então é visto também pelo código que roda
+    na threadpool (run_in_threadpool copia o contexto) e pelo run_sync do async.
+    """
+
+    def __init__(self, explain: bool = False):
+        self.inicio = time.perf_counter()
+        self.fases: Dict[str, float] = {}
+        self.linhas: Dict[str, int] = {}
+        self.planos: List[Dict[str, Any]] = []
+        self.explain = explain
+        self.fim_endpoint: Optional[float] = None
+        # Preenchida pelos endpoints de análise: o perfil vai para métricas/log de lentas
+        self.consulta: Optional[Dict[str, Any]] = None
+        self._lock = threading.Lock()
+
+    def registrar(self, fase: str, ms: float, linhas: Optional[int] = None) -> None:
+        # Fases repetidas na mesma requisição somam
+        with self._lock:
+            self.fases[fase] = self.fases.get(fase, 0.0) + ms
+            if linhas is not None:
+                self.linhas[fase] = self.linhas.get(fase, 0) + linhas
+
+    def total_ms(self) -> float:
+        return (time.perf_counter() - self.inicio) * 1000
+
+    def server_timing(self) -> str:
+        """Ex.: "auth;dur=0.4, plano;dur=2.1, sql;dur=120.4, total;dur=130.2" (DevTools > Timing)."""
+        fases = {**self.fases, "total": self.total_ms()}
+        return ", ".join(f"{nome};dur={ms:.1f}" for nome, ms in fases.items())
+
+
+_perfil_atual: contextvars.ContextVar[Optional[Perfil]] = contextvars.ContextVar("perfil", default=None)
+
+
+def perfil_atual() -> Optional[Perfil]:
+    return _perfil_atual.get()
+
+
+@contextmanager
+def fase(nome: str):
+    """Soma o tempo do bloco na fase 'nome' do perfil atual (sem perfil não faz nada)."""
+    perfil = _perfil_atual.get()
+    if perfil is None:
+        yield
+        return
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        perfil.registrar(nome, (time.perf_counter() - inicio) * 1000)
+
+
+def registrar(nome: str, ms: float, linhas: Optional[int] = None) -> None:
+    """Registra uma fase medida fora do contexto (ex.: numa thread do pool de subconsultas)."""
+    perfil = _perfil_atual.get()
+    if perfil is not None:
+        perfil.registrar(nome, ms, linhas)
+
+
+def registrar_linhas(nome: str, linhas: int) -> None:
+    perfil = _perfil_atual.get()
+    if perfil is not None:
+        with perfil._lock:
+            perfil.linhas[nome] = perfil.linhas.get(nome, 0) + linhas
+
+
+def marcar_fim_endpoint(consulta: Optional[Dict[str, Any]] = None) -> None:
+    """
+    Marca o fim do endpoint; daí até o envio dos cabeçalhos conta como
+    'serializacao'. 'consulta' (descrição do pedido) faz o perfil ser
+    registrado nas métricas de análise e no log de consultas lentas.
+    """
+    perfil = _perfil_atual.get()
+    if perfil is not None:
+        perfil.fim_endpoint = time.perf_counter()
+        perfil.consulta = consulta
+
+
+def capturar_explain(db, nome: str, consulta) -> None:
+    """
+    Se o perfil atual pediu explain e o banco é PostgreSQL, roda
+    EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) da consulta e guarda o plano.
+    A consulta é executada de novo, por isso só acontece quando pedido.
+    """
+    perfil = _perfil_atual.get()
+    if perfil is None or not perfil.explain or db.get_bind().dialect.name != "postgresql":
+        return
+    compilada = consulta.compile(dialect=db.get_bind().dialect, compile_kwargs={"render_postcompile": True})
+    parametros = compilada.params
+    if compilada.positional:
+        parametros = tuple(compilada.params[nome_param] for nome_param in compilada.positiontup)
+    resultado = db.connection().exec_driver_sql(
+        f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {compilada}", parametros
+    ).scalar()
+    plano = json.loads(resultado) if isinstance(resultado, str) else resultado
+    perfil.planos.append({"fase": nome, "plano": plano})
+
+
+# --- Métricas no formato texto do Prometheus ---
+
+# Limites (segundos) dos buckets dos histogramas
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class _Histograma:
+    def __init__(self):
+        self.contagens = [0] * (len(BUCKETS) + 1)
+        self.soma = 0.0
+        self.total = 0
+
+    def observar(self, valor: float) -> None:
+        self.contagens[bisect.bisect_left(BUCKETS, valor)] += 1
+        self.soma += valor
+        self.total += 1
+
+
+def _rotulos(rotulos: Dict[str, Any]) -> str:
+    if not rotulos:
+        return ""
+    escapados = {k: str(v).replace("\\", "\\\\").replace('"', '\\"') for k, v in rotulos.items()}
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escapados.items()) + "}"
+
+
+class MetricsRegistry:
+    """
+    Contadores e histogramas em memória (por processo), expostos em /metrics
+    no formato texto do Prometheus. Sem dependência do prometheus_client.
+    """
+
+    def __init__(self):
+        self._contadores: Dict[str, Dict[tuple, float]] = {}
+        self._histogramas: Dict[str, Dict[tuple, _Histograma]] = {}
+        self._ajuda: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def contar(self, nome: str, ajuda: str, valor: float = 1, **rotulos) -> None:
+        chave = tuple(sorted(rotulos.items()))
+        with self._lock:
+            self._ajuda.setdefault(nome, ajuda)
+            serie = self._contadores.setdefault(nome, {})
+            serie[chave] = serie.get(chave, 0) + valor
+
+    def observar(self, nome: str, ajuda: str, segundos: float, **rotulos) -> None:
+        chave = tuple(sorted(rotulos.items()))
+        with self._lock:
+            self._ajuda.setdefault(nome, ajuda)
+            self._histogramas.setdefault(nome, {}).setdefault(chave, _Histograma()).observar(segundos)
+
+    def render(self, extras: Optional[Dict[str, float]] = None) -> str:
+        """Texto do /metrics; 'extras' são gauges calculados na hora (ex.: tamanho dos caches)."""
+        linhas = []
+        with self._lock:
+            for nome, serie in sorted(self._contadores.items()):
+                linhas += [f"# HELP {nome} {self._ajuda[nome]}", f"# TYPE {nome} counter"]
+                linhas += [f"{nome}{_rotulos(dict(chave))} {valor:g}" for chave, valor in sorted(serie.items())]
+            for nome, serie in sorted(self._histogramas.items()):
+                linhas += [f"# HELP {nome} {self._ajuda[nome]}", f"# TYPE {nome} histogram"]
+                for chave, hist in sorted(serie.items()):
+                    rotulos = dict(chave)
+                    acumulado = 0
+                    for limite, contagem in zip(BUCKETS + ("+Inf",), hist.contagens):
+                        acumulado += contagem
+                        linhas.append(f"{nome}_bucket{_rotulos({**rotulos, 'le': limite})} {acumulado}")
+                    linhas.append(f"{nome}_sum{_rotulos(rotulos)} {hist.soma:.6f}")
+                    linhas.append(f"{nome}_count{_rotulos(rotulos)} {hist.total}")
+        for nome, valor in sorted((extras or {}).items()):
+            linhas += [f"# TYPE {nome} gauge", f"{nome} {valor:g}"]
+        return "\n".join(linhas) + "\n"
+
+
+metrics = MetricsRegistry()
+
+
+def registrar_consulta(perfil: Perfil, rota: str) -> None:
+    """
+    Fecha o perfil de uma análise dinâmica: fases e linhas vão para as
+    métricas e, acima de settings.query_slow_log_ms, a consulta vai para o
+    log de consultas lentas (com os planos, se capturados).
+    """
+    total = perfil.total_ms()
+    for nome, ms in perfil.fases.items():
+        metrics.observar("analise_fase_segundos", "Tempo por fase da análise dinâmica",
+                         ms / 1000, rota=rota, fase=nome)
+    for nome, linhas in perfil.linhas.items():
+        metrics.contar("analise_linhas_total", "Linhas lidas/devolvidas por fase da análise dinâmica",
+                       linhas, rota=rota, fase=nome)
+
+    limite = settings.query_slow_log_ms
+    if limite and total >= limite:
+        metrics.contar("analise_lentas_total", "Análises acima do limite do log de consultas lentas", rota=rota)
+        registro = {
+            "rota": rota, "total_ms": round(total, 1),
+            "fases_ms": {nome: round(ms, 1) for nome, ms in perfil.fases.items()},
+            "linhas": perfil.linhas, **perfil.consulta,
+        }
+        if perfil.planos:
+            registro["planos"] = perfil.planos
+        logger.warning("consulta lenta: %s", json.dumps(registro, default=str, ensure_ascii=False))
+
+
+class ProfilingMiddleware:
+    """
+    Middleware ASGI: abre um Perfil por requisição, mede o total (e a
+    serialização, quando o endpoint marcou o fim), escreve o Server-Timing
+    com as fases registradas e alimenta as métricas HTTP.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        perfil = Perfil()
+        token = _perfil_atual.set(perfil)
+
+        async def send_com_tempos(message):
+            if message["type"] == "http.response.start":
+                agora = time.perf_counter()
+                if perfil.fim_endpoint is not None:
+                    perfil.registrar("serializacao", (agora - perfil.fim_endpoint) * 1000)
+                cabecalhos = [(k, v) for k, v in message.get("headers", []) if k.lower() != b"server-timing"]
+                cabecalhos.append((b"server-timing", perfil.server_timing().encode("latin-1")))
+                message = {**message, "headers": cabecalhos}
+
+                rota = scope.get("route")
+                caminho = getattr(rota, "path", "outros")
+                metrics.contar("http_requisicoes_total", "Requisições HTTP por rota e status",
+                               rota=caminho, metodo=scope["method"], status=message["status"])
+                metrics.observar("http_requisicao_segundos", "Tempo até os cabeçalhos da resposta",
+                                 agora - perfil.inicio, rota=caminho, metodo=scope["method"])
+                if perfil.consulta is not None:
+                    registrar_consulta(perfil, caminho)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_com_tempos)
+        finally:
+            _perfil_atual.reset(token)
@@ -0,0 +1,92 @@
+# backend/app/ratelimit.py
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, Hashable, Iterable, Optional
+
+
+class SlidingWindowLimiter:
+    """
+    Limite de tentativas por chave numa janela deslizante (em memória, por
+    processo). hit() registra a tentativa e devolve quantos segundos faltam
+    para liberar a chave quando o limite já foi atingido, ou None.
+    """
+
+    def __init__(self, max_attempts: int, window_seconds: float):
+        self.max_attempts = max_attempts
+        self.window_seconds = window_seconds
+        self._tentativas: Dict[Hashable, Deque[float]] = {}
+        self._lock = threading.Lock()
+        self.bloqueios = 0
+
+    def _limpa(self, fila: Deque[float], agora: float) -> None:
+        while fila and fila[0] <= agora - self.window_seconds:
+            fila.popleft()
+
+    def retry_after(self, key: Hashable) -> Optional[int]:
+        """Segundos até a chave voltar a ter tentativas, sem registrar nenhuma."""
+        agora = time.monotonic()
+        with self._lock:
+            fila = self._tentativas.get(key)
+            if not fila:
+                return None
+            self._limpa(fila, agora)
+            if len(fila) < self.max_attempts:
+                return None
+            return max(1, int(fila[0] + self.window_seconds - agora) + 1)
+
+    def check(self, key: Hashable) -> Optional[int]:
+        """Como retry_after, mas conta o bloqueio nas estatísticas."""
+        espera = self.retry_after(key)
+        if espera is not None:
+            with self._lock:
+                self.bloqueios += 1
+        return espera
+
+    def hit(self, key: Hashable) -> Optional[int]:
+        espera = self.check(key)
+        if espera is not None:
+            return espera
+        with self._lock:
+            self._tentativas.setdefault(key, deque()).append(time.monotonic())
+            # Não deixa chaves antigas acumularem indefinidamente
+            if len(self._tentativas) > 10000:
+                agora = time.monotonic()
+                for k in [k for k, f in self._tentativas.items() if not f or f[-1] <= agora - self.window_seconds]:
+                    del self._tentativas[k]
+        return None
+
+    def reset(self, key: Hashable) -> None:
+        with self._lock:
+            self._tentativas.pop(key, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "chaves": len(self._tentativas),
+                "max_tentativas": self.max_attempts,
+                "janela_segundos": self.window_seconds,
+                "bloqueios": self.bloqueios,
+            }
+
+
+def client_ip(peer: Optional[str], forwarded_for: Optional[str], trusted: Iterable[str]) -> str:
+    """
+    IP do cliente para o rate limit. Só quando a conexão vem de um proxy
+    confiável ('trusted', ou "*") o X-Forwarded-For é usado: do fim para o
+    começo, o primeiro endereço que não é de proxy confiável (os anteriores
+    a ele podem ter sido forjados pelo cliente).
+    """
+    confiaveis = {ip.strip() for ip in trusted if ip.strip()}
+    todos = "*" in confiaveis
+    if not peer or not forwarded_for or not (todos or peer in confiaveis):
+        return peer or "?"
+    saltos = [ip.strip() for ip in forwarded_for.split(",") if ip.strip()]
+    if not saltos:
+        return peer
+    if todos:
+        return saltos[0]
+    for ip in reversed(saltos):
+        if ip not in confiaveis:
+            return ip
+    return saltos[0]
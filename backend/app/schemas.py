@@ -13,7 +13,8 @@ class ProductHistoryBase(BaseModel):
     sold_quantity: int
 
 class ProductHistory(ProductHistoryBase):
-    id: int
+    # Sem id quando o histórico vem agrupado por semana/mês
+    id: Optional[int] = None
     opening_stock: int
     inbound_quantity: int
     closing_stock: int
@@ -35,6 +36,18 @@ class Product(ProductBase):
         from_attributes = True
 
 
+# --- Busca de vários produtos de uma vez (/api/products/batch) ---
+class ProductBatchRequest(BaseModel):
+    codigos: List[str]
+    data_inicial: Optional[date] = None
+    data_final: Optional[date] = None
+    agrupar: Optional[str] = None  # "semana" ou "mes"
+
+class ProductBatchResponse(BaseModel):
+    produtos: List[Product]
+    nao_encontrados: List[str] = []
+
+
 class UserBase(BaseModel):
     username: str
 
@@ -99,6 +112,10 @@ class QueryRequest(BaseModel):
     dimensoes: List[str]
     metricas: List[MetricaRequest] # <-- MUDANÇA IMPORTANTE
     filtros: Optional[Dict[str, Any]] = None
+    # Como calcular o estoque: "atual" (padrão), "data_final", "fim_do_mes" ou "media_mes"
+    estoque_modo: Optional[str] = None
+    # Motor da consulta: "sql" ou "colunar" (padrão: settings.query_engine)
+    motor: Optional[str] = None
 
  #lista flexível de dicionários
 class QueryResponse(BaseModel):
@@ -0,0 +1,139 @@
+# backend/app/search.py
+import threading
+import time
+import unicodedata
+from bisect import bisect_left
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from . import models
+
+# Campos da dim_produto que entram na busca
+CAMPOS_BUSCA = ("product_code", "product_name", "marca", "fornecedor")
+CAMPOS_RESULTADO = ("id", "product_code", "product_name", "marca", "departamento", "classificacao",
+                    "grupo", "modelo", "fornecedor")
+
+
+def normalizar(texto: Optional[str]) -> str:
+    """Minúsculas e sem acentos ("Café Pilão" -> "cafe pilao")."""
+    if not texto:
+        return ""
+    sem_acento = unicodedata.normalize("NFKD", str(texto)).encode("ascii", "ignore").decode("ascii")
+    return " ".join(sem_acento.lower().split())
+
+
+def trigramas(texto: str) -> set:
+    """Trigramas de cada palavra com o mesmo preenchimento do pg_trgm ("  ab " -> "  a", " ab", "ab ")."""
+    resultado = set()
+    for palavra in texto.split():
+        palavra = f"  {palavra} "
+        resultado.update(palavra[i:i + 3] for i in range(len(palavra) - 2))
+    return resultado
+
+
+class _Indice:
+    """
+    Estruturas de uma versão do índice. Montadas por inteiro antes de entrar
+    em uso e nunca alteradas depois: a busca pega a referência uma vez e não
+    vê uma mistura da versão velha com a nova.
+    """
+    __slots__ = ("versao", "produtos", "trigramas", "palavras", "palavras_idx",
+                 "codigos", "codigos_idx", "posicao_codigo")
+
+    def __init__(self, versao: Optional[int], produtos: List[dict]):
+        indice: Dict[str, List[int]] = {}
+        palavras = []
+        for i, produto in enumerate(produtos):
+            texto = " ".join(normalizar(produto[c]) for c in CAMPOS_BUSCA)
+            for trigrama in trigramas(texto):
+                indice.setdefault(trigrama, []).append(i)
+            palavras.extend((palavra, i) for palavra in set(texto.split()))
+        palavras.sort()
+        codigos = sorted((normalizar(p["product_code"]), i) for i, p in enumerate(produtos))
+
+        self.versao = versao
+        self.produtos = produtos
+        self.trigramas = {t: np.array(ids, dtype=np.int32) for t, ids in indice.items()}
+        self.palavras = [palavra for palavra, _ in palavras]
+        self.palavras_idx = np.array([i for _, i in palavras], dtype=np.int32)
+        self.codigos = [codigo for codigo, _ in codigos]
+        self.codigos_idx = np.array([i for _, i in codigos], dtype=np.int32)
+        self.posicao_codigo = np.empty(len(produtos), dtype=np.int32)
+        self.posicao_codigo[self.codigos_idx] = np.arange(len(produtos), dtype=np.int32)
+
+
+class ProductSearchIndex:
+    """
+    Índice em memória da dim_produto para o autocomplete: trigramas (busca
+    aproximada) mais uma lista ordenada de palavras (busca por prefixo), com
+    as listas de produtos em arrays NumPy para pontuar tudo com bincount.
+    É remontado quando a versão dos dados muda, como o SnapshotCatalog; a
+    versão é conferida no máximo a cada 'intervalo_verificacao' segundos.
+    """
+
+    def __init__(self, intervalo_verificacao: float = 5):
+        self.intervalo_verificacao = intervalo_verificacao
+        # Trocado de uma vez só (uma atribuição), sem lock na leitura
+        self._indice = _Indice(None, [])
+        self._verificado_em = 0.0
+        self._lock = threading.Lock()
+
+    def _refresh(self, db: Session) -> _Indice:
+        indice = self._indice
+        if indice.versao is not None and time.monotonic() - self._verificado_em < self.intervalo_verificacao:
+            return indice
+        from .crud import get_data_version
+
+        versao = get_data_version(db)
+        self._verificado_em = time.monotonic()
+        if versao == indice.versao:
+            return indice
+        with self._lock:
+            if versao == self._indice.versao:
+                return self._indice
+            colunas = [getattr(models.DimProduto, c) for c in CAMPOS_RESULTADO]
+            produtos = [dict(row._mapping) for row in db.query(*colunas)]
+            self._indice = _Indice(versao, produtos)
+            return self._indice
+
+    @staticmethod
+    def _faixa_prefixo(ordenadas: List[str], termo: str) -> Tuple[int, int]:
+        """Posições [ini, fim) das strings ordenadas que começam com 'termo'."""
+        return bisect_left(ordenadas, termo), bisect_left(ordenadas, termo + "\uffff")
+
+    def search(self, db: Session, q: str, limite: int = 10) -> List[dict]:
+        """Os 'limite' produtos mais parecidos com q (código, nome, marca ou fornecedor)."""
+        indice = self._refresh(db)
+        termo = normalizar(q)
+        total = len(indice.produtos)
+        if not termo or not total:
+            return []
+
+        pontos = np.zeros(total)
+        # Cada palavra do termo que é prefixo de alguma palavra do produto vale 1
+        for palavra in termo.split():
+            ini, fim = self._faixa_prefixo(indice.palavras, palavra)
+            pontos += np.bincount(indice.palavras_idx[ini:fim], minlength=total) > 0
+
+        # Similaridade por trigramas (tolera erro de digitação); só a partir de 3 letras
+        trigramas_q = trigramas(termo)
+        listas = [indice.trigramas[t] for t in trigramas_q if t in indice.trigramas]
+        if len(termo) >= 3 and listas:
+            similaridade = np.bincount(np.concatenate(listas), minlength=total) / len(trigramas_q)
+            pontos += np.where(similaridade >= 0.5, similaridade, 0)
+
+        # Código começando pelo termo vem primeiro, e o código exato antes de todos
+        ini, fim = self._faixa_prefixo(indice.codigos, termo)
+        pontos[indice.codigos_idx[ini:fim]] += 1
+        if ini < fim and indice.codigos[ini] == termo:
+            pontos[indice.codigos_idx[ini]] += 2
+
+        # Maior pontuação primeiro; empate pela ordem do código
+        candidatos = np.flatnonzero(pontos)
+        ordem = np.lexsort((indice.posicao_codigo[candidatos], -pontos[candidatos]))[:limite]
+        return [indice.produtos[i] for i in candidatos[ordem]]
+
+
+search_index = ProductSearchIndex()
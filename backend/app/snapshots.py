@@ -0,0 +1,58 @@
+# backend/app/snapshots.py
+import threading
+from bisect import bisect_right
+from datetime import date
+from typing import Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+from . import models
+
+
+class SnapshotCatalog:
+    """
+    Cópia em memória de 'catalogo_snapshot_estoque' (datas de snapshot e linhas
+    por data). É recarregada quando a versão dos dados muda, então resolver
+    "último snapshot até a data X" vira um bisect em vez de um MAX() no banco.
+    """
+
+    def __init__(self):
+        self._datas: List[date] = []
+        self._linhas: Dict[date, int] = {}
+        self._versao: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def _refresh(self, db: Session) -> None:
+        from .crud import get_data_state
+
+        versao = get_data_state(db).versao
+        if versao == self._versao:
+            return
+        with self._lock:
+            if versao == self._versao:
+                return
+            registros = (
+                db.query(models.CatalogoSnapshotEstoque.data_snapshot, models.CatalogoSnapshotEstoque.linhas)
+                .order_by(models.CatalogoSnapshotEstoque.data_snapshot)
+                .all()
+            )
+            self._datas = [data for data, _ in registros]
+            self._linhas = dict(registros)
+            self._versao = versao
+
+    def dates(self, db: Session) -> List[date]:
+        self._refresh(db)
+        return self._datas
+
+    def rows(self, db: Session, data_snapshot: date) -> int:
+        self._refresh(db)
+        return self._linhas.get(data_snapshot, 0)
+
+    def latest_on_or_before(self, db: Session, data_limite: date) -> Optional[date]:
+        """Último snapshot <= data_limite, ou None se o catálogo não tiver nenhum."""
+        datas = self.dates(db)
+        posicao = bisect_right(datas, data_limite)
+        return datas[posicao - 1] if posicao else None
+
+
+snapshot_catalog = SnapshotCatalog()
@@ -0,0 +1,183 @@
+# backend/benchmarks/gerar_dados.py
+# Gera um Data Mart sintético (mesmas tabelas do models.py) para os benchmarks.
+#
+# Uso: python benchmarks/gerar_dados.py --database-url sqlite:///benchmarks/bench.sqlite --lojas 10 --skus 200 --dias 90
+
+import argparse
+import os
+import sys
+import time
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+MARCAS = [f"Marca {i:02d}" for i in range(25)]
+DEPARTAMENTOS = ["Bebidas", "Mercearia", "Limpeza", "Higiene", "Padaria", "Frios", "Hortifruti", "Bazar"]
+FORNECEDORES = [f"Fornecedor {i:02d}" for i in range(40)]
+
+# Tabelas apagadas antes de gerar, na ordem das chaves estrangeiras
+TABELAS = [
+    "fato_vendas", "fato_estoque", "agg_vendas_mes_loja", "agg_vendas_mes_loja_departamento",
+    "agg_vendas_mes_loja_produto", "controle_rollups", "kpi_resumo_diario", "catalogo_snapshot_estoque",
+    "etl_watermark", "versao_dados", "product_history", "products", "dim_produto", "dim_loja",
+]
+
+
+def _inserir(conn, tabela, df: pd.DataFrame, lote: int = 20000):
+    registros = df.to_dict("records")
+    for i in range(0, len(registros), lote):
+        conn.execute(tabela.insert(), registros[i:i + lote])
+
+
+def gerar_dimensoes(skus: int, lojas: int, rng) -> tuple:
+    produtos = pd.DataFrame({
+        "id": np.arange(1, skus + 1),
+        "product_code": [f"SKU{i:06d}" for i in range(1, skus + 1)],
+        "product_name": [f"Produto sintético {i}" for i in range(1, skus + 1)],
+        "marca": rng.choice(MARCAS, skus),
+        "departamento": rng.choice(DEPARTAMENTOS, skus),
+        "classificacao": rng.choice(["A", "B", "C"], skus, p=[0.2, 0.3, 0.5]),
+        "grupo": [f"Grupo {i % 30:02d}" for i in range(skus)],
+        "modelo": [f"Modelo {i % 60:02d}" for i in range(skus)],
+        "fornecedor": rng.choice(FORNECEDORES, skus),
+    })
+    lojas_df = pd.DataFrame({
+        "id": np.arange(1, lojas + 1),
+        "store_id": np.arange(100, 100 + lojas),
+        "store_name": [f"Loja {i:03d}" for i in range(1, lojas + 1)],
+    })
+    return produtos, lojas_df
+
+
+def gerar_fatos(skus: int, lojas: int, dias: int, inicio: date, rng, prob_venda: float = 0.6,
+                estoque_intervalo: int = 1) -> tuple:
+    """Vendas (nem todo produto vende todo dia) e snapshots de estoque por produto/loja."""
+    datas = np.array([inicio + timedelta(days=d) for d in range(dias)])
+    grade_dia, grade_loja, grade_produto = np.meshgrid(np.arange(dias), np.arange(1, lojas + 1),
+                                                       np.arange(1, skus + 1), indexing="ij")
+    grade_dia, grade_loja, grade_produto = grade_dia.ravel(), grade_loja.ravel(), grade_produto.ravel()
+    preco = rng.uniform(5, 200, skus + 1).round(2)
+
+    vendeu = rng.random(len(grade_dia)) < prob_venda
+    quantidade = rng.poisson(3, vendeu.sum()) + 1
+    venda_liquida = (quantidade * preco[grade_produto[vendeu]]).round(2)
+    vendas = pd.DataFrame({
+        "data_venda": datas[grade_dia[vendeu]],
+        "produto_id": grade_produto[vendeu],
+        "loja_id": grade_loja[vendeu],
+        "quantidade_vendida": quantidade,
+        "venda_liquida": venda_liquida,
+        "venda_bruta": (venda_liquida * 1.1).round(2),
+        "custo_total": (venda_liquida * 0.6).round(2),
+        "quantidade_entrada": 0,
+        "custo_entrada": 0.0,
+    })
+
+    # Snapshot a cada 'estoque_intervalo' dias, mais o último dia de cada mês
+    dias_snapshot = {d for d in range(0, dias, estoque_intervalo)}
+    dias_snapshot |= {d for d in range(dias) if (datas[d] + timedelta(days=1)).day == 1}
+    no_snapshot = np.isin(grade_dia, sorted(dias_snapshot))
+    estoque_qtd = rng.integers(0, 80, no_snapshot.sum())
+    estoque = pd.DataFrame({
+        "data_snapshot": datas[grade_dia[no_snapshot]],
+        "produto_id": grade_produto[no_snapshot],
+        "loja_id": grade_loja[no_snapshot],
+        "closing_stock_quantity": estoque_qtd,
+        "closing_stock_cost": (estoque_qtd * preco[grade_produto[no_snapshot]] * 0.6).round(2),
+        "closing_stock_sale_price": (estoque_qtd * preco[grade_produto[no_snapshot]]).round(2),
+    })
+    return vendas, estoque
+
+
+def gerar_historico(skus: int, dias: int, inicio: date, rng) -> pd.DataFrame:
+    """Arquivo consolidado no formato lido pelo scripts/import_data.py (products/product_history)."""
+    datas = [inicio + timedelta(days=d) for d in range(dias)]
+    codigos = np.repeat([f"SKU{i:06d}" for i in range(1, skus + 1)], dias)
+    vendido = rng.poisson(4, skus * dias)
+    entrada = rng.poisson(4, skus * dias)
+    inicial = rng.integers(0, 100, skus * dias)
+    return pd.DataFrame({
+        "product_code": codigos,
+        "product_name": np.repeat([f"Produto sintético {i}" for i in range(1, skus + 1)], dias),
+        "date": np.tile(datas, skus),
+        "opening_stock": inicial,
+        "inbound_quantity": entrada,
+        "sold_quantity": vendido,
+        "closing_stock": np.maximum(inicial + entrada - vendido, 0),
+    })
+
+
+def gerar_data_mart(engine, lojas: int = 10, skus: int = 200, dias: int = 90, inicio: date = date(2024, 1, 1),
+                    semente: int = 42, estoque_intervalo: int = 1) -> dict:
+    """
+    Apaga e regrava todas as tabelas do Data Mart no banco do 'engine'.
+    Devolve (linhas por tabela, DataFrame do arquivo consolidado de histórico).
+    """
+    from sqlalchemy import text
+
+    from app import models
+
+    rng = np.random.default_rng(semente)
+    produtos, lojas_df = gerar_dimensoes(skus, lojas, rng)
+    vendas, estoque = gerar_fatos(skus, lojas, dias, inicio, rng, estoque_intervalo=estoque_intervalo)
+    historico = gerar_historico(skus, dias, inicio, rng)
+
+    kpi = vendas.groupby("data_venda").agg(total_venda_liquida=("venda_liquida", "sum"),
+                                           lojas_ativas=("loja_id", "nunique")).reset_index()
+    kpi = kpi.rename(columns={"data_venda": "data"})
+    catalogo = estoque.groupby("data_snapshot").size().reset_index(name="linhas")
+
+    with engine.begin() as conn:
+        for tabela in TABELAS:
+            conn.execute(text(f"DELETE FROM {tabela}"))
+        _inserir(conn, models.DimProduto.__table__, produtos)
+        _inserir(conn, models.DimLoja.__table__, lojas_df)
+        _inserir(conn, models.FatoVendas.__table__, vendas)
+        _inserir(conn, models.FatoEstoque.__table__, estoque)
+        _inserir(conn, models.KpiResumoDiario.__table__, kpi)
+        _inserir(conn, models.CatalogoSnapshotEstoque.__table__, catalogo)
+
+        produtos_hist = historico[["product_code", "product_name"]].drop_duplicates().reset_index(drop=True)
+        produtos_hist.insert(0, "id", np.arange(1, len(produtos_hist) + 1))
+        _inserir(conn, models.Product.__table__, produtos_hist)
+        ids = dict(zip(produtos_hist["product_code"], produtos_hist["id"]))
+        hist = historico.assign(product_id=historico["product_code"].map(ids)).drop(
+            columns=["product_code", "product_name"])
+        _inserir(conn, models.ProductHistory.__table__, hist)
+        conn.execute(models.VersaoDados.__table__.insert(), [{"id": 1, "versao": 1, "versao_fatos": 1}])
+        if conn.dialect.name == "postgresql":
+            # Ids gravados explicitamente: as sequences seguem do maior id (para o ETL rodar depois)
+            for tabela in ("dim_produto", "dim_loja", "products"):
+                conn.execute(text(f"SELECT setval(pg_get_serial_sequence('{tabela}', 'id'), (SELECT max(id) FROM {tabela}))"))
+
+    contagens = {
+        "dim_produto": len(produtos), "dim_loja": len(lojas_df), "fato_vendas": len(vendas),
+        "fato_estoque": len(estoque), "product_history": len(hist),
+    }
+    return contagens, historico
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Gera um Data Mart sintético para benchmarks.")
+    parser.add_argument("--database-url", help="Banco de destino (padrão: DATABASE_URL do .env)")
+    parser.add_argument("--lojas", type=int, default=10)
+    parser.add_argument("--skus", type=int, default=200)
+    parser.add_argument("--dias", type=int, default=90)
+    parser.add_argument("--estoque-intervalo", type=int, default=1, help="Dias entre snapshots de estoque")
+    parser.add_argument("--semente", type=int, default=42)
+    args = parser.parse_args()
+
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+    os.environ.setdefault("SECRET_KEY", "benchmark")
+    from app.db import engine
+    from app.migrations import run_migrations
+
+    run_migrations(engine)
+    inicio = time.perf_counter()
+    contagens, _ = gerar_data_mart(engine, args.lojas, args.skus, args.dias, semente=args.semente,
+                                   estoque_intervalo=args.estoque_intervalo)
+    print(f"Data Mart gerado em {time.perf_counter() - inicio:.1f}s: {contagens}")
@@ -0,0 +1,298 @@
+# backend/benchmarks/run_benchmarks.py
+# Benchmarks da análise dinâmica, da busca de produto e das cargas do ETL sobre
+# um Data Mart sintético (benchmarks/gerar_dados.py).
+#
+# Uso:
+#   python benchmarks/run_benchmarks.py                                   # SQLite em benchmarks/bench.sqlite
+#   python benchmarks/run_benchmarks.py --database-url postgresql://.../bench --lojas 50 --skus 2000 --dias 365
+#   python benchmarks/run_benchmarks.py --comparar benchmarks/resultados/<anterior>.json
+#
+# Para cada caso mede p50/p95 (após uma execução de aquecimento), linhas/s e o
+# pico de memória Python (tracemalloc, numa execução à parte). O resultado vai
+# para benchmarks/resultados/<data>_<commit>.json.
+# No SQLite a função to_char do PostgreSQL é registrada em Python e as cargas do
+# ETL (COPY via psycopg2) não rodam.
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'scripts')))
+
+PASTA = os.path.dirname(os.path.abspath(__file__))
+INICIO = date(2024, 1, 1)
+
+
+def _to_char(valor, formato):
+    # Só os formatos usados pelo crud ('YYYY-MM')
+    if valor is None:
+        return None
+    return str(valor)[:7] if formato == "YYYY-MM" else str(valor)
+
+
+def _registrar_to_char(*engines):
+    from sqlalchemy import event
+
+    for engine in engines:
+        event.listen(engine, "connect", lambda conn, _: conn.create_function("to_char", 2, _to_char))
+
+
+def _percentil(valores, p):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))]
+
+
+def medir(nome, funcao, repeticoes, linhas_processadas=None):
+    """Roda 'funcao' (1 aquecimento + N vezes) e devolve as estatísticas do caso."""
+    resultado = funcao()
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        resultado = funcao()
+        tempos.append(time.perf_counter() - inicio)
+
+    tracemalloc.start()
+    funcao()
+    pico = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    p50 = statistics.median(tempos)
+    caso = {
+        "caso": nome,
+        "repeticoes": repeticoes,
+        "p50_ms": round(p50 * 1000, 2),
+        "p95_ms": round(_percentil(tempos, 95) * 1000, 2),
+        "min_ms": round(min(tempos) * 1000, 2),
+        "linhas_resultado": len(resultado) if hasattr(resultado, "__len__") else None,
+        "pico_memoria_mb": round(pico / 1024 / 1024, 2),
+    }
+    if linhas_processadas:
+        caso["linhas_processadas"] = linhas_processadas
+        caso["linhas_por_s"] = round(linhas_processadas / p50) if p50 else None
+    print(f"{nome:<34} p50 {caso['p50_ms']:>9.2f} ms  p95 {caso['p95_ms']:>9.2f} ms  "
+          f"pico {caso['pico_memoria_mb']:>7.2f} MB")
+    return caso
+
+
+def _consulta(dimensoes, metricas, dias, filtros=None, inicio=INICIO, **extras):
+    from app import schemas
+
+    return schemas.QueryRequest(
+        data_inicial=inicio,
+        data_final=inicio + timedelta(days=dias - 1),
+        dimensoes=dimensoes,
+        metricas=[{"nome": m, "agregacao": "LAST" if m.startswith("estoque") else "SUM"} for m in metricas],
+        filtros=filtros,
+        **extras,
+    )
+
+
+def casos_consulta(dias):
+    """Matriz fixa de pedidos representativos do dashboard."""
+    ultimo_dia = INICIO + timedelta(days=dias - 1)
+    return [
+        ("vendas_loja", _consulta(["nome_loja"], ["venda_liquida", "quantidade_vendida"], dias), {}),
+        ("vendas_loja_mes", _consulta(["nome_loja", "mes"], ["venda_liquida"], dias), {}),
+        ("vendas_produto", _consulta(["codigo_produto"], ["venda_liquida", "quantidade_vendida"], dias), {}),
+        ("vendas_filtro_departamento",
+         _consulta(["nome_marca"], ["venda_liquida"], dias, {"nome_departamento": "Bebidas"}), {}),
+        ("estoque_atual_loja", _consulta(["nome_loja"], ["estoque_atual", "estoque_pdv"], dias), {}),
+        ("estoque_fim_do_mes", _consulta(["nome_loja", "mes"], ["estoque_atual"], dias), {}),
+        ("estoque_data_final", _consulta(["nome_departamento"], ["estoque_atual"], dias,
+                                         estoque_modo="data_final"), {}),
+        ("combinado_merge_sql", _consulta(["nome_loja", "nome_departamento"],
+                                          ["venda_liquida", "estoque_atual"], dias), {"query_merge_mode": "sql"}),
+        ("combinado_merge_python", _consulta(["nome_loja", "nome_departamento"],
+                                             ["venda_liquida", "estoque_atual"], dias),
+         {"query_merge_mode": "python"}),
+        ("combinado_merge_python_sequencial", _consulta(["nome_loja", "nome_departamento"],
+                                                        ["venda_liquida", "estoque_atual"], dias),
+         {"query_merge_mode": "python", "query_parallel_subqueries": False}),
+        ("vendas_loja_mes_colunar", _consulta(["nome_loja", "mes"], ["venda_liquida"], dias, motor="colunar"), {}),
+        ("vendas_produto_colunar", _consulta(["codigo_produto"], ["venda_liquida", "quantidade_vendida"], dias,
+                                             motor="colunar"), {}),
+        ("vendas_ultimo_dia", _consulta(["nome_loja"], ["venda_liquida"], 1, inicio=ultimo_dia), {}),
+    ]
+
+
+def _com_settings(alteracoes, funcao):
+    from app.config import settings
+
+    antigos = {k: getattr(settings, k) for k in alteracoes}
+    for chave, valor in alteracoes.items():
+        setattr(settings, chave, valor)
+    try:
+        return funcao()
+    finally:
+        for chave, valor in antigos.items():
+            setattr(settings, chave, valor)
+
+
+def rodar(args):
+    from app import columnar, crud, export
+    from app.db import AnalyticsSessionLocal, SessionLocal, analytics_engine, engine
+    from app.migrations import run_migrations
+    from gerar_dados import gerar_data_mart
+
+    sqlite = engine.dialect.name == "sqlite"
+    if sqlite:
+        _registrar_to_char(engine, analytics_engine)
+
+    run_migrations(engine)
+    print(f"Gerando Data Mart sintético ({args.lojas} lojas x {args.skus} SKUs x {args.dias} dias)...")
+    inicio = time.perf_counter()
+    contagens, historico = gerar_data_mart(engine, args.lojas, args.skus, args.dias, INICIO,
+                                           estoque_intervalo=args.estoque_intervalo)
+    print(f"Gerado em {time.perf_counter() - inicio:.1f}s: {contagens}\n")
+
+    db = AnalyticsSessionLocal()
+    try:
+        columnar.build_snapshot(db)
+        db.commit()
+    finally:
+        db.close()
+
+    resultados = []
+    for nome, pedido, alteracoes in casos_consulta(args.dias):
+        def executar(pedido=pedido, alteracoes=alteracoes):
+            def consulta():
+                sessao = AnalyticsSessionLocal()
+                try:
+                    return crud.run_dynamic_query_rows(sessao, pedido)
+                finally:
+                    sessao.close()
+            return _com_settings(alteracoes, consulta)
+        linhas = contagens["fato_vendas"] if any(m.nome.startswith("venda") or m.nome.startswith("quantidade")
+                                                 for m in pedido.metricas) else contagens["fato_estoque"]
+        resultados.append(medir(nome, executar, args.repeticoes, linhas))
+
+    # Serialização de um resultado largo (produto x loja): caminho antigo do
+    # FastAPI (dicts + jsonable_encoder + json) contra o JSON direto das tuplas
+    from fastapi.encoders import jsonable_encoder
+
+    sessao = AnalyticsSessionLocal()
+    try:
+        colunas, tuplas = crud.run_dynamic_query_rows(sessao, _consulta(
+            ["codigo_produto", "nome_loja"], ["venda_liquida", "quantidade_vendida"], args.dias))
+    finally:
+        sessao.close()
+    resultados.append(medir(
+        "json_jsonable_encoder",
+        lambda: json.dumps(jsonable_encoder([dict(zip(colunas, t)) for t in tuplas])).encode(),
+        args.repeticoes, len(tuplas),
+    ))
+    for formato in export.FORMATOS_JSON:
+        resultados.append(medir(f"json_{formato}", lambda formato=formato: export.json_resultado(colunas, tuplas, formato),
+                                args.repeticoes, len(tuplas)))
+
+    codigo = "SKU000001"
+
+    def produto_por_codigo():
+        sessao = SessionLocal()
+        try:
+            return crud.get_product_by_code(sessao, codigo).history
+        finally:
+            sessao.close()
+
+    def historico_paginado():
+        sessao = SessionLocal()
+        try:
+            return crud.get_product_history_page(sessao, codigo, limite=30, agrupar=None)[1]
+        finally:
+            sessao.close()
+
+    def produtos_em_lote():
+        sessao = SessionLocal()
+        try:
+            codigos = [f"SKU{i:06d}" for i in range(1, min(args.skus, 50) + 1)]
+            return crud.get_products_with_history(sessao, codigos)
+        finally:
+            sessao.close()
+
+    resultados.append(medir("get_product_by_code", produto_por_codigo, args.repeticoes, args.dias))
+    resultados.append(medir("historico_produto_pagina_30", historico_paginado, args.repeticoes))
+    resultados.append(medir("produtos_em_lote_50", produtos_em_lote, args.repeticoes))
+
+    if sqlite:
+        print("\nCargas do ETL puladas: usam COPY do PostgreSQL.")
+    else:
+        import import_data
+        import load_star_schema
+
+        resultados.append(medir("etl_import_completo", lambda: import_data.load_data_to_db(historico.copy()),
+                                max(1, args.repeticoes // 5), len(historico)))
+
+        vendas_arquivo = historico.rename(columns={"date": "data_venda", "sold_quantity": "quantidade_vendida"})
+        vendas_arquivo = vendas_arquivo.assign(store_id=100, venda_liquida=vendas_arquivo["quantidade_vendida"] * 10.0)
+        resultados.append(medir("etl_star_schema_vendas",
+                                lambda: load_star_schema.load_star_schema(vendas_arquivo, None, workers=args.workers),
+                                max(1, args.repeticoes // 5), len(vendas_arquivo)))
+    return contagens, resultados
+
+
+def _commit_atual():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=PASTA, text=True).strip()
+    except Exception:
+        return "desconhecido"
+
+
+def comparar(atual, arquivo_anterior):
+    with open(arquivo_anterior, encoding="utf-8") as arquivo:
+        anterior = {c["caso"]: c for c in json.load(arquivo)["resultados"]}
+    print(f"\nComparação com {os.path.basename(arquivo_anterior)} (p50):")
+    for caso in atual:
+        antes = anterior.get(caso["caso"])
+        if antes is None or not antes["p50_ms"]:
+            continue
+        variacao = (caso["p50_ms"] - antes["p50_ms"]) / antes["p50_ms"] * 100
+        print(f"{caso['caso']:<34} {antes['p50_ms']:>9.2f} -> {caso['p50_ms']:>9.2f} ms ({variacao:+.1f}%)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks do backend sobre um Data Mart sintético.")
+    parser.add_argument("--database-url", default=f"sqlite:///{os.path.join(PASTA, 'bench.sqlite')}",
+                        help="Banco dedicado ao benchmark (as tabelas são apagadas!)")
+    parser.add_argument("--lojas", type=int, default=10)
+    parser.add_argument("--skus", type=int, default=200)
+    parser.add_argument("--dias", type=int, default=90)
+    parser.add_argument("--estoque-intervalo", type=int, default=7, help="Dias entre snapshots de estoque")
+    parser.add_argument("--repeticoes", type=int, default=10)
+    parser.add_argument("--workers", type=int, default=4, help="Conexões COPY na carga do esquema estrela")
+    parser.add_argument("--saida", default=os.path.join(PASTA, "resultados"))
+    parser.add_argument("--comparar", help="JSON de uma execução anterior para comparar os p50")
+    args = parser.parse_args()
+
+    # A configuração da app é lida no import: o banco do benchmark entra antes
+    os.environ["DATABASE_URL"] = args.database_url
+    os.environ.setdefault("SECRET_KEY", "benchmark")
+    os.environ.setdefault("COLUMNAR_DIR", os.path.join(tempfile.gettempdir(), "bench_colunar"))
+    os.environ["AUTO_MIGRATE"] = "false"
+
+    contagens, resultados = rodar(args)
+
+    os.makedirs(args.saida, exist_ok=True)
+    commit = _commit_atual()
+    destino = os.path.join(args.saida, f"{datetime.now():%Y%m%d_%H%M%S}_{commit}.json")
+    with open(destino, "w", encoding="utf-8") as arquivo:
+        json.dump({
+            "commit": commit,
+            "executado_em": datetime.now().isoformat(timespec="seconds"),
+            "banco": args.database_url.split("://", 1)[0],
+            "parametros": {"lojas": args.lojas, "skus": args.skus, "dias": args.dias,
+                           "estoque_intervalo": args.estoque_intervalo, "repeticoes": args.repeticoes},
+            "linhas": contagens,
+            "resultados": resultados,
+        }, arquivo, indent=2, ensure_ascii=False)
+    print(f"\nResultados salvos em {destino}")
+
+    if args.comparar:
+        comparar(resultados, args.comparar)
@@ -0,0 +1,30 @@
+# backend/scripts/build_columnar.py
+# Grava o retrato colunar (.npy) de fato_vendas usado pelo motor "colunar" do /api/query.
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from app.db import AnalyticsSessionLocal
+from app import columnar
+
+
+def build(destino=None):
+    db = AnalyticsSessionLocal()
+    try:
+        inicio = time.perf_counter()
+        manifesto = columnar.build_snapshot(db, destino)
+        db.commit()
+        print(f"Retrato colunar da versão dos fatos {manifesto['versao']}: {manifesto['linhas']} linhas "
+              f"em {time.perf_counter() - inicio:.1f}s ({manifesto['pasta']}).")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Gera o retrato colunar de fato_vendas.")
+    parser.add_argument("--destino", help="Diretório (padrão: settings.columnar_dir ou backend/data/colunar)")
+    args = parser.parse_args()
+    build(args.destino)
@@ -0,0 +1,217 @@
+# backend/scripts/etl_utils.py
+# Funções SQL compartilhadas pelos scripts de carga (psycopg2).
+
+from datetime import timedelta
+
+from app.migrations import month_partition_ddl
+
+
+def bump_data_version(cur, fatos=False):
+    """
+    Incrementa a versão dos dados em 'versao_dados' (e a versão dos fatos, com
+    fatos=True: só a carga do Data Mart, que mexe em fatos e dimensões).
+    A API usa a versão dos dados para descartar resultados em cache depois de
+    uma carga, e a dos fatos para saber se rollups e retrato colunar ainda
+    valem, por isso deve rodar na mesma transação que grava os dados novos.
+    """
+    cur.execute("""
+        INSERT INTO versao_dados (id, versao, versao_fatos, atualizado_em)
+        VALUES (1, 1, %(fatos)s, now())
+        ON CONFLICT (id) DO UPDATE
+        SET versao = versao_dados.versao + 1,
+            versao_fatos = versao_dados.versao_fatos + %(fatos)s,
+            atualizado_em = now()
+        RETURNING versao;
+    """, {"fatos": 1 if fatos else 0})
+    return cur.fetchone()[0]
+
+
+# Rollups mensais de vendas: tabela -> INSERT ... SELECT que a recalcula
+# ({filtro} restringe as datas de venda quando só alguns meses são recalculados)
+ROLLUPS_VENDAS = {
+    "agg_vendas_mes_loja": """
+        INSERT INTO agg_vendas_mes_loja (mes, loja_id, quantidade_vendida, venda_liquida)
+        SELECT date_trunc('month', v.data_venda)::date, v.loja_id,
+               sum(v.quantidade_vendida), sum(v.venda_liquida)
+        FROM fato_vendas v
+        JOIN dim_loja l ON l.id = v.loja_id
+        JOIN dim_produto p ON p.id = v.produto_id
+        {filtro}
+        GROUP BY 1, 2;
+    """,
+    "agg_vendas_mes_loja_departamento": """
+        INSERT INTO agg_vendas_mes_loja_departamento (mes, loja_id, departamento, quantidade_vendida, venda_liquida)
+        SELECT date_trunc('month', v.data_venda)::date, v.loja_id, p.departamento,
+               sum(v.quantidade_vendida), sum(v.venda_liquida)
+        FROM fato_vendas v
+        JOIN dim_loja l ON l.id = v.loja_id
+        JOIN dim_produto p ON p.id = v.produto_id
+        {filtro}
+        GROUP BY 1, 2, 3;
+    """,
+    "agg_vendas_mes_loja_produto": """
+        INSERT INTO agg_vendas_mes_loja_produto (mes, loja_id, produto_id, quantidade_vendida, venda_liquida)
+        SELECT date_trunc('month', v.data_venda)::date, v.loja_id, v.produto_id,
+               sum(v.quantidade_vendida), sum(v.venda_liquida)
+        FROM fato_vendas v
+        JOIN dim_loja l ON l.id = v.loja_id
+        JOIN dim_produto p ON p.id = v.produto_id
+        {filtro}
+        GROUP BY 1, 2, 3;
+    """,
+}
+
+
+def _versao_fatos(cur):
+    cur.execute("SELECT versao_fatos FROM versao_dados WHERE id = 1;")
+    row = cur.fetchone()
+    return row[0] if row else 0
+
+
+def _carimbar_rollup(cur, tabela, versao):
+    cur.execute("""
+        INSERT INTO controle_rollups (tabela, versao_dados, atualizado_em)
+        VALUES (%s, %s, now())
+        ON CONFLICT (tabela) DO UPDATE
+        SET versao_dados = EXCLUDED.versao_dados, atualizado_em = now();
+    """, (tabela, versao))
+
+
+def refresh_rollups(cur, data_inicial=None, data_final=None):
+    """
+    Recalcula as tabelas de agregados a partir de fato_vendas e registra em
+    'controle_rollups' a versão dos fatos que elas refletem. A API só usa um
+    rollup cuja versão for igual à atual, então rode depois de
+    bump_data_version(cur, fatos=True) e na mesma transação da carga.
+
+    Com data_inicial/data_final, só os meses do período são apagados e
+    recalculados; um rollup que já estava desatualizado antes desta carga é
+    recalculado por inteiro.
+    """
+    versao = _versao_fatos(cur)
+    parcial = data_inicial is not None and data_final is not None
+    if parcial:
+        inicio = data_inicial.replace(day=1)
+        fim = (data_final.replace(day=1) + timedelta(days=32)).replace(day=1)
+
+    for tabela, insert_sql in ROLLUPS_VENDAS.items():
+        cur.execute("SELECT versao_dados FROM controle_rollups WHERE tabela = %s;", (tabela,))
+        row = cur.fetchone()
+        if parcial and row is not None and row[0] >= versao - 1:
+            cur.execute(f"DELETE FROM {tabela} WHERE mes >= %s AND mes < %s;", (inicio, fim))
+            cur.execute(insert_sql.format(filtro="WHERE v.data_venda >= %s AND v.data_venda < %s"),
+                        (inicio, fim))
+        else:
+            cur.execute(f"DELETE FROM {tabela};")
+            cur.execute(insert_sql.format(filtro=""))
+        _carimbar_rollup(cur, tabela, versao)
+
+
+def stamp_rollups(cur):
+    """
+    Carga sem vendas novas (nem mudança de departamento): os rollups que
+    estavam em dia com a versão anterior dos fatos continuam valendo e
+    recebem a versão nova, sem recálculo.
+    """
+    versao = _versao_fatos(cur)
+    cur.execute("""
+        UPDATE controle_rollups SET versao_dados = %s, atualizado_em = now()
+        WHERE versao_dados = %s;
+    """, (versao, versao - 1))
+
+
+def update_watermark(cur, tabela, ultima_data, linhas_carregadas):
+    """Registra em 'etl_watermark' até que data a tabela foi carregada."""
+    cur.execute("""
+        INSERT INTO etl_watermark (tabela, ultima_data, linhas_carregadas, carregado_em)
+        VALUES (%s, %s, %s, now())
+        ON CONFLICT (tabela) DO UPDATE
+        SET ultima_data = GREATEST(etl_watermark.ultima_data, EXCLUDED.ultima_data),
+            linhas_carregadas = EXCLUDED.linhas_carregadas,
+            carregado_em = now();
+    """, (tabela, ultima_data, linhas_carregadas))
+
+
+def refresh_kpi_resumo(cur, data_inicial, data_final):
+    """Recalcula 'kpi_resumo_diario' (venda líquida e lojas com venda) para o período carregado."""
+    cur.execute(
+        "DELETE FROM kpi_resumo_diario WHERE data BETWEEN %s AND %s;",
+        (data_inicial, data_final)
+    )
+    cur.execute("""
+        INSERT INTO kpi_resumo_diario (data, total_venda_liquida, lojas_ativas)
+        SELECT data_venda, sum(venda_liquida), count(DISTINCT loja_id)
+        FROM fato_vendas
+        WHERE data_venda BETWEEN %s AND %s
+        GROUP BY data_venda;
+    """, (data_inicial, data_final))
+
+
+def ensure_month_partitions(cur, tabela, data_inicial, data_final):
+    """
+    Cria as partições mensais que faltarem para o período antes do COPY, para
+    que os fatos novos não caiam na partição DEFAULT. Não faz nada se a tabela
+    não for particionada.
+    Linhas do mês que já estejam na DEFAULT (gravadas por fora do loader, ex.:
+    benchmarks/gerar_dados.py) impediriam o CREATE; nesse caso a DEFAULT é
+    desanexada, as linhas do mês passam para a partição nova e ela volta.
+    """
+    cur.execute("""
+        SELECT a.attname
+        FROM pg_partitioned_table pt
+        JOIN pg_attribute a ON a.attrelid = pt.partrelid AND a.attnum = pt.partattrs[0]
+        WHERE pt.partrelid = to_regclass(%s);
+    """, (tabela,))
+    row = cur.fetchone()
+    if not row:
+        return
+    coluna = row[0]
+    cur.execute("""
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass(%s) AND pg_get_expr(c.relpartbound, c.oid) = 'DEFAULT';
+    """, (tabela,))
+    row = cur.fetchone()
+    default = row[0] if row else None
+
+    mes = data_inicial.replace(day=1)
+    while mes <= data_final:
+        proximo = (mes + timedelta(days=32)).replace(day=1)
+        particao = f"{tabela}_{mes:%Y_%m}"
+        cur.execute("SELECT to_regclass(%s) IS NOT NULL;", (particao,))
+        if not cur.fetchone()[0]:
+            no_default = False
+            if default is not None:
+                cur.execute(
+                    f"SELECT EXISTS (SELECT 1 FROM {default} WHERE {coluna} >= %s AND {coluna} < %s);",
+                    (mes, proximo)
+                )
+                no_default = cur.fetchone()[0]
+            if no_default:
+                cur.execute(f"ALTER TABLE {tabela} DETACH PARTITION {default};")
+                cur.execute(month_partition_ddl(tabela, mes))
+                cur.execute(
+                    f"INSERT INTO {particao} SELECT * FROM {default} WHERE {coluna} >= %s AND {coluna} < %s;",
+                    (mes, proximo)
+                )
+                cur.execute(f"DELETE FROM {default} WHERE {coluna} >= %s AND {coluna} < %s;", (mes, proximo))
+                cur.execute(f"ALTER TABLE {tabela} ATTACH PARTITION {default} DEFAULT;")
+            else:
+                cur.execute(month_partition_ddl(tabela, mes))
+        mes = proximo
+
+
+def refresh_snapshot_catalog(cur, data_inicial, data_final):
+    """Atualiza 'catalogo_snapshot_estoque' (datas e linhas por snapshot) para o período carregado."""
+    cur.execute(
+        "DELETE FROM catalogo_snapshot_estoque WHERE data_snapshot BETWEEN %s AND %s;",
+        (data_inicial, data_final)
+    )
+    cur.execute("""
+        INSERT INTO catalogo_snapshot_estoque (data_snapshot, linhas, atualizado_em)
+        SELECT data_snapshot, count(*), now()
+        FROM fato_estoque
+        WHERE data_snapshot BETWEEN %s AND %s
+        GROUP BY data_snapshot;
+    """, (data_inicial, data_final))
@@ -2,13 +2,33 @@
 
 import pandas as pd
 import psycopg2
+import argparse
 import os
 import sys
 import io
+import queue
+import threading
 from tqdm import tqdm
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 from app.config import settings
+from etl_utils import bump_data_version, update_watermark
+
+HISTORY_COLUMNS = ['opening_stock', 'inbound_quantity', 'sold_quantity', 'closing_stock']
+# Colunas do arquivo consolidado: só código e data são obrigatórias, as demais
+# podem faltar no arquivo e viram NULL na carga
+SOURCE_COLUMNS = ['product_code', 'product_name', 'date'] + HISTORY_COLUMNS
+REQUIRED_COLUMNS = ['product_code', 'date']
+
+
+def check_source_columns(colunas, origem):
+    """Falha antes de qualquer carga, dizendo quais colunas obrigatórias faltam no arquivo."""
+    faltando = [c for c in REQUIRED_COLUMNS if c not in colunas]
+    if faltando:
+        raise ValueError(
+            f"{origem}: faltam as colunas obrigatórias {', '.join(faltando)} "
+            f"(colunas lidas: {', '.join(SOURCE_COLUMNS)})"
+        )
 
 
 def read_data_from_excel():
@@ -17,6 +37,7 @@ def read_data_from_excel():
         file_path = os.path.join(base_dir, 'data', 'dados_consolidados.xlsx')
         print(f"Lendo dados do arquivo consolidado: {file_path}")
         df = pd.read_excel(file_path, dtype={'product_code': str})
+        check_source_columns(df.columns, file_path)
         return df
     except Exception as e:
         print(f"ERRO ao ler o arquivo 'dados_consolidados.xlsx': {e}")
@@ -24,73 +45,295 @@ def read_data_from_excel():
 
 
 def load_data_to_db(df):
+    """
+    Carga completa: envia o arquivo inteiro para a staging e troca o conteúdo
+    de products/product_history numa única transação (TRUNCATE + insert a
+    partir da staging), então a API nunca enxerga as tabelas vazias durante a
+    carga; se algo falhar, os dados antigos continuam lá.
+    """
     conn = None
     try:
         conn = psycopg2.connect(settings.database_url, client_encoding='UTF8')
         cur = conn.cursor()
         print("Conexão bem-sucedida.")
 
-        print("Limpando dados antigos das tabelas...")
-        cur.execute("TRUNCATE TABLE product_history RESTART IDENTITY CASCADE;")
-        cur.execute("TRUNCATE TABLE products RESTART IDENTITY CASCADE;")
-        conn.commit()
-        print("Tabelas limpas.")
-
-        # Garantimosprodutos únicos baseando apenas no 'product_code'.
-        products_df = df[['product_code', 'product_name']].drop_duplicates(
-            subset=['product_code'],
-            keep='first'
-        ).dropna()
-
-        print(f"Iniciando carga em massa de {len(products_df)} produtos únicos...")
-        products_buffer = io.StringIO()
-        products_df.to_csv(products_buffer, index=False, header=False, sep='\t')
-        products_buffer.seek(0)
-
-        cur.copy_expert(
-            sql="COPY products (product_code, product_name) FROM STDIN WITH (FORMAT CSV, DELIMITER E'\\t');",
-            file=products_buffer
-        )
+        df = df.dropna(subset=['product_code', 'date'])
+        _create_staging(cur)
+        chunk_size = 10000
+        with tqdm(total=len(df), desc="Enviando para staging") as pbar:
+            for i in range(0, len(df), chunk_size):
+                chunk = df[i:i + chunk_size]
+                _copy_to_staging(cur, chunk)
+                pbar.update(len(chunk))
+
+        print("Substituindo os dados antigos...")
+        linhas_gravadas = _replace_from_staging(cur)
+        if not df.empty:
+            update_watermark(cur, 'product_history', pd.to_datetime(df['date']).max().date(), linhas_gravadas)
+        versao = bump_data_version(cur)
         conn.commit()
-        print("Produtos inseridos com sucesso.")
+        print(f"Carga completa do histórico concluída (versão dos dados: {versao}).")
+        print("\n--- SUCESSO! Todos os dados foram inseridos via Bulk Insert. ---")
+        return True
+
+    except Exception as e:
+        print(f"\n--- ERRO INESPERADO ---: {e}")
+        if conn: conn.rollback()
+        return False
+    finally:
+        if conn:
+            cur.close()
+            conn.close()
+            print("\nConexão com o banco de dados fechada.")
+
+
+def fetch_last_loaded_dates(cur):
+    """Último dia de histórico já carregado por produto (product_code -> date)."""
+    cur.execute("""
+        SELECT p.product_code, max(h.date)
+        FROM products p
+        JOIN product_history h ON h.product_id = p.id
+        GROUP BY p.product_code;
+    """)
+    return pd.Series(dict(cur.fetchall()), dtype=object)
+
+
+def select_delta_rows(df, ultimo_dia, reprocessar_dias):
+    """
+    Mantém só as linhas que podem ser novas ou alteradas: para cada produto,
+    datas posteriores ao último dia já carregado menos 'reprocessar_dias'
+    (janela para correções retroativas). Produtos sem histórico entram inteiros.
+    """
+    df = df.dropna(subset=['product_code', 'date'])
+    if ultimo_dia.empty:
+        return df
+
+    corte = pd.to_datetime(df['product_code'].map(ultimo_dia)) - pd.Timedelta(days=reprocessar_dias)
+    return df[corte.isna() | (pd.to_datetime(df['date']) > corte)]
+
+
+def _create_staging(cur):
+    # Bancos criados antes da constraint não têm a chave do upsert
+    cur.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS uq_product_history_product_date
+        ON product_history (product_id, date);
+    """)
+    cur.execute("""
+        CREATE TEMP TABLE stg_product_history (
+            product_code TEXT, product_name TEXT, date DATE,
+            opening_stock INTEGER, inbound_quantity INTEGER,
+            sold_quantity INTEGER, closing_stock INTEGER
+        ) ON COMMIT DROP;
+    """)
 
-        # --- Carga em massa para a tabela de histórico ---
-        print(f"Preparando {len(df)} registros de histórico para carga em massa...")
-        cur.execute("SELECT id, product_code FROM products;")
-        product_id_map = {code: id for id, code in cur.fetchall()}
-        df['product_id'] = df['product_code'].map(product_id_map)
 
-        df_history = df.dropna(subset=['product_id'])
-        df_history['product_id'] = df_history['product_id'].astype(int)
+def _copy_to_staging(cur, df):
+    buffer = io.StringIO()
+    # Colunas opcionais ausentes no arquivo vão como NULL
+    df.reindex(columns=SOURCE_COLUMNS).to_csv(
+        buffer, index=False, header=False, sep='\t', date_format='%Y-%m-%d'
+    )
+    buffer.seek(0)
+    cur.copy_expert(
+        sql="COPY stg_product_history FROM STDIN WITH (FORMAT CSV, DELIMITER E'\\t');",
+        file=buffer
+    )
 
-        df_to_copy = df_history[
-            ['product_id', 'date', 'opening_stock', 'inbound_quantity', 'sold_quantity', 'closing_stock']]
 
-        print("Iniciando a operação COPY em lotes para a tabela 'product_history'...")
+def _merge_staging(cur):
+    """Upsert de products/product_history a partir da staging; devolve as linhas de histórico gravadas."""
+    cur.execute("""
+        INSERT INTO products (product_code, product_name)
+        SELECT DISTINCT ON (product_code) product_code, product_name
+        FROM stg_product_history
+        WHERE product_name IS NOT NULL
+        ORDER BY product_code
+        ON CONFLICT (product_code) DO UPDATE
+        SET product_name = EXCLUDED.product_name
+        WHERE products.product_name IS DISTINCT FROM EXCLUDED.product_name;
+    """)
+    print(f"Produtos novos/renomeados: {cur.rowcount}")
+
+    # Só grava linhas realmente alteradas (IS DISTINCT FROM), o resto do delta é ignorado
+    cur.execute("""
+        INSERT INTO product_history (product_id, date, opening_stock, inbound_quantity, sold_quantity, closing_stock)
+        SELECT DISTINCT ON (p.id, s.date)
+               p.id, s.date, s.opening_stock, s.inbound_quantity, s.sold_quantity, s.closing_stock
+        FROM stg_product_history s
+        JOIN products p ON p.product_code = s.product_code
+        ORDER BY p.id, s.date
+        ON CONFLICT (product_id, date) DO UPDATE
+        SET opening_stock = EXCLUDED.opening_stock,
+            inbound_quantity = EXCLUDED.inbound_quantity,
+            sold_quantity = EXCLUDED.sold_quantity,
+            closing_stock = EXCLUDED.closing_stock
+        WHERE (product_history.opening_stock, product_history.inbound_quantity,
+               product_history.sold_quantity, product_history.closing_stock)
+              IS DISTINCT FROM
+              (EXCLUDED.opening_stock, EXCLUDED.inbound_quantity,
+               EXCLUDED.sold_quantity, EXCLUDED.closing_stock);
+    """)
+    linhas_gravadas = cur.rowcount
+    print(f"Registros de histórico inseridos/atualizados: {linhas_gravadas}")
+    return linhas_gravadas
+
+
+def _replace_from_staging(cur):
+    """Carga completa: troca todo o conteúdo pelo da staging dentro da transação."""
+    cur.execute("TRUNCATE TABLE product_history RESTART IDENTITY CASCADE;")
+    cur.execute("TRUNCATE TABLE products RESTART IDENTITY CASCADE;")
+    return _merge_staging(cur)
+
+
+def load_incremental_to_db(df, reprocessar_dias=7):
+    """
+    Carga incremental e idempotente: envia só o delta para uma tabela de staging
+    e faz upsert de products/product_history numa única transação, então a API
+    nunca enxerga as tabelas vazias ou pela metade.
+    """
+    conn = None
+    try:
+        conn = psycopg2.connect(settings.database_url, client_encoding='UTF8')
+        cur = conn.cursor()
+        print("Conexão bem-sucedida.")
+
+        df_delta = select_delta_rows(df, fetch_last_loaded_dates(cur), reprocessar_dias)
+        print(f"{len(df_delta)} de {len(df)} registros são novos ou estão na janela de reprocessamento.")
+        if df_delta.empty:
+            print("\n--- Nada a carregar. ---")
+            return True
+
+        _create_staging(cur)
         chunk_size = 10000
+        with tqdm(total=len(df_delta), desc="Enviando delta para staging") as pbar:
+            for i in range(0, len(df_delta), chunk_size):
+                chunk = df_delta[i:i + chunk_size]
+                _copy_to_staging(cur, chunk)
+                pbar.update(len(chunk))
+
+        linhas_gravadas = _merge_staging(cur)
+        update_watermark(cur, 'product_history', pd.to_datetime(df_delta['date']).max().date(), linhas_gravadas)
+        versao = bump_data_version(cur)
+        conn.commit()
+        print(f"\n--- SUCESSO! Carga incremental concluída (versão dos dados: {versao}). ---")
+        return True
+
+    except Exception as e:
+        print(f"\n--- ERRO INESPERADO ---: {e}")
+        if conn: conn.rollback()
+        return False
+    finally:
+        if conn:
+            cur.close()
+            conn.close()
+            print("\nConexão com o banco de dados fechada.")
+
+
+# --- Ingestão em streaming (CSV / Parquet) ---
+
+SOURCE_DTYPES = {
+    'product_code': 'string',
+    'product_name': 'string',
+    'opening_stock': 'Int64',
+    'inbound_quantity': 'Int64',
+    'sold_quantity': 'Int64',
+    'closing_stock': 'Int64',
+}
 
-        with tqdm(total=len(df_to_copy), desc="Enviando para o BD") as pbar:
-            for i in range(0, len(df_to_copy), chunk_size):
-                chunk = df_to_copy[i:i + chunk_size]
-                buffer = io.StringIO()
-                chunk.to_csv(buffer, index=False, header=False, sep='\t')
-                buffer.seek(0)
-                cur.copy_expert(
-                    sql="""
-                        COPY product_history (product_id, date, opening_stock, inbound_quantity, sold_quantity, closing_stock)
-                        FROM STDIN WITH (FORMAT CSV, DELIMITER E'\\t');
-                    """,
-                    file=buffer
-                )
+
+def iter_source_chunks(file_path, chunk_size=50000):
+    """
+    Lê o arquivo em lotes de tamanho fixo com tipos explícitos, sem carregar
+    o arquivo inteiro: CSV via read_csv(chunksize) e Parquet por record batches.
+    Todo lote sai com as colunas de SOURCE_COLUMNS: as opcionais que faltam
+    no arquivo vêm como NA.
+    """
+    ext = os.path.splitext(file_path)[1].lower()
+    if ext == '.parquet':
+        import pyarrow.parquet as pq
+        parquet_file = pq.ParquetFile(file_path)
+        check_source_columns(parquet_file.schema_arrow.names, file_path)
+        colunas = [c for c in SOURCE_COLUMNS if c in parquet_file.schema_arrow.names]
+        for batch in parquet_file.iter_batches(batch_size=chunk_size, columns=colunas):
+            yield batch.to_pandas().reindex(columns=SOURCE_COLUMNS).astype(SOURCE_DTYPES)
+    elif ext == '.csv':
+        check_source_columns(pd.read_csv(file_path, nrows=0).columns, file_path)
+        for chunk in pd.read_csv(file_path, chunksize=chunk_size, dtype=SOURCE_DTYPES, parse_dates=['date']):
+            yield chunk.reindex(columns=SOURCE_COLUMNS).astype(SOURCE_DTYPES)
+    else:
+        raise ValueError(f"Formato não suportado para streaming: {ext} (use .csv ou .parquet)")
+
+
+def _prefetch(iterator, depth=2):
+    """
+    Lê os próximos lotes numa thread separada (fila limitada a 'depth'),
+    para que o parse do arquivo aconteça enquanto o lote anterior vai para o banco.
+    """
+    fila = queue.Queue(maxsize=depth)
+    fim = object()
+
+    def produtor():
+        try:
+            for item in iterator:
+                fila.put(item)
+        except Exception as e:
+            fila.put(e)
+        fila.put(fim)
+
+    threading.Thread(target=produtor, daemon=True).start()
+    while True:
+        item = fila.get()
+        if item is fim:
+            return
+        if isinstance(item, Exception):
+            raise item
+        yield item
+
+
+def load_stream_to_db(file_path, modo='incremental', reprocessar_dias=7, chunk_size=50000):
+    """
+    Carga em streaming: cada lote lido do arquivo vai direto por COPY para a
+    staging, com memória constante no cliente. No fim, numa única transação,
+    o modo 'completo' substitui as tabelas e o 'incremental' faz o upsert do delta.
+    """
+    conn = None
+    try:
+        conn = psycopg2.connect(settings.database_url, client_encoding='UTF8')
+        cur = conn.cursor()
+        print("Conexão bem-sucedida.")
+
+        ultimo_dia = fetch_last_loaded_dates(cur) if modo == 'incremental' else pd.Series(dtype=object)
+        _create_staging(cur)
+
+        lidas, enviadas, ultima_data = 0, 0, None
+        with tqdm(desc=f"Lendo {os.path.basename(file_path)}", unit=" linhas") as pbar:
+            for chunk in _prefetch(iter_source_chunks(file_path, chunk_size)):
+                lidas += len(chunk)
+                delta = select_delta_rows(chunk, ultimo_dia, reprocessar_dias)
+                if not delta.empty:
+                    _copy_to_staging(cur, delta)
+                    enviadas += len(delta)
+                    maior = pd.to_datetime(delta['date']).max().date()
+                    ultima_data = maior if ultima_data is None else max(ultima_data, maior)
                 pbar.update(len(chunk))
+        print(f"{enviadas} de {lidas} registros enviados para staging.")
+
+        if modo == 'completo':
+            linhas_gravadas = _replace_from_staging(cur)
+        else:
+            linhas_gravadas = _merge_staging(cur)
 
+        if ultima_data is not None:
+            update_watermark(cur, 'product_history', ultima_data, linhas_gravadas)
+        versao = bump_data_version(cur)
         conn.commit()
-        print("Carga em massa do histórico concluída.")
-        print("\n--- SUCESSO! Todos os dados foram inseridos via Bulk Insert. ---")
+        print(f"\n--- SUCESSO! Carga em streaming ({modo}) concluída (versão dos dados: {versao}). ---")
+        return True
 
     except Exception as e:
         print(f"\n--- ERRO INESPERADO ---: {e}")
         if conn: conn.rollback()
+        return False
     finally:
         if conn:
             cur.close()
@@ -99,6 +342,27 @@ def load_data_to_db(df):
 
 
 if __name__ == "__main__":
-    dataframe = read_data_from_excel()
-    if dataframe is not None:
-        load_data_to_db(dataframe)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Carga de products/product_history a partir do arquivo consolidado.")
+    parser.add_argument("--modo", choices=["completo", "incremental"], default="completo",
+                        help="completo: substitui tudo numa transação; incremental: upsert só do delta")
+    parser.add_argument("--reprocessar-dias", type=int, default=7,
+                        help="Dias antes do último carregado que são reprocessados no modo incremental")
+    parser.add_argument("--arquivo",
+                        help="Arquivo .csv ou .parquet lido em streaming (padrão: data/dados_consolidados.xlsx)")
+    parser.add_argument("--lote", type=int, default=50000, help="Linhas por lote no modo streaming")
+    args = parser.parse_args()
+
+    if args.arquivo:
+        sucesso = load_stream_to_db(args.arquivo, modo=args.modo, reprocessar_dias=args.reprocessar_dias,
+                                    chunk_size=args.lote)
+    else:
+        dataframe = read_data_from_excel()
+        if dataframe is None:
+            sucesso = False
+        elif args.modo == "incremental":
+            sucesso = load_incremental_to_db(dataframe, reprocessar_dias=args.reprocessar_dias)
+        else:
+            sucesso = load_data_to_db(dataframe)
+    # Código de saída diferente de zero para o agendador perceber a falha
+    if not sucesso:
+        sys.exit(1)
@@ -0,0 +1,311 @@
+# backend/scripts/load_star_schema.py
+# Carga do Data Mart (esquema estrela): dim_produto, dim_loja, fato_vendas,
+# fato_estoque e kpi_resumo_diario.
+#
+# Arquivos de entrada (CSV, Parquet ou Excel), uma linha por produto/loja/dia:
+#   vendas:  data_venda, product_code, store_id, quantidade_vendida, venda_liquida,
+#            [venda_bruta, custo_total, quantidade_entrada, custo_entrada]
+#   estoque: data_snapshot, product_code, store_id, closing_stock_quantity,
+#            [closing_stock_cost, closing_stock_sale_price]
+# Atributos de produto (product_name, marca, departamento, classificacao, grupo,
+# modelo, fornecedor) e de loja (store_name), quando presentes em qualquer um dos
+# arquivos, atualizam as dimensões.
+#
+# Uso: python scripts/load_star_schema.py --vendas vendas.csv --estoque estoque.parquet --workers 4
+
+import pandas as pd
+import psycopg2
+import argparse
+import os
+import sys
+import io
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from app.config import settings
+from build_columnar import build as build_columnar
+from etl_utils import (bump_data_version, ensure_month_partitions, refresh_rollups, refresh_kpi_resumo,
+                       refresh_snapshot_catalog, stamp_rollups, update_watermark)
+
+PRODUCT_ATTRIBUTES = ['product_name', 'marca', 'departamento', 'classificacao', 'grupo', 'modelo', 'fornecedor']
+
+# tabela -> (coluna de data, colunas de métricas inteiras, colunas de métricas decimais)
+FACT_TABLES = {
+    'fato_vendas': (
+        'data_venda',
+        ['quantidade_vendida', 'quantidade_entrada'],
+        ['venda_liquida', 'venda_bruta', 'custo_total', 'custo_entrada'],
+    ),
+    'fato_estoque': (
+        'data_snapshot',
+        ['closing_stock_quantity'],
+        ['closing_stock_cost', 'closing_stock_sale_price'],
+    ),
+}
+
+
+def read_table(path):
+    """Lê CSV, Parquet ou Excel mantendo os códigos como texto."""
+    print(f"Lendo {path}")
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.parquet':
+        df = pd.read_parquet(path)
+        df['product_code'] = df['product_code'].astype(str)
+        return df
+    if ext in ('.xlsx', '.xls'):
+        return pd.read_excel(path, dtype={'product_code': str})
+    return pd.read_csv(path, dtype={'product_code': str})
+
+
+def _copy_dataframe(cur, df, table, columns):
+    buffer = io.StringIO()
+    df[columns].to_csv(buffer, index=False, header=False, sep='\t')
+    buffer.seek(0)
+    cur.copy_expert(
+        sql=f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT CSV, DELIMITER E'\\t');",
+        file=buffer
+    )
+
+
+def upsert_dimensions(cur, frames):
+    """
+    Atualiza dim_produto/dim_loja em massa (staging + INSERT ... ON CONFLICT) e
+    devolve os mapas de chave natural -> chave substituta e se algum produto já
+    existente mudou de departamento.
+    """
+    produtos = pd.concat(
+        [df.reindex(columns=['product_code'] + PRODUCT_ATTRIBUTES) for df in frames]
+    ).dropna(subset=['product_code']).drop_duplicates(subset=['product_code'], keep='last')
+
+    lojas = pd.concat(
+        [df.reindex(columns=['store_id', 'store_name']) for df in frames]
+    ).dropna(subset=['store_id']).drop_duplicates(subset=['store_id'], keep='last')
+    lojas['store_id'] = lojas['store_id'].astype('int64')
+
+    cur.execute(f"""
+        CREATE TEMP TABLE stg_dim_produto (product_code TEXT, {', '.join(c + ' TEXT' for c in PRODUCT_ATTRIBUTES)})
+        ON COMMIT DROP;
+        CREATE TEMP TABLE stg_dim_loja (store_id INTEGER, store_name TEXT) ON COMMIT DROP;
+    """)
+    _copy_dataframe(cur, produtos, 'stg_dim_produto', ['product_code'] + PRODUCT_ATTRIBUTES)
+    _copy_dataframe(cur, lojas, 'stg_dim_loja', ['store_id', 'store_name'])
+
+    # Produto que muda de departamento altera o rollup por departamento de todos os meses
+    cur.execute("""
+        SELECT EXISTS (
+            SELECT 1 FROM stg_dim_produto s
+            JOIN dim_produto p ON p.product_code = s.product_code
+            WHERE s.departamento IS NOT NULL AND s.departamento IS DISTINCT FROM p.departamento
+        );
+    """)
+    departamentos_alterados = cur.fetchone()[0]
+
+    # Atributos ausentes no arquivo (NULL) não apagam o que já está na dimensão
+    atualiza = ', '.join(f"{c} = COALESCE(EXCLUDED.{c}, dim_produto.{c})" for c in PRODUCT_ATTRIBUTES)
+    cur.execute(f"""
+        INSERT INTO dim_produto (product_code, {', '.join(PRODUCT_ATTRIBUTES)})
+        SELECT product_code, {', '.join(PRODUCT_ATTRIBUTES)} FROM stg_dim_produto
+        ON CONFLICT (product_code) DO UPDATE SET {atualiza};
+    """)
+    cur.execute("""
+        INSERT INTO dim_loja (store_id, store_name)
+        SELECT store_id, store_name FROM stg_dim_loja
+        ON CONFLICT (store_id) DO UPDATE
+        SET store_name = COALESCE(EXCLUDED.store_name, dim_loja.store_name);
+    """)
+
+    cur.execute("SELECT product_code, id FROM dim_produto;")
+    produto_ids = dict(cur.fetchall())
+    cur.execute("SELECT store_id, id FROM dim_loja;")
+    loja_ids = dict(cur.fetchall())
+    print(f"Dimensões: {len(produtos)} produtos e {len(lojas)} lojas no arquivo.")
+    return produto_ids, loja_ids, departamentos_alterados
+
+
+def prepare_facts(df, table, produto_ids, loja_ids):
+    """Troca as chaves naturais pelas substitutas e ajusta os tipos para o COPY."""
+    data_col, int_cols, dec_cols = FACT_TABLES[table]
+    fatos = df.reindex(columns=[data_col, 'product_code', 'store_id'] + int_cols + dec_cols)
+    fatos[data_col] = pd.to_datetime(fatos[data_col]).dt.date
+    fatos['produto_id'] = fatos['product_code'].map(produto_ids).astype('Int64')
+    fatos['loja_id'] = fatos['store_id'].astype('Int64').map(loja_ids).astype('Int64')
+    for col in int_cols:
+        fatos[col] = pd.to_numeric(fatos[col]).round().astype('Int64')
+
+    descartadas = fatos['produto_id'].isna() | fatos['loja_id'].isna() | fatos[data_col].isna()
+    if descartadas.any():
+        print(f"Aviso: {int(descartadas.sum())} linhas de {table} sem produto/loja/data foram descartadas.")
+    return fatos[~descartadas][[data_col, 'produto_id', 'loja_id'] + int_cols + dec_cols]
+
+
+def _partition(fatos, table, particionar, workers):
+    """Divide os fatos em grupos disjuntos de datas (ou de lojas), um por conexão."""
+    data_col = FACT_TABLES[table][0]
+    chave = fatos[data_col] if particionar == 'data' else fatos['loja_id']
+    valores = sorted(chave.unique())
+    grupos = [valores[i::workers] for i in range(workers)]
+    return [fatos[chave.isin(g)] for g in grupos if g]
+
+
+def _executar_isolado(sql):
+    """Roda 'sql' numa conexão própria, já confirmado (DDL visível para os workers)."""
+    conn = psycopg2.connect(settings.database_url, client_encoding='UTF8')
+    try:
+        with conn:
+            sql(conn.cursor())
+    finally:
+        conn.close()
+
+
+def _copy_partition(staging, fatos):
+    """Worker: COPY de uma parte dos fatos para a tabela de staging, numa conexão própria."""
+    conn = psycopg2.connect(settings.database_url, client_encoding='UTF8')
+    try:
+        with conn:
+            _copy_dataframe(conn.cursor(), fatos, staging, list(fatos.columns))
+        return len(fatos)
+    finally:
+        conn.close()
+
+
+def stage_facts(fatos, table, particionar, workers):
+    """
+    COPY paralelo dos fatos para uma tabela de staging (UNLOGGED, fora da
+    transação da carga); a tabela de fatos ainda não é tocada. Devolve
+    (staging, linhas, segundos); a staging deve ser apagada com drop_staging.
+    """
+    data_col, int_cols, dec_cols = FACT_TABLES[table]
+    staging = f"stg_{table}_{uuid.uuid4().hex[:8]}"
+    # Sem referência à tabela de fatos nem chaves estrangeiras: criar a staging
+    # não disputa locks com a transação da carga, que já mexeu nas dimensões
+    colunas = ([f"{data_col} DATE", "produto_id INTEGER", "loja_id INTEGER"]
+               + [f"{c} BIGINT" for c in int_cols] + [f"{c} NUMERIC" for c in dec_cols])
+    _executar_isolado(lambda cur: cur.execute(f"CREATE UNLOGGED TABLE {staging} ({', '.join(colunas)});"))
+
+    inicio = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futuros = [pool.submit(_copy_partition, staging, parte)
+                       for parte in _partition(fatos, table, particionar, workers)]
+            linhas = sum(f.result() for f in futuros)
+    except Exception:
+        drop_staging(staging)
+        raise
+    segundos = time.perf_counter() - inicio
+    print(f"{table}: {linhas} linhas em {segundos:.1f}s ({linhas / max(segundos, 1e-9):,.0f} linhas/s, "
+          f"{workers} conexões) para {staging}")
+    return staging, linhas, segundos
+
+
+def apply_staged(cur, table, staging):
+    """
+    Na transação da carga: apaga da tabela de fatos só os pares (data, loja)
+    presentes no arquivo (carga idempotente, sem tocar nas outras lojas do
+    mesmo dia) e insere o conteúdo da staging.
+    """
+    data_col, int_cols, dec_cols = FACT_TABLES[table]
+    colunas = ', '.join([data_col, 'produto_id', 'loja_id'] + int_cols + dec_cols)
+    cur.execute(f"ANALYZE {staging};")
+    cur.execute(f"SELECT min({data_col}), max({data_col}) FROM {staging};")
+    data_inicial, data_final = cur.fetchone()
+    # Partições mensais antes do INSERT, para os fatos novos não caírem na DEFAULT
+    ensure_month_partitions(cur, table, data_inicial, data_final)
+    cur.execute(f"""
+        DELETE FROM {table} t
+        USING (SELECT DISTINCT {data_col}, loja_id FROM {staging}) k
+        WHERE t.{data_col} = k.{data_col} AND t.loja_id = k.loja_id
+          AND t.{data_col} BETWEEN %s AND %s;
+    """, (data_inicial, data_final))
+    cur.execute(f"INSERT INTO {table} ({colunas}) SELECT {colunas} FROM {staging};")
+    return data_inicial, data_final
+
+
+def drop_staging(staging):
+    _executar_isolado(lambda cur: cur.execute(f"DROP TABLE IF EXISTS {staging};"))
+
+
+def load_star_schema(df_vendas, df_estoque, workers=4, particionar='data'):
+    """
+    Dimensões, fatos, tabelas derivadas e versão dos dados numa única
+    transação: só o COPY para as stagings roda antes, em paralelo. Se algo
+    falhar, nada do que já estava no Data Mart muda.
+    """
+    conn = None
+    stagings = []
+    try:
+        inicio = time.perf_counter()
+        conn = psycopg2.connect(settings.database_url, client_encoding='UTF8')
+        cur = conn.cursor()
+        print("Conexão bem-sucedida.")
+
+        frames = [df for df in (df_vendas, df_estoque) if df is not None]
+        produto_ids, loja_ids, departamentos_alterados = upsert_dimensions(cur, frames)
+
+        total_linhas = 0
+        periodos = {}
+        for df, table in ((df_vendas, 'fato_vendas'), (df_estoque, 'fato_estoque')):
+            if df is None:
+                continue
+            fatos = prepare_facts(df, table, produto_ids, loja_ids)
+            if fatos.empty:
+                continue
+            staging, linhas, _ = stage_facts(fatos, table, particionar, workers)
+            stagings.append(staging)
+            periodos[table] = apply_staged(cur, table, staging)
+            update_watermark(cur, table, periodos[table][1], linhas)
+            total_linhas += linhas
+
+        # Tabelas derivadas e versão dos dados na mesma transação
+        periodo_vendas = periodos.get('fato_vendas')
+        if periodo_vendas is not None:
+            refresh_kpi_resumo(cur, *periodo_vendas)
+        if 'fato_estoque' in periodos:
+            refresh_snapshot_catalog(cur, *periodos['fato_estoque'])
+        versao = bump_data_version(cur, fatos=True)
+        if departamentos_alterados:
+            refresh_rollups(cur)
+        elif periodo_vendas is not None:
+            refresh_rollups(cur, *periodo_vendas)
+        else:
+            stamp_rollups(cur)
+        conn.commit()
+
+        segundos = time.perf_counter() - inicio
+        print(f"\n--- SUCESSO! {total_linhas} fatos em {segundos:.1f}s "
+              f"({total_linhas / max(segundos, 1e-9):,.0f} linhas/s no total, versão dos dados: {versao}). ---")
+
+        if settings.columnar_build_on_load:
+            # Retrato do motor colunar da versão nova (a API usa SQL até ele ficar pronto)
+            build_columnar()
+
+    except Exception as e:
+        print(f"\n--- ERRO INESPERADO ---: {e}")
+        if conn: conn.rollback()
+    finally:
+        if conn:
+            conn.close()
+            print("\nConexão com o banco de dados fechada.")
+        for staging in stagings:
+            drop_staging(staging)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Carga das dimensões e fatos do Data Mart.")
+    parser.add_argument("--vendas", help="Arquivo de vendas diárias por produto/loja")
+    parser.add_argument("--estoque", help="Arquivo de snapshots de estoque por produto/loja")
+    parser.add_argument("--workers", type=int, default=4, help="Conexões COPY em paralelo")
+    parser.add_argument("--particionar", choices=["data", "loja"], default="data",
+                        help="Como dividir o COPY para a staging entre as conexões")
+    args = parser.parse_args()
+
+    if not args.vendas and not args.estoque:
+        parser.error("Informe --vendas e/ou --estoque.")
+
+    load_star_schema(
+        read_table(args.vendas) if args.vendas else None,
+        read_table(args.estoque) if args.estoque else None,
+        workers=max(1, args.workers),
+        particionar=args.particionar,
+    )
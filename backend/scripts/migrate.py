@@ -0,0 +1,25 @@
+# backend/scripts/migrate.py
+# Aplica (ou lista) as migrações do esquema do banco.
+
+import argparse
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from app.db import engine
+from app.migrations import MIGRATIONS, applied_migrations, run_migrations
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migrações do esquema do banco.")
+    parser.add_argument("--status", action="store_true", help="Só lista as migrações aplicadas e pendentes")
+    args = parser.parse_args()
+
+    if args.status:
+        with engine.begin() as conn:
+            aplicadas = set(applied_migrations(conn))
+        for versao, _ in MIGRATIONS:
+            print(f"[{'x' if versao in aplicadas else ' '}] {versao}")
+    else:
+        aplicadas = run_migrations(engine)
+        print(f"Migrações aplicadas: {', '.join(aplicadas)}" if aplicadas else "Esquema já está atualizado.")
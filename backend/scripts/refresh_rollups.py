@@ -0,0 +1,32 @@
+# backend/scripts/refresh_rollups.py
+# Recalcula as tabelas de agregados mensais de vendas usadas pelo /api/query.
+
+import psycopg2
+import os
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from app.config import settings
+from etl_utils import refresh_rollups
+
+
+def main():
+    conn = None
+    try:
+        conn = psycopg2.connect(settings.database_url, client_encoding='UTF8')
+        cur = conn.cursor()
+        inicio = time.perf_counter()
+        refresh_rollups(cur)
+        conn.commit()
+        print(f"Rollups atualizados em {time.perf_counter() - inicio:.1f}s.")
+    except Exception as e:
+        print(f"\n--- ERRO INESPERADO ---: {e}")
+        if conn: conn.rollback()
+    finally:
+        if conn:
+            conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+# backend/scripts/set_user_active.py
+# Ativa ou desativa um usuário.
+# A API guarda o usuário autenticado em cache; a desativação incrementa a versão
+# dos usuários e cada worker esvazia o cache em até AUTH_CACHE_REVOCATION_CHECK_SECONDS.
+
+import argparse
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from app.db import SessionLocal
+from app import crud
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ativa ou desativa um usuário.")
+    parser.add_argument("username")
+    parser.add_argument("--ativar", action="store_true", help="Reativa o usuário (padrão: desativa)")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        user = crud.set_user_active(db, args.username, args.ativar)
+    finally:
+        db.close()
+
+    if user is None:
+        print(f"Erro: O usuário '{args.username}' não existe.")
+    else:
+        print(f"Usuário '{args.username}' {'ativado' if args.ativar else 'desativado'}.")
@@ -0,0 +1,90 @@
+# backend/tests/conftest.py
+# Os testes de integração rodam contra um PostgreSQL descartável apontado por
+# TEST_DATABASE_URL (as tabelas do Data Mart são apagadas e regravadas).
+# Sem ele, são pulados e os demais usam um SQLite temporário.
+# Ex.: TEST_DATABASE_URL=postgresql://... pytest tests
+import os
+import sys
+import tempfile
+
+import pytest
+
+PASTA = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [PASTA, os.path.join(PASTA, "benchmarks"), os.path.join(PASTA, "scripts")]
+
+TEST_DATABASE_URL = os.environ.get("TEST_DATABASE_URL", "")
+_TEMPORARIA = tempfile.mkdtemp(prefix="analisador_testes_")
+
+# A configuração da app é lida no import: o banco de teste entra antes
+if TEST_DATABASE_URL:
+    os.environ["DATABASE_URL"] = TEST_DATABASE_URL
+else:
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(_TEMPORARIA, "teste.sqlite")
+os.environ.setdefault("SECRET_KEY", "teste")
+os.environ["AUTO_MIGRATE"] = "false"
+os.environ.setdefault("COLUMNAR_DIR", os.path.join(_TEMPORARIA, "colunar"))
+os.environ.setdefault("JOBS_DIR", os.path.join(_TEMPORARIA, "jobs"))
+
+
+def _to_char(valor, formato):
+    """to_char(data, 'YYYY-MM') do PostgreSQL, o único formato usado pelo crud."""
+    if valor is None:
+        return None
+    return str(valor)[:7] if formato == "YYYY-MM" else str(valor)
+
+
+@pytest.fixture(scope="session")
+def sqlite_data_mart():
+    """
+    Data Mart sintético pequeno no SQLite temporário (3 lojas, 12 SKUs, 62 dias
+    a partir de 2024-01-01), com o to_char registrado nas conexões.
+    Devolve o DataFrame do histórico consolidado gerado junto.
+    """
+    if TEST_DATABASE_URL:
+        pytest.skip("os testes de SQLite não rodam com TEST_DATABASE_URL")
+    from sqlalchemy import event
+    from gerar_dados import gerar_data_mart
+
+    from app import crud, db, migrations
+
+    for motor in (db.engine, db.analytics_engine, db.subquery_engine):
+        event.listen(motor, "connect", lambda conexao, _: conexao.create_function("to_char", 2, _to_char))
+    migrations.run_migrations(db.engine)
+    _, historico = gerar_data_mart(db.engine, lojas=3, skus=12, dias=62, estoque_intervalo=7)
+    crud.estado_dados_cache.clear()
+    return historico
+
+
+@pytest.fixture
+def client(sqlite_data_mart):
+    """TestClient da API sobre o sqlite_data_mart, já autenticado (usuário "teste")."""
+    from fastapi.testclient import TestClient
+
+    from app import schemas
+    from app.main import app, get_current_user
+
+    app.dependency_overrides[get_current_user] = lambda: schemas.User(id=1, username="teste", is_active=True)
+    yield TestClient(app)
+    app.dependency_overrides.clear()
+
+
+@pytest.fixture
+def async_layer(sqlite_data_mart, monkeypatch):
+    """
+    Liga a camada async dos endpoints (como async_db_enabled=True) com o
+    aiosqlite no mesmo arquivo do sqlite_data_mart. NullPool: nenhuma conexão
+    (e thread do aiosqlite) sobra aberta depois do teste.
+    """
+    from sqlalchemy import event
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+    from sqlalchemy.pool import NullPool
+
+    from app import db, main
+
+    motor = create_async_engine(db.SQLALCHEMY_DATABASE_URL.replace("sqlite://", "sqlite+aiosqlite://", 1),
+                                poolclass=NullPool)
+    event.listen(motor.sync_engine, "connect", lambda conexao, _: conexao.create_function("to_char", 2, _to_char))
+    fabrica = async_sessionmaker(motor, autoflush=False, expire_on_commit=False)
+    monkeypatch.setattr(main, "AsyncSessionLocal", fabrica)
+    monkeypatch.setattr(main, "AsyncAnalyticsSessionLocal", fabrica)
+    return fabrica
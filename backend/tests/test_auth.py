@@ -0,0 +1,56 @@
+# backend/tests/test_auth.py
+# Autenticação (get_current_user e o cache de usuários) sobre o SQLite de teste.
+import pytest
+from fastapi import HTTPException
+
+
+@pytest.fixture
+def usuario(sqlite_data_mart):
+    from app import auth, crud, models
+    from app.cache import principal_cache
+    from app.db import SessionLocal
+
+    with SessionLocal() as db:
+        if crud.get_user_by_username(db, "ana") is None:
+            db.add(models.User(username="ana", hashed_password="x", is_active=True))
+            db.commit()
+    principal_cache.clear()
+    yield auth.create_access_token({"sub": "ana"})
+    with SessionLocal() as db:
+        crud.set_user_active(db, "ana", True)
+    principal_cache.clear()
+
+
+def test_get_current_user_reaproveita_o_usuario_do_token(usuario, monkeypatch):
+    from app import main
+
+    assert main.get_current_user(usuario).username == "ana"
+
+    # Dentro do intervalo das revogações, a segunda chamada não vai ao banco
+    monkeypatch.setattr(main, "SessionLocal", lambda: pytest.fail("abriu sessão"))
+    monkeypatch.setattr(main.principal_cache, "revocation_check_seconds", 60)
+    assert main.get_current_user(usuario).username == "ana"
+
+
+def test_usuario_desativado_perde_o_acesso(usuario, monkeypatch):
+    from app import crud, main
+    from app.db import SessionLocal
+
+    monkeypatch.setattr(main.principal_cache, "revocation_check_seconds", 0)
+    main.get_current_user(usuario)
+    with SessionLocal() as db:
+        # Como o scripts/set_user_active.py, em outro processo: só a versão dos usuários avisa
+        monkeypatch.setattr(main.principal_cache, "invalidate_user", lambda username: None)
+        crud.set_user_active(db, "ana", False)
+
+    with pytest.raises(HTTPException) as erro:
+        main.get_current_user(usuario)
+    assert erro.value.status_code == 401
+
+
+def test_token_invalido(sqlite_data_mart):
+    from app import main
+
+    with pytest.raises(HTTPException) as erro:
+        main.get_current_user("nao-e-um-jwt")
+    assert erro.value.status_code == 401
@@ -0,0 +1,179 @@
+# backend/tests/test_cache.py
+# Caches em memória do app/cache.py (sem banco).
+from datetime import date
+
+import pytest
+
+from app import schemas
+from app.cache import PrincipalCache, QueryCache, VersionCache, make_query_key
+
+
+def _pedido(**campos):
+    dados = {
+        "data_inicial": date(2024, 1, 1),
+        "data_final": date(2024, 1, 31),
+        "dimensoes": ["nome_loja", "nome_marca"],
+        "metricas": [{"nome": "venda_liquida", "agregacao": "SUM"}, {"nome": "quantidade_vendida", "agregacao": "sum"}],
+        **campos,
+    }
+    return schemas.QueryRequest(**dados)
+
+
+@pytest.fixture
+def relogio(monkeypatch):
+    """Controla o time.monotonic visto pelo app/cache.py."""
+    agora = [1000.0]
+    monkeypatch.setattr("app.cache.time.monotonic", lambda: agora[0])
+    return agora
+
+
+def test_query_cache_hit_e_versao_dos_dados():
+    cache = QueryCache(max_entries=4, ttl_seconds=60)
+    cache.set("a", [1], data_version=1)
+
+    assert cache.get("a", 1) == [1]
+    # Carga nova no banco: a entrada deixa de ser servida e sai do cache
+    assert cache.get("a", 2) is None
+    assert cache.get("a", 1) is None
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_query_cache_ttl(relogio):
+    cache = QueryCache(max_entries=4, ttl_seconds=10)
+    cache.set("a", [1], data_version=1)
+    relogio[0] += 9
+    assert cache.get("a", 1) == [1]
+    relogio[0] += 2
+    assert cache.get("a", 1) is None
+
+
+def test_query_cache_lru():
+    cache = QueryCache(max_entries=2, ttl_seconds=60)
+    cache.set("a", 1, 1)
+    cache.set("b", 2, 1)
+    cache.get("a", 1)  # "a" passa a ser a mais recente
+    cache.set("c", 3, 1)
+
+    assert cache.get("b", 1) is None
+    assert cache.get("a", 1) == 1
+    assert cache.get("c", 1) == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_query_cache_desligado():
+    cache = QueryCache(max_entries=0)
+    cache.set("a", 1, 1)
+    assert cache.get("a", 1) is None
+
+
+def test_make_query_key_normaliza_o_pedido():
+    chave = make_query_key(_pedido())
+    reordenado = _pedido(
+        dimensoes=["nome_marca", "nome_loja"],
+        metricas=[{"nome": "quantidade_vendida", "agregacao": "SUM"}, {"nome": "venda_liquida", "agregacao": "sum"}],
+    )
+    assert make_query_key(reordenado) == chave
+    assert make_query_key(_pedido(filtros={"nome_loja": "Loja 001"})) != chave
+    assert make_query_key(_pedido(data_final=date(2024, 2, 29))) != chave
+
+
+def test_make_query_key_inclui_o_modo_do_merge(monkeypatch):
+    from app.config import settings
+
+    monkeypatch.setattr(settings, "query_merge_mode", "sql")
+    chave_sql = make_query_key(_pedido())
+    monkeypatch.setattr(settings, "query_merge_mode", "python")
+    assert make_query_key(_pedido()) != chave_sql
+
+
+def test_version_cache_reaproveita_a_leitura(relogio):
+    cache = VersionCache(ttl_seconds=2)
+    versoes = iter([1, 2])
+
+    assert cache.get(lambda: next(versoes)) == 1
+    relogio[0] += 1
+    assert cache.get(lambda: next(versoes)) == 1
+    relogio[0] += 2
+    assert cache.get(lambda: next(versoes)) == 2
+    assert cache.leituras == 2
+
+
+def test_version_cache_sem_ttl_le_sempre():
+    cache = VersionCache(ttl_seconds=0)
+    versoes = iter([1, 2])
+    assert cache.get(lambda: next(versoes)) == 1
+    assert cache.get(lambda: next(versoes)) == 2
+
+
+def test_estado_dos_dados_lido_uma_vez_por_janela(sqlite_data_mart, monkeypatch):
+    from app import crud
+    from app.db import SessionLocal
+
+    monkeypatch.setattr(crud.estado_dados_cache, "ttl_seconds", 60)
+    crud.estado_dados_cache.clear()
+    with SessionLocal() as db:
+        estado = crud.get_data_state(db)
+        assert (estado.versao, estado.versao_fatos) == (1, 1)
+        db.query(crud.models.VersaoDados).update({"versao": 2})
+        db.commit()
+        try:
+            # Dentro da janela a versão vem da memória, sem nova leitura
+            assert crud.get_data_state(db) is estado
+            crud.estado_dados_cache.clear()
+            assert crud.get_data_state(db).versao == 2
+        finally:
+            db.query(crud.models.VersaoDados).update({"versao": 1})
+            db.commit()
+            crud.estado_dados_cache.clear()
+
+
+@pytest.fixture
+def agora(monkeypatch):
+    """Controla o time.time (expiração das entradas do PrincipalCache)."""
+    instante = [1_000_000.0]
+    monkeypatch.setattr("app.cache.time.time", lambda: instante[0])
+    return instante
+
+
+def _usuario(nome="ana"):
+    return schemas.User(id=1, username=nome, is_active=True)
+
+
+def test_principal_cache_vale_ate_o_ttl_ou_a_expiracao_do_token(agora):
+    cache = PrincipalCache(ttl_seconds=60)
+    cache.set("t1", _usuario())
+    cache.set("t2", _usuario(), token_exp=agora[0] + 10)
+
+    agora[0] += 11
+    assert cache.get("t1") == _usuario()
+    # O JWT expirou antes do TTL: a entrada não pode sobreviver a ele
+    assert cache.get("t2") is None
+    agora[0] += 50
+    assert cache.get("t1") is None
+
+
+def test_principal_cache_lru_e_invalidacao_por_usuario():
+    cache = PrincipalCache(max_entries=2)
+    cache.set("a1", _usuario("ana"))
+    cache.set("b1", _usuario("bia"))
+    cache.get("a1")
+    cache.set("a2", _usuario("ana"))
+
+    assert cache.get("b1") is None
+    cache.invalidate_user("ana")
+    assert cache.get("a1") is None and cache.get("a2") is None
+
+
+def test_principal_cache_esvazia_quando_a_versao_dos_usuarios_muda(relogio):
+    cache = PrincipalCache(revocation_check_seconds=5)
+    versoes = iter([1, 2])
+    cache.check_revocations(lambda: next(versoes))
+    cache.set("a1", _usuario())
+
+    relogio[0] += 1
+    cache.check_revocations(lambda: pytest.fail("leu a versão antes do intervalo"))
+    assert cache.get("a1") is not None
+    relogio[0] += 5
+    cache.check_revocations(lambda: next(versoes))
+    assert cache.get("a1") is None
+    assert cache.stats()["revogacoes"] == 1
@@ -0,0 +1,41 @@
+# backend/tests/test_catalogo.py
+# Catálogo de dimensões (/api/catalogo/dimensoes) e o ETag dele.
+import pytest
+
+from app.main import _etag_corresponde
+
+
+@pytest.mark.parametrize("if_none_match, esperado", [
+    (None, False),
+    ("", False),
+    ('"v1"', True),
+    ('W/"v1"', True),
+    ('"v0", W/"v1"', True),
+    ("*", True),
+    ('"v2"', False),
+    ("v1", False),
+])
+def test_etag_corresponde(if_none_match, esperado):
+    assert _etag_corresponde(if_none_match, '"v1"') is esperado
+    # ETag fraco do lado do servidor: mesma comparação fraca
+    assert _etag_corresponde(if_none_match, 'W/"v1"') is esperado
+
+
+def test_catalogo_responde_304_com_o_mesmo_etag(client):
+    resposta = client.get("/api/catalogo/dimensoes")
+    assert resposta.status_code == 200
+    etag = resposta.headers["ETag"]
+    assert {"valor": "Loja 001", "quantidade": 1} in resposta.json()["dimensoes"]["nome_loja"]
+
+    repetida = client.get("/api/catalogo/dimensoes", headers={"If-None-Match": f"W/{etag}"})
+    assert repetida.status_code == 304
+    assert repetida.content == b"" and repetida.headers["ETag"] == etag
+
+
+def test_catalogo_filtrado_tem_etag_proprio(client):
+    etag = client.get("/api/catalogo/dimensoes").headers["ETag"]
+    resposta = client.get("/api/catalogo/dimensoes", params={"dimensoes": "nome_loja"},
+                          headers={"If-None-Match": etag})
+    assert resposta.status_code == 200
+    assert list(resposta.json()["dimensoes"]) == ["nome_loja"]
+    assert resposta.headers["ETag"] != etag
@@ -0,0 +1,98 @@
+# backend/tests/test_columnar.py
+# Motor colunar (app/columnar.py) contra o SQL, no Data Mart sintético do SQLite.
+from datetime import date
+
+import pytest
+
+from app import schemas
+
+
+def _pedido(dimensoes, metricas=("venda_liquida", "quantidade_vendida"), **campos):
+    return schemas.QueryRequest(
+        data_inicial=campos.pop("data_inicial", date(2024, 1, 1)),
+        data_final=campos.pop("data_final", date(2024, 2, 29)),
+        dimensoes=dimensoes,
+        metricas=[{"nome": m, "agregacao": "SUM"} for m in metricas],
+        **campos,
+    )
+
+
+def _ordenadas(linhas):
+    """Linhas comparáveis entre motores: floats arredondados (SUM em float no SQLite) e ordem fixa."""
+    return sorted((tuple(round(v, 6) if isinstance(v, float) else v for v in linha) for linha in linhas), key=repr)
+
+
+@pytest.fixture
+def db(sqlite_data_mart, tmp_path, monkeypatch):
+    from app.config import settings
+    from app.db import SessionLocal
+
+    monkeypatch.setattr(settings, "columnar_dir", str(tmp_path))
+    with SessionLocal() as sessao:
+        yield sessao
+
+
+def _comparar(db, pedido):
+    from app import crud
+
+    esperado = crud.run_dynamic_query_rows(db, pedido.model_copy(update={"motor": "sql"}))
+    detalhes = {}
+    colunas, linhas = crud.run_dynamic_query_rows(db, pedido.model_copy(update={"motor": "colunar"}),
+                                                  detalhes=detalhes)
+    assert detalhes["motor"] == "colunar"
+    assert colunas == esperado[0]
+    assert _ordenadas(linhas) == _ordenadas(esperado[1])
+    return linhas
+
+
+@pytest.mark.parametrize("pedido", [
+    _pedido(["mes"]),
+    _pedido(["nome_loja", "nome_marca"]),
+    _pedido(["nome_departamento"], ["quantidade_vendida"], data_inicial=date(2024, 1, 10),
+            data_final=date(2024, 1, 20)),
+    _pedido(["codigo_produto", "mes"], filtros={"nome_loja": "Loja 001"}),
+])
+def test_colunar_igual_ao_sql(db, pedido):
+    from app import columnar
+
+    columnar.build_snapshot(db)
+    assert _comparar(db, pedido)
+
+
+def test_colunar_filtro_sem_valor_conhecido(db):
+    from app import columnar
+
+    columnar.build_snapshot(db)
+    assert _comparar(db, _pedido(["nome_loja"], filtros={"nome_loja": "Não existe"})) == []
+
+
+def test_colunar_grupo_so_de_nulos_soma_null(db):
+    from app import columnar, models
+
+    loja = models.DimLoja(store_id=999999, store_name="Loja sem valores")
+    db.add(loja)
+    db.flush()
+    produto_id = db.query(models.DimProduto.id).first()[0]
+    db.add_all([
+        models.FatoVendas(data_venda=date(2024, 1, 15), produto_id=produto_id, loja_id=loja.id),
+        models.FatoVendas(data_venda=date(2024, 1, 16), produto_id=produto_id, loja_id=loja.id,
+                          quantidade_vendida=2),
+    ])
+    db.commit()
+    try:
+        columnar.build_snapshot(db)
+        linhas = _comparar(db, _pedido(["nome_loja"]))
+        assert ("Loja sem valores", None, 2) in linhas
+    finally:
+        db.query(models.FatoVendas).filter(models.FatoVendas.loja_id == loja.id).delete()
+        db.delete(loja)
+        db.commit()
+
+
+def test_retrato_de_outra_versao_nao_e_usado(db):
+    from app import columnar
+
+    versao = columnar.build_snapshot(db)["versao"]
+    assert columnar.columnar_store.retrato(versao) is not None
+    assert columnar.columnar_store.retrato(versao + 1) is None
+    assert columnar.run_query_version(versao + 1, _pedido(["mes"])) is None
@@ -0,0 +1,44 @@
+# backend/tests/test_db.py
+# Opções dos pools de conexão e do statement_timeout (app/db.py).
+import pytest
+
+from app import db
+
+
+@pytest.mark.parametrize("url, postgres", [
+    ("postgresql://u:s@h/b", True),
+    ("postgresql+psycopg2://u:s@h/b", True),
+    ("postgres://u:s@h/b", True),
+    ("sqlite:///x.sqlite", False),
+    ("sqlite+aiosqlite:///x.sqlite", False),
+])
+def test_is_postgres_url(url, postgres):
+    assert db._is_postgres_url(url) is postgres
+
+
+def test_async_database_url():
+    assert db._async_database_url("postgresql+psycopg2://u:s@h:5432/b") == "postgresql+asyncpg://u:s@h:5432/b"
+    assert db._async_database_url("sqlite:///x.sqlite") == "sqlite:///x.sqlite"
+
+
+def test_engine_options_postgres(monkeypatch):
+    monkeypatch.setattr(db.settings, "db_pool_timeout", 7)
+    opcoes = db._engine_options("postgresql://h/b", pool_size=4, max_overflow=2, statement_timeout_ms=1500)
+    assert {k: opcoes[k] for k in ("pool_size", "max_overflow", "pool_timeout")} == \
+        {"pool_size": 4, "max_overflow": 2, "pool_timeout": 7}
+    assert opcoes["connect_args"] == {"options": "-c statement_timeout=1500"}
+
+    # asyncpg recebe o mesmo limite em server_settings
+    assincrono = db._engine_options("postgresql+asyncpg://h/b", 4, 2, 1500, async_driver=True)
+    assert assincrono["connect_args"] == {"server_settings": {"statement_timeout": "1500"}}
+
+
+def test_engine_options_sem_timeout_e_fora_do_postgres():
+    assert "connect_args" not in db._engine_options("postgresql://h/b", 4, 2, statement_timeout_ms=0)
+    assert db._engine_options("sqlite:///x.sqlite", 4, 2, 1500) == {}
+
+
+def test_pools_separados():
+    assert len({id(db.engine), id(db.analytics_engine), id(db.subquery_engine)}) == 3
+    assert db.AnalyticsSessionLocal.kw["bind"] is db.analytics_engine
+    assert db.SubquerySessionLocal.kw["bind"] is db.subquery_engine
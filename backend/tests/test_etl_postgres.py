@@ -0,0 +1,53 @@
+# backend/tests/test_etl_postgres.py
+# Funções SQL do ETL (scripts/etl_utils.py) num PostgreSQL de verdade.
+import os
+from datetime import date
+
+import pytest
+
+pytestmark = pytest.mark.skipif(
+    not os.environ.get("TEST_DATABASE_URL", "").startswith("postgresql"),
+    reason="precisa de TEST_DATABASE_URL apontando para um PostgreSQL descartável",
+)
+
+
+@pytest.fixture
+def cursor():
+    import psycopg2
+    from gerar_dados import gerar_data_mart
+
+    from app.db import engine
+    from app.migrations import run_migrations
+
+    run_migrations(engine)
+    # Gravado direto nas tabelas, sem o loader: os meses sem partição caem na DEFAULT
+    gerar_data_mart(engine, lojas=2, skus=5, dias=62, estoque_intervalo=7)
+    conn = psycopg2.connect(os.environ["TEST_DATABASE_URL"])
+    try:
+        yield conn.cursor()
+    finally:
+        conn.rollback()
+        conn.close()
+
+
+def test_ensure_month_partitions_move_linhas_da_default(cursor):
+    from etl_utils import ensure_month_partitions
+
+    cursor.execute("SELECT count(*) FROM fato_vendas")
+    total = cursor.fetchone()[0]
+
+    ensure_month_partitions(cursor, "fato_vendas", date(2024, 1, 1), date(2024, 2, 29))
+
+    cursor.execute("SELECT count(*) FROM fato_vendas_2024_01")
+    janeiro = cursor.fetchone()[0]
+    cursor.execute("SELECT count(*) FROM fato_vendas WHERE data_venda < '2024-02-01'")
+    assert janeiro == cursor.fetchone()[0] > 0
+    cursor.execute("SELECT count(*) FROM fato_vendas_default WHERE data_venda BETWEEN '2024-01-01' AND '2024-02-29'")
+    assert cursor.fetchone()[0] == 0
+    cursor.execute("SELECT count(*) FROM fato_vendas")
+    assert cursor.fetchone()[0] == total
+
+    # De novo, com as partições já criadas, não muda nada
+    ensure_month_partitions(cursor, "fato_vendas", date(2024, 1, 1), date(2024, 2, 29))
+    cursor.execute("SELECT count(*) FROM fato_vendas_2024_01")
+    assert cursor.fetchone()[0] == janeiro
@@ -0,0 +1,65 @@
+# backend/tests/test_export.py
+# Serialização do resultado (app/export.py): JSON e exportação Arrow/Parquet.
+import io
+from datetime import date
+from decimal import Decimal
+
+import pytest
+
+from app import export
+
+pa = pytest.importorskip("pyarrow")
+
+COLUNAS = ["nome_loja", "venda_liquida", "quantidade_vendida"]
+LINHAS = [("Loja 001", Decimal("10.50"), 3), ("Loja 002", 7.25, None), (None, None, 0)]
+
+
+def _ler(conteudo: bytes, formato: str):
+    if formato == "parquet":
+        import pyarrow.parquet as pq
+        return pq.read_table(io.BytesIO(conteudo))
+    return pa.ipc.open_stream(conteudo).read_all()
+
+
+def _arredondadas(linhas):
+    """Linhas (dicts) comparáveis entre formatos: floats arredondados e ordem fixa."""
+    return sorted(tuple(round(v, 6) if isinstance(v, float) else v for v in linha.values()) for linha in linhas)
+
+
+@pytest.mark.parametrize("formato", ["arrow", "parquet"])
+def test_iter_export_em_varios_lotes(formato):
+    lotes = [LINHAS[:2], [], LINHAS[2:]]
+    tabela = _ler(b"".join(export.iter_export(COLUNAS, iter(lotes), formato)), formato)
+
+    assert tabela.column_names == COLUNAS
+    assert [str(campo.type) for campo in tabela.schema] == ["string", "double", "int64"]
+    assert tabela.to_pylist() == [
+        {"nome_loja": "Loja 001", "venda_liquida": 10.5, "quantidade_vendida": 3},
+        {"nome_loja": "Loja 002", "venda_liquida": 7.25, "quantidade_vendida": None},
+        {"nome_loja": None, "venda_liquida": None, "quantidade_vendida": 0},
+    ]
+
+
+@pytest.mark.parametrize("formato", ["arrow", "parquet"])
+def test_iter_export_sem_linhas_tem_schema(formato):
+    tabela = _ler(b"".join(export.iter_export(COLUNAS, iter([]), formato)), formato)
+    assert tabela.num_rows == 0 and tabela.column_names == COLUNAS
+
+
+def test_contagem_fracionaria_vira_float():
+    tabela = _ler(b"".join(export.iter_export(["estoque_atual"], iter([[(1.5,), (2.0,)]]), "arrow")), "arrow")
+    assert str(tabela.schema.field("estoque_atual").type) == "double"
+
+
+@pytest.mark.parametrize("formato", ["arrow", "parquet"])
+def test_endpoint_de_exportacao(client, formato):
+    pedido = {
+        "data_inicial": "2024-01-01", "data_final": "2024-02-29", "dimensoes": ["nome_loja", "mes"],
+        "metricas": [{"nome": "venda_liquida", "agregacao": "SUM"}, {"nome": "quantidade_vendida", "agregacao": "SUM"}],
+    }
+    esperado = client.post("/api/query", json=pedido).json()
+
+    resposta = client.post(f"/api/query/export?formato={formato}", json=pedido)
+    assert resposta.status_code == 200
+    assert resposta.headers["content-type"] == export.MEDIA_TYPES[formato]
+    assert _arredondadas(_ler(resposta.content, formato).to_pylist()) == _arredondadas(esperado)
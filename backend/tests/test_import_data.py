@@ -0,0 +1,99 @@
+# backend/tests/test_import_data.py
+# Partes do scripts/import_data.py que não dependem do PostgreSQL.
+from datetime import date
+
+import pandas as pd
+import pytest
+
+import import_data
+
+
+def _historico(linhas):
+    return pd.DataFrame(linhas, columns=['product_code', 'product_name', 'date', 'sold_quantity'])
+
+
+def test_select_delta_rows_sem_carga_anterior_envia_tudo():
+    df = _historico([("A", "Produto A", date(2024, 1, 1), 1), (None, "Sem código", date(2024, 1, 1), 1)])
+    delta = import_data.select_delta_rows(df, pd.Series(dtype=object), reprocessar_dias=7)
+    # Linhas sem código ou sem data nunca vão para o banco
+    assert delta['product_code'].tolist() == ["A"]
+
+
+def test_select_delta_rows_respeita_a_janela_de_reprocessamento():
+    dias = pd.date_range("2024-01-01", "2024-01-31").date
+    df = _historico([(codigo, codigo, dia, 1) for codigo in ("A", "B") for dia in dias])
+    ultimo_dia = pd.Series({"A": date(2024, 1, 20)}, dtype=object)
+
+    delta = import_data.select_delta_rows(df, ultimo_dia, reprocessar_dias=5)
+
+    # A: só depois de 20/01 - 5 dias; B (sem histórico carregado): inteiro
+    datas_a = delta.loc[delta['product_code'] == "A", 'date']
+    assert min(datas_a) == date(2024, 1, 16) and len(datas_a) == 16
+    assert len(delta[delta['product_code'] == "B"]) == len(dias)
+
+
+def test_select_delta_rows_sem_janela_reenvia_so_dias_novos():
+    df = _historico([("A", "A", date(2024, 1, d), 1) for d in (9, 10, 11)])
+    delta = import_data.select_delta_rows(df, pd.Series({"A": date(2024, 1, 10)}, dtype=object), 0)
+    assert delta['date'].tolist() == [date(2024, 1, 11)]
+
+
+class _CursorFalso:
+    """Guarda o que o COPY enviaria para a staging."""
+
+    def __init__(self):
+        self.enviado = []
+
+    def copy_expert(self, sql, file):
+        self.enviado.append(file.read())
+
+
+def _arquivo_sem_opcionais(tmp_path, extensao):
+    df = pd.DataFrame({
+        'product_code': ["A", "B"],
+        'date': pd.to_datetime(["2024-01-01", "2024-01-02"]),
+        'sold_quantity': [3, 4],
+        'closing_stock': [10, 11],
+    })
+    caminho = tmp_path / f"historico.{extensao}"
+    if extensao == "parquet":
+        df.to_parquet(caminho, index=False)
+    else:
+        df.to_csv(caminho, index=False)
+    return str(caminho)
+
+
+@pytest.mark.parametrize("extensao", ["parquet", "csv"])
+def test_iter_source_chunks_completa_colunas_opcionais(tmp_path, extensao):
+    if extensao == "parquet":
+        pytest.importorskip("pyarrow")
+    caminho = _arquivo_sem_opcionais(tmp_path, extensao)
+
+    lotes = list(import_data.iter_source_chunks(caminho, chunk_size=1))
+
+    assert len(lotes) == 2
+    lote = pd.concat(lotes)
+    assert list(lote.columns) == import_data.SOURCE_COLUMNS
+    assert lote['product_name'].isna().all() and lote['opening_stock'].isna().all()
+    assert str(lote['inbound_quantity'].dtype) == "Int64"
+    assert lote['sold_quantity'].tolist() == [3, 4]
+
+    # As ausentes vão como campo vazio (NULL) no COPY
+    cursor = _CursorFalso()
+    import_data._copy_to_staging(cursor, lote)
+    assert cursor.enviado[0].splitlines() == ["A\t\t2024-01-01\t\t\t3\t10", "B\t\t2024-01-02\t\t\t4\t11"]
+
+
+@pytest.mark.parametrize("extensao", ["parquet", "csv"])
+def test_iter_source_chunks_sem_coluna_obrigatoria(tmp_path, extensao):
+    if extensao == "parquet":
+        pytest.importorskip("pyarrow")
+    caminho = tmp_path / f"historico.{extensao}"
+    df = pd.DataFrame({'product_code': ["A"], 'sold_quantity': [1]})
+    if extensao == "parquet":
+        df.to_parquet(caminho, index=False)
+    else:
+        df.to_csv(caminho, index=False)
+
+    with pytest.raises(ValueError, match="obrigatórias date"):
+        next(import_data.iter_source_chunks(str(caminho)))
@@ -0,0 +1,131 @@
+# backend/tests/test_jobs.py
+# Fila de análises (app/jobs.py) sobre o Data Mart sintético no SQLite.
+import threading
+import time
+
+import pytest
+
+from app import schemas
+
+PEDIDO = {
+    "data_inicial": "2024-01-01",
+    "data_final": "2024-02-29",
+    "dimensoes": ["nome_loja"],
+    "metricas": [{"nome": "venda_liquida", "agregacao": "SUM"}, {"nome": "estoque_atual", "agregacao": "SUM"}],
+}
+
+
+@pytest.fixture
+def manager(sqlite_data_mart):
+    from app.jobs import JobManager
+
+    gerente = JobManager(workers=1)
+    yield gerente
+    gerente.shutdown()
+
+
+def _esperar(condicao, segundos=5.0):
+    limite = time.monotonic() + segundos
+    while not condicao():
+        assert time.monotonic() < limite, "tempo esgotado"
+        time.sleep(0.01)
+
+
+def test_cancelar_interrompe_tambem_a_subconsulta(manager, monkeypatch):
+    from app import crud, jobs
+    from app.config import settings
+
+    monkeypatch.setattr(settings, "query_merge_mode", "python")
+    monkeypatch.setattr(settings, "query_parallel_subqueries", True)
+
+    # As duas consultas do merge ficam presas até a conexão delas ser interrompida
+    interrompidas, em_andamento = [], []
+
+    def _timed_fetch(db, consulta):
+        conexao = db.connection().connection.dbapi_connection
+        em_andamento.append(conexao)
+        _esperar(lambda: conexao in interrompidas)
+        raise RuntimeError("interrompida")
+    monkeypatch.setattr(crud, "_timed_fetch", _timed_fetch)
+    monkeypatch.setattr(jobs, "_interromper", interrompidas.append)
+
+    job = manager.submit(schemas.QueryRequest(**PEDIDO), "linhas", "ana")
+    _esperar(lambda: len(em_andamento) == 2)
+
+    assert manager.cancel(job["id"], "ana")["status"] == jobs.STATUS_CANCELADO
+    # A sessão do job e a do pool de subconsultas (vendas, em outra thread)
+    assert set(interrompidas) == set(em_andamento)
+    _esperar(lambda: not manager._locais)
+
+    from app.db import SessionLocal
+    with SessionLocal() as db:
+        assert db.get(jobs.models.JobAnalise, job["id"]).status == jobs.STATUS_CANCELADO
+
+
+def test_interrompiveis_recusa_conexao_depois_do_cancelamento(monkeypatch):
+    from app import jobs
+
+    interrompidas = []
+    monkeypatch.setattr(jobs, "_interromper", interrompidas.append)
+    registro = jobs._Interrompiveis()
+
+    with registro.usando("a"):
+        pass
+    with registro.usando("b"):
+        threading.Thread(target=registro.interromper).start()
+        _esperar(lambda: registro.cancelado)
+    # "a" já tinha voltado ao pool: não é interrompida
+    assert interrompidas == ["b"]
+    with pytest.raises(jobs.JobCancelado):
+        with registro.usando("c"):
+            pass
+
+
+def test_recuperar_orfaos_libera_jobs_de_worker_morto(manager):
+    import os
+    import socket
+    import subprocess
+    import sys
+    import uuid
+
+    from app import jobs
+    from app.db import SessionLocal
+
+    morto = subprocess.Popen([sys.executable, "-c", "pass"])
+    morto.wait()
+    host = socket.gethostname()
+    donos = {
+        f"{host}:{morto.pid}": jobs.STATUS_ERRO,  # processo deste host que já terminou
+        f"{host}:{os.getpid()}": jobs.STATUS_PENDENTE,  # este processo
+        "outro-host:1": jobs.STATUS_EXECUTANDO,  # não dá para verificar daqui
+    }
+    ids = {}
+    with SessionLocal() as db:
+        for worker in donos:
+            status = jobs.STATUS_EXECUTANDO if worker.startswith("outro") else jobs.STATUS_PENDENTE
+            job = jobs.models.JobAnalise(id=uuid.uuid4().hex, chave=uuid.uuid4().hex, formato="linhas",
+                                         status=status, donos=["ana"], criado_em=jobs._agora(), worker=worker)
+            db.add(job)
+            ids[worker] = job.id
+        db.commit()
+
+    manager.recuperar_orfaos()
+
+    with SessionLocal() as db:
+        for worker, esperado in donos.items():
+            job = db.get(jobs.models.JobAnalise, ids[worker])
+            assert job.status == esperado, worker
+            db.delete(job)
+        db.commit()
+
+
+def test_falha_ao_interromper_vai_para_o_log(caplog):
+    from app import jobs
+
+    class _Conexao:
+        def cancel(self):
+            raise RuntimeError("conexão fechada")
+
+    with caplog.at_level("ERROR", logger="analisador.jobs"):
+        jobs._interromper(_Conexao())
+    assert "Não foi possível interromper" in caplog.text
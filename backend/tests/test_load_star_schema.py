@@ -0,0 +1,113 @@
+# backend/tests/test_load_star_schema.py
+# Partes do scripts/load_star_schema.py que não dependem do PostgreSQL.
+from datetime import date
+
+import pandas as pd
+import pytest
+
+import load_star_schema
+
+
+class _CursorFalso:
+    """Guarda o SQL executado e o conteúdo que o COPY enviaria."""
+
+    def __init__(self):
+        self.enviado = []
+
+    def copy_expert(self, sql, file):
+        self.enviado.append((sql, file.read()))
+
+    def execute(self, sql):
+        self.enviado.append((sql, None))
+
+
+def _vendas(linhas):
+    return pd.DataFrame(linhas, columns=['data_venda', 'product_code', 'store_id',
+                                         'quantidade_vendida', 'venda_liquida'])
+
+
+@pytest.mark.parametrize("extensao", ["parquet", "csv"])
+def test_read_table_mantem_codigo_como_texto(tmp_path, extensao):
+    if extensao == "parquet":
+        pytest.importorskip("pyarrow")
+    df = pd.DataFrame({'product_code': [1, 20], 'store_id': [1, 2]})
+    caminho = tmp_path / f"vendas.{extensao}"
+    if extensao == "parquet":
+        df.to_parquet(caminho, index=False)
+    else:
+        pd.DataFrame({'product_code': ["0001", "0020"], 'store_id': [1, 2]}).to_csv(caminho, index=False)
+
+    lido = load_star_schema.read_table(str(caminho))
+
+    esperado = ["1", "20"] if extensao == "parquet" else ["0001", "0020"]
+    assert lido['product_code'].tolist() == esperado
+
+
+def test_prepare_facts_troca_chaves_e_descarta_desconhecidas():
+    df = _vendas([
+        ("2024-01-01", "A", 1, 2.6, 10.5),
+        ("2024-01-02", "B", 2, 1, 3.0),
+        ("2024-01-03", "X", 1, 1, 1.0),  # produto desconhecido
+        ("2024-01-04", "A", 9, 1, 1.0),  # loja desconhecida
+        (None, "A", 1, 1, 1.0),  # sem data
+    ])
+
+    fatos = load_star_schema.prepare_facts(df, 'fato_vendas', {"A": 10, "B": 20}, {1: 100, 2: 200})
+
+    assert list(fatos.columns) == ['data_venda', 'produto_id', 'loja_id', 'quantidade_vendida',
+                                   'quantidade_entrada', 'venda_liquida', 'venda_bruta', 'custo_total',
+                                   'custo_entrada']
+    assert fatos['data_venda'].tolist() == [date(2024, 1, 1), date(2024, 1, 2)]
+    assert fatos['produto_id'].tolist() == [10, 20]
+    assert fatos['loja_id'].tolist() == [100, 200]
+    # Métricas inteiras arredondadas; colunas opcionais ausentes ficam nulas
+    assert fatos['quantidade_vendida'].tolist() == [3, 1]
+    assert fatos['quantidade_entrada'].isna().all() and fatos['custo_total'].isna().all()
+
+
+@pytest.mark.parametrize("particionar, coluna", [("data", 'data_venda'), ("loja", 'loja_id')])
+def test_partition_divide_sem_sobrepor_chaves(particionar, coluna):
+    dias = pd.date_range("2024-01-01", "2024-01-10").date
+    fatos = pd.DataFrame([(dia, 1, loja) for dia in dias for loja in (1, 2, 3)],
+                         columns=['data_venda', 'produto_id', 'loja_id'])
+
+    partes = load_star_schema._partition(fatos, 'fato_vendas', particionar, workers=4)
+
+    assert sum(len(parte) for parte in partes) == len(fatos)
+    chaves = [set(parte[coluna]) for parte in partes]
+    assert all(not (a & b) for i, a in enumerate(chaves) for b in chaves[i + 1:])
+    # Menos chaves que workers: nenhuma parte vazia
+    assert len(partes) == (4 if particionar == "data" else 3)
+
+
+def test_copy_dataframe_envia_so_as_colunas_pedidas():
+    cursor = _CursorFalso()
+    df = pd.DataFrame({'store_id': [1, 2], 'store_name': ["Loja 1", None], 'extra': ["x", "y"]})
+
+    load_star_schema._copy_dataframe(cursor, df, 'stg_dim_loja', ['store_id', 'store_name'])
+
+    (sql, conteudo), = cursor.enviado
+    assert sql.startswith("COPY stg_dim_loja (store_id, store_name) FROM STDIN")
+    # Nulo vai como campo vazio (NULL no FORMAT CSV)
+    assert conteudo == "1\tLoja 1\n2\t\n"
+
+
+def test_stage_facts_apaga_a_staging_quando_um_worker_falha(monkeypatch):
+    cursor = _CursorFalso()
+    monkeypatch.setattr(load_star_schema, "_executar_isolado", lambda sql: sql(cursor))
+
+    def _copy_partition(staging, parte):
+        if date(2024, 1, 2) in set(parte['data_venda']):
+            raise RuntimeError("conexão caiu")
+        return len(parte)
+    monkeypatch.setattr(load_star_schema, "_copy_partition", _copy_partition)
+    fatos = pd.DataFrame({'data_venda': pd.date_range("2024-01-01", "2024-01-04").date,
+                          'produto_id': 1, 'loja_id': 1})
+
+    with pytest.raises(RuntimeError):
+        load_star_schema.stage_facts(fatos, 'fato_vendas', 'data', workers=2)
+
+    (criar, _), (apagar, _) = cursor.enviado
+    staging = criar.split()[3]
+    assert criar.startswith("CREATE UNLOGGED TABLE stg_fato_vendas_")
+    assert apagar == f"DROP TABLE IF EXISTS {staging};"
@@ -0,0 +1,81 @@
+# backend/tests/test_products.py
+# Endpoints de produto (histórico paginado, lote, busca) sobre o Data Mart sintético do SQLite.
+CODIGO = "SKU000002"
+
+
+def _historico(sqlite_data_mart, codigo=CODIGO):
+    return sqlite_data_mart[sqlite_data_mart["product_code"] == codigo]
+
+
+def test_historico_completo_sem_parametros(client, sqlite_data_mart):
+    resposta = client.get(f"/api/products/{CODIGO}")
+    assert resposta.status_code == 200
+    assert "X-Next-Cursor" not in resposta.headers
+    historico = resposta.json()["history"]
+    assert [item["sold_quantity"] for item in historico] == _historico(sqlite_data_mart)["sold_quantity"].tolist()
+
+
+def test_historico_paginado_pelo_cursor(client):
+    completo = [item["date"] for item in client.get(f"/api/products/{CODIGO}").json()["history"]]
+
+    paginas, parametros = [], {"limite": 25}
+    while True:
+        resposta = client.get(f"/api/products/{CODIGO}", params=parametros)
+        paginas.append([item["date"] for item in resposta.json()["history"]])
+        cursor = resposta.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+        assert cursor == paginas[-1][-1]
+        parametros["apos"] = cursor
+
+    assert [len(p) for p in paginas] == [25, 25, 12]
+    assert sum(paginas, []) == completo
+
+
+def test_historico_recortado_e_agrupado(client, sqlite_data_mart):
+    resposta = client.get(f"/api/products/{CODIGO}", params={"data_inicial": "2024-01-10", "data_final": "2024-01-12"})
+    assert [item["date"] for item in resposta.json()["history"]] == ["2024-01-10", "2024-01-11", "2024-01-12"]
+
+    meses = client.get(f"/api/products/{CODIGO}", params={"agrupar": "mes"}).json()["history"]
+    assert [item["date"] for item in meses] == ["2024-01-01", "2024-02-01", "2024-03-01"]
+    assert sum(item["sold_quantity"] for item in meses) == _historico(sqlite_data_mart)["sold_quantity"].sum()
+    assert all(item["id"] is None for item in meses)
+
+
+def test_limite_acima_do_maximo_e_rejeitado(client):
+    from app.config import settings
+
+    resposta = client.get(f"/api/products/{CODIGO}", params={"limite": settings.product_history_max_limit + 1})
+    assert resposta.status_code == 422
+
+
+def test_lote_de_produtos(client, sqlite_data_mart):
+    resposta = client.post("/api/products/batch", json={
+        "codigos": ["SKU000003", "NAO_EXISTE", CODIGO, "SKU000003"],
+        "data_inicial": "2024-01-01", "data_final": "2024-01-07",
+    })
+    assert resposta.status_code == 200
+    corpo = resposta.json()
+    assert corpo["nao_encontrados"] == ["NAO_EXISTE"]
+    por_codigo = {p["product_code"]: p for p in corpo["produtos"]}
+    assert sorted(por_codigo) == [CODIGO, "SKU000003"]
+    # Mesmo histórico que o endpoint de um produto só
+    individual = client.get(f"/api/products/{CODIGO}", params={"data_inicial": "2024-01-01", "data_final": "2024-01-07"})
+    assert por_codigo[CODIGO]["history"] == individual.json()["history"]
+
+
+def test_lote_agrupado_por_semana(client, sqlite_data_mart):
+    corpo = client.post("/api/products/batch", json={"codigos": [CODIGO], "agrupar": "semana"}).json()
+    semanas = corpo["produtos"][0]["history"]
+    individual = client.get(f"/api/products/{CODIGO}", params={"agrupar": "semana"}).json()["history"]
+    assert semanas == individual
+    assert sum(item["sold_quantity"] for item in semanas) == _historico(sqlite_data_mart)["sold_quantity"].sum()
+
+
+def test_lote_invalido(client):
+    from app.config import settings
+
+    assert client.post("/api/products/batch", json={"codigos": []}).status_code == 400
+    assert client.post("/api/products/batch", json={"codigos": [CODIGO], "agrupar": "ano"}).status_code == 400
+    excesso = [f"SKU{i:06d}" for i in range(settings.products_batch_max_codes + 1)]
+    assert client.post("/api/products/batch", json={"codigos": excesso}).status_code == 400
@@ -0,0 +1,80 @@
+# backend/tests/test_profiling.py
+# Perfil por requisição, Server-Timing e métricas (app/profiling.py).
+import pytest
+
+from app import profiling
+
+PEDIDO = {
+    "data_inicial": "2024-01-01", "data_final": "2024-02-29", "dimensoes": ["nome_loja"],
+    "metricas": [{"nome": "venda_liquida", "agregacao": "SUM"}, {"nome": "estoque_atual", "agregacao": "SUM"}],
+}
+
+
+def test_perfil_soma_fases_repetidas():
+    perfil = profiling.Perfil()
+    perfil.registrar("sql", 10, linhas=3)
+    perfil.registrar("sql", 5, linhas=2)
+    assert perfil.fases == {"sql": 15} and perfil.linhas == {"sql": 5}
+    assert perfil.server_timing().startswith("sql;dur=15.0, total;dur=")
+
+
+def test_fase_sem_perfil_nao_faz_nada():
+    with profiling.fase("plano"):
+        pass
+    profiling.registrar("sql", 1)
+    assert profiling.perfil_atual() is None
+
+
+def test_metricas_no_formato_do_prometheus():
+    registro = profiling.MetricsRegistry()
+    registro.contar("req_total", "Requisições", rota='/a"b')
+    registro.contar("req_total", "Requisições", rota='/a"b')
+    registro.observar("tempo_segundos", "Tempo", 0.02, rota="/x")
+    registro.observar("tempo_segundos", "Tempo", 3, rota="/x")
+
+    texto = registro.render({"cache_entradas": 4})
+    assert 'req_total{rota="/a\\"b"} 2' in texto
+    # Buckets acumulados
+    assert 'tempo_segundos_bucket{rota="/x",le="0.01"} 0' in texto
+    assert 'tempo_segundos_bucket{rota="/x",le="0.025"} 1' in texto
+    assert 'tempo_segundos_bucket{rota="/x",le="+Inf"} 2' in texto
+    assert 'tempo_segundos_count{rota="/x"} 2' in texto
+    assert "# TYPE cache_entradas gauge\ncache_entradas 4" in texto
+
+
+def test_consulta_lenta_vai_para_o_log(monkeypatch, caplog):
+    from app.config import settings
+
+    monkeypatch.setattr(settings, "query_slow_log_ms", 0.001)
+    perfil = profiling.Perfil()
+    perfil.registrar("sql", 12.3)
+    perfil.consulta = {"usuario": "ana", "dimensoes": ["nome_loja"]}
+    with caplog.at_level("WARNING", logger="analisador.consultas_lentas"):
+        profiling.registrar_consulta(perfil, "/api/query")
+    assert "consulta lenta" in caplog.text and '"usuario": "ana"' in caplog.text
+
+
+def test_server_timing_do_api_query(client, monkeypatch):
+    from app.config import settings
+    from app.main import query_cache
+
+    monkeypatch.setattr(settings, "query_merge_mode", "python")
+    query_cache.clear()
+    resposta = client.post("/api/query", json=PEDIDO)
+    fases = {item.split(";")[0] for item in resposta.headers["Server-Timing"].split(", ")}
+    assert {"cache", "plano", "sql_vendas", "sql_estoque", "merge", "serializacao", "total"} <= fases
+
+    assert "analise_fase_segundos_count" in client.get("/metrics").text
+
+
+@pytest.mark.parametrize("modo", ["sql", "python"])
+def test_endpoint_de_perfil(client, monkeypatch, modo):
+    from app.config import settings
+
+    monkeypatch.setattr(settings, "query_merge_mode", modo)
+    corpo = client.post("/api/query/perfil", json=PEDIDO).json()
+    assert corpo["linhas_resultado"] == 3
+    assert corpo["motor"] == "sql" and corpo["merge"] in (modo, "python_fallback")
+    assert "plano" in corpo["fases_ms"]
+    # Sem PostgreSQL não há EXPLAIN
+    assert corpo["planos"] == []
@@ -0,0 +1,109 @@
+# backend/tests/test_query_postgres.py
+# Vendas + estoque pelo /api/query, streaming e exportação num PostgreSQL de
+# verdade: o FULL OUTER JOIN do merge em SQL tem restrições que o SQLite não tem.
+import io
+import json
+import os
+
+import pytest
+
+pytestmark = pytest.mark.skipif(
+    not os.environ.get("TEST_DATABASE_URL", "").startswith("postgresql"),
+    reason="precisa de TEST_DATABASE_URL apontando para um PostgreSQL descartável",
+)
+
+PEDIDO = {
+    "data_inicial": "2024-01-01",
+    "data_final": "2024-02-29",
+    "dimensoes": ["nome_loja", "mes", "nome_classificacao"],
+    "metricas": [
+        {"nome": "venda_liquida", "agregacao": "SUM"},
+        {"nome": "quantidade_vendida", "agregacao": "SUM"},
+        {"nome": "estoque_atual", "agregacao": "LAST"},
+        {"nome": "estoque_pdv", "agregacao": "LAST"},
+    ],
+}
+DIMENSOES = PEDIDO["dimensoes"]
+
+
+@pytest.fixture(scope="module")
+def client():
+    from fastapi.testclient import TestClient
+    from gerar_dados import gerar_data_mart
+
+    from app import schemas
+    from app.db import engine
+    from app.main import app, get_current_user
+    from app.migrations import run_migrations
+
+    run_migrations(engine)
+    gerar_data_mart(engine, lojas=3, skus=20, dias=62, estoque_intervalo=7)
+    app.dependency_overrides[get_current_user] = lambda: schemas.User(id=1, username="teste", is_active=True)
+    with TestClient(app) as c:
+        yield c
+    app.dependency_overrides.clear()
+
+
+@pytest.fixture
+def merge_mode():
+    """Troca settings.query_merge_mode (o modo faz parte da chave do cache)."""
+    from app.config import settings
+
+    original = settings.query_merge_mode
+
+    def _trocar(modo):
+        settings.query_merge_mode = modo
+    yield _trocar
+    _trocar(original)
+
+
+def _por_chave(linhas):
+    return {tuple(linha[d] for d in DIMENSOES): linha for linha in linhas}
+
+
+def _assert_mesmas_linhas(obtidas, esperadas):
+    obtidas, esperadas = _por_chave(obtidas), _por_chave(esperadas)
+    assert obtidas.keys() == esperadas.keys()
+    for chave, linha in esperadas.items():
+        for metrica in ("venda_liquida", "quantidade_vendida", "estoque_atual", "estoque_pdv"):
+            assert obtidas[chave][metrica] == pytest.approx(linha[metrica]), (chave, metrica)
+
+
+@pytest.fixture
+def esperado(client, merge_mode):
+    """Resultado pelo merge em Python (duas consultas separadas), a referência."""
+    merge_mode("python")
+    resposta = client.post("/api/query", json=PEDIDO)
+    assert resposta.status_code == 200
+    assert resposta.headers["X-Query-Merge"] == "python"
+    assert resposta.json()
+    merge_mode("sql")
+    return resposta.json()
+
+
+def test_query_merge_sql(client, esperado):
+    resposta = client.post("/api/query", json=PEDIDO)
+    assert resposta.status_code == 200
+    # Sem fallback: o FULL OUTER JOIN rodou no banco
+    assert resposta.headers["X-Query-Merge"] == "sql"
+    _assert_mesmas_linhas(resposta.json(), esperado)
+
+
+@pytest.mark.parametrize("stream", ["ndjson", "json"])
+def test_query_stream(client, esperado, stream):
+    resposta = client.post(f"/api/query?stream={stream}", json=PEDIDO)
+    assert resposta.status_code == 200
+    if stream == "ndjson":
+        linhas = [json.loads(linha) for linha in resposta.text.splitlines() if linha]
+    else:
+        linhas = resposta.json()
+    _assert_mesmas_linhas(linhas, esperado)
+
+
+def test_query_export_arrow(client, esperado):
+    pa_ipc = pytest.importorskip("pyarrow.ipc")
+
+    resposta = client.post("/api/query/export?formato=arrow", json=PEDIDO)
+    assert resposta.status_code == 200
+    tabela = pa_ipc.open_stream(io.BytesIO(resposta.content)).read_all()
+    _assert_mesmas_linhas(tabela.to_pylist(), esperado)
@@ -0,0 +1,172 @@
+# backend/tests/test_query_sqlite.py
+# Análise dinâmica e endpoints de produto sobre o Data Mart sintético no SQLite
+# (fixture sqlite_data_mart do conftest). O que depende do PostgreSQL (FULL
+# OUTER JOIN, partições) fica em test_query_postgres.py.
+from datetime import date
+
+import pytest
+
+from app import schemas
+
+
+def _pedido(dimensoes, metricas, **campos):
+    return schemas.QueryRequest(
+        data_inicial=campos.pop("data_inicial", date(2024, 1, 1)),
+        data_final=campos.pop("data_final", date(2024, 2, 29)),
+        dimensoes=dimensoes,
+        metricas=[{"nome": m, "agregacao": "SUM"} for m in metricas],
+        **campos,
+    )
+
+
+@pytest.fixture
+def db(sqlite_data_mart):
+    from app.db import SessionLocal
+
+    with SessionLocal() as sessao:
+        yield sessao
+
+
+def test_estoque_por_mes_sem_modo_continua_atual(db):
+    from app import crud
+
+    # Último snapshot do Data Mart sintético: 2024-02-29
+    colunas, linhas = crud.run_dynamic_query_rows(db, _pedido(["mes"], ["estoque_atual"]))
+    assert colunas == ["mes", "estoque_atual"]
+    assert [linha[0] for linha in linhas] == ["2024-02"]
+
+    atual = crud.run_dynamic_query_rows(db, _pedido(["mes"], ["estoque_atual"], estoque_modo="atual"))
+    assert atual == (colunas, linhas)
+
+    _, serie = crud.run_dynamic_query_rows(db, _pedido(["mes"], ["estoque_atual"], estoque_modo="fim_do_mes"))
+    assert sorted(linha[0] for linha in serie) == ["2024-01", "2024-02"]
+    assert dict(serie)["2024-02"] == linhas[0][1]
+
+
+@pytest.fixture
+def merge_mode(monkeypatch):
+    from app.config import settings
+
+    return lambda modo: monkeypatch.setattr(settings, "query_merge_mode", modo)
+
+
+def _ordenadas(linhas):
+    """Linhas comparáveis entre caminhos: floats arredondados e ordem fixa."""
+    return sorted((tuple(round(v, 6) if isinstance(v, float) else v for v in linha) for linha in linhas), key=repr)
+
+
+PEDIDO_UNIAO = {
+    "data_inicial": "2024-01-01",
+    "data_final": "2024-02-29",
+    "dimensoes": ["nome_loja", "nome_departamento"],
+    "metricas": [
+        {"nome": "venda_liquida", "agregacao": "SUM"},
+        {"nome": "quantidade_vendida", "agregacao": "SUM"},
+        {"nome": "estoque_atual", "agregacao": "SUM"},
+    ],
+}
+
+
+@pytest.mark.parametrize("modo", ["sql", "python"])
+def test_query_pela_camada_async(client, db, async_layer, merge_mode, monkeypatch, modo):
+    import asyncio
+
+    from app import crud
+    from app.main import query_cache
+
+    merge_mode(modo)
+    query_cache.clear()
+    esperado = crud.run_dynamic_query_rows(db, schemas.QueryRequest(**PEDIDO_UNIAO))
+
+    # O merge em Python (só CPU) não pode rodar no event loop
+    threads = []
+    original = crud._merge_rows
+
+    def _merge_rows(*args):
+        try:
+            asyncio.get_running_loop()
+            threads.append("event loop")
+        except RuntimeError:
+            threads.append("threadpool")
+        return original(*args)
+    monkeypatch.setattr(crud, "_merge_rows", _merge_rows)
+    monkeypatch.setattr(crud, "run_dynamic_query_rows", lambda *a, **k: pytest.fail("usou a sessão síncrona"))
+
+    resposta = client.post("/api/query?formato=colunar", json=PEDIDO_UNIAO)
+
+    assert resposta.status_code == 200
+    assert resposta.headers["X-Query-Merge"] in ((modo,) if modo == "python" else ("sql", "python_fallback"))
+    corpo = resposta.json()
+    assert corpo["colunas"] == esperado[0]
+    assert _ordenadas(zip(*corpo["valores"])) == _ordenadas(esperado[1])
+    if resposta.headers["X-Query-Merge"] != "sql":
+        assert threads == ["threadpool"]
+
+
+def test_historico_pela_camada_async(client, db, async_layer, monkeypatch):
+    import asyncio
+
+    from app import crud
+
+    codigo = "SKU000001"
+    produto, esperado, cursor = crud.get_product_history_page(db, codigo, limite=3, agrupar="semana")
+    monkeypatch.setattr(crud, "get_product_history_page", lambda *a, **k: pytest.fail("usou a sessão síncrona"))
+
+    resposta = client.get(f"/api/products/{codigo}", params={"limite": 3, "agrupar": "semana"})
+    assert resposta.status_code == 200
+    assert resposta.headers["X-Next-Cursor"] == cursor.isoformat()
+    assert [item["date"] for item in resposta.json()["history"]] == [item["date"].isoformat() for item in esperado]
+    assert client.get("/api/products/NAO_EXISTE").status_code == 404
+
+    async def _produto():
+        async with async_layer() as adb:
+            return await crud.get_product_by_code_async(adb, codigo)
+    completo = asyncio.run(_produto())
+    assert completo.id == produto.id and len(completo.history) == 62
+
+
+def test_merge_em_python_no_formato_do_merge_em_sql(db, merge_mode):
+    from app import crud
+
+    pedido = _pedido(["nome_departamento", "nome_loja"], ["estoque_atual", "quantidade_vendida", "venda_liquida"])
+    merge_mode("sql")
+    detalhes = {}
+    colunas_sql, linhas_sql = crud.run_dynamic_query_rows(db, pedido, detalhes=detalhes)
+    assert detalhes["merge"] == "sql"
+    merge_mode("python")
+    colunas, linhas = crud.run_dynamic_query_rows(db, pedido)
+
+    # Dimensões na ordem do pedido, métricas na ordem fixa
+    assert colunas == colunas_sql == ["nome_departamento", "nome_loja",
+                                      "venda_liquida", "quantidade_vendida", "estoque_atual"]
+    assert _ordenadas(linhas) == _ordenadas(linhas_sql)
+
+
+@pytest.mark.parametrize("pedido", [
+    PEDIDO_UNIAO,
+    {**PEDIDO_UNIAO, "dimensoes": ["codigo_produto", "mes"], "metricas": PEDIDO_UNIAO["metricas"][:2]},
+])
+def test_streaming_entrega_o_mesmo_resultado(client, monkeypatch, pedido):
+    import json
+
+    from app.config import settings
+
+    # Lotes pequenos: o corpo sai em várias partes
+    monkeypatch.setattr(settings, "query_stream_chunk_size", 7)
+    esperado = client.post("/api/query", json=pedido).json()
+    assert len(esperado) > 7
+
+    ndjson = client.post("/api/query?stream=ndjson", json=pedido)
+    assert ndjson.headers["content-type"] == "application/x-ndjson"
+    linhas = [json.loads(linha) for linha in ndjson.text.splitlines()]
+    assert {tuple(linha) for linha in linhas} == {tuple(esperado[0])}
+    assert _ordenadas(map(dict.values, linhas)) == _ordenadas(map(dict.values, esperado))
+
+    array = client.post("/api/query?stream=json", json=pedido).json()
+    assert _ordenadas(map(dict.values, array)) == _ordenadas(map(dict.values, esperado))
+
+
+def test_streaming_sem_linhas(client):
+    pedido = {**PEDIDO_UNIAO, "metricas": PEDIDO_UNIAO["metricas"][:1], "filtros": {"nome_loja": "Não existe"}}
+    assert client.post("/api/query?stream=json", json=pedido).json() == []
+    assert client.post("/api/query?stream=ndjson", json=pedido).text == ""
@@ -0,0 +1,54 @@
+# backend/tests/test_ratelimit.py
+# Rate limit do /token (app/ratelimit.py).
+import pytest
+
+from app.ratelimit import SlidingWindowLimiter, client_ip
+
+
+@pytest.fixture
+def relogio(monkeypatch):
+    agora = [500.0]
+    monkeypatch.setattr("app.ratelimit.time.monotonic", lambda: agora[0])
+    return agora
+
+
+def test_limite_na_janela_deslizante(relogio):
+    limite = SlidingWindowLimiter(max_attempts=2, window_seconds=10)
+    assert limite.hit("ip") is None
+    relogio[0] += 4
+    assert limite.hit("ip") is None
+
+    # Terceira tentativa: espera até a primeira sair da janela
+    assert limite.hit("ip") == 7
+    assert limite.hit("outro") is None
+    relogio[0] += 6
+    assert limite.retry_after("ip") is None
+    assert limite.hit("ip") is None
+    assert limite.stats()["bloqueios"] == 1
+
+
+def test_retry_after_nao_registra_tentativa(relogio):
+    limite = SlidingWindowLimiter(max_attempts=1, window_seconds=10)
+    for _ in range(3):
+        assert limite.retry_after("ip") is None
+    assert limite.hit("ip") is None
+    assert limite.check("ip") is not None
+    limite.reset("ip")
+    assert limite.check("ip") is None
+
+
+@pytest.mark.parametrize("peer, encaminhado, confiaveis, esperado", [
+    # Sem proxy confiável o cabeçalho é ignorado (o cliente pode forjá-lo)
+    ("1.1.1.1", "9.9.9.9", [], "1.1.1.1"),
+    ("1.1.1.1", "9.9.9.9", ["10.0.0.1"], "1.1.1.1"),
+    # Pelo proxy: o último salto que não é de proxy confiável
+    ("10.0.0.1", "6.6.6.6, 2.2.2.2", ["10.0.0.1"], "2.2.2.2"),
+    ("10.0.0.1", "2.2.2.2, 10.0.0.2", ["10.0.0.1", "10.0.0.2"], "2.2.2.2"),
+    ("10.0.0.1", "10.0.0.2", ["10.0.0.1", "10.0.0.2"], "10.0.0.2"),
+    ("10.0.0.1", " , ", ["10.0.0.1"], "10.0.0.1"),
+    # "*": confia em qualquer proxy e usa o primeiro endereço
+    ("10.0.0.1", "2.2.2.2, 3.3.3.3", ["*"], "2.2.2.2"),
+    (None, "2.2.2.2", ["*"], "?"),
+])
+def test_client_ip(peer, encaminhado, confiaveis, esperado):
+    assert client_ip(peer, encaminhado, confiaveis) == esperado
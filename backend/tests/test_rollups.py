@@ -0,0 +1,95 @@
+# backend/tests/test_rollups.py
+# Roteamento das vendas para os rollups mensais (crud._plan_sales_source) no SQLite.
+# Os rollups são preenchidos aqui com o equivalente SQLite do etl_utils.ROLLUPS_VENDAS.
+from datetime import date
+
+import pytest
+from sqlalchemy import text
+
+from app import schemas
+
+ROLLUPS = {
+    "agg_vendas_mes_loja": """
+        INSERT INTO agg_vendas_mes_loja (mes, loja_id, quantidade_vendida, venda_liquida)
+        SELECT date(data_venda, 'start of month'), loja_id, sum(quantidade_vendida), sum(venda_liquida)
+        FROM fato_vendas GROUP BY 1, 2
+    """,
+    "agg_vendas_mes_loja_departamento": """
+        INSERT INTO agg_vendas_mes_loja_departamento (mes, loja_id, departamento, quantidade_vendida, venda_liquida)
+        SELECT date(v.data_venda, 'start of month'), v.loja_id, p.departamento,
+               sum(v.quantidade_vendida), sum(v.venda_liquida)
+        FROM fato_vendas v JOIN dim_produto p ON p.id = v.produto_id GROUP BY 1, 2, 3
+    """,
+}
+
+
+def _pedido(dimensoes, data_inicial=date(2024, 1, 1), data_final=date(2024, 2, 29), **campos):
+    return schemas.QueryRequest(data_inicial=data_inicial, data_final=data_final, dimensoes=dimensoes,
+                                metricas=[{"nome": "venda_liquida", "agregacao": "SUM"},
+                                          {"nome": "quantidade_vendida", "agregacao": "SUM"}],
+                                motor="sql", **campos)
+
+
+def _arredondadas(resultado):
+    """(colunas, linhas ordenadas com os floats arredondados): SUM em float no SQLite muda na última casa."""
+    colunas, linhas = resultado
+    return colunas, sorted(tuple(round(v, 6) if isinstance(v, float) else v for v in linha) for linha in linhas)
+
+
+@pytest.fixture
+def db(sqlite_data_mart):
+    from app import crud
+    from app.db import SessionLocal
+
+    with SessionLocal() as sessao:
+        versao = crud.get_fact_version(sessao)
+        for tabela, insert in ROLLUPS.items():
+            sessao.execute(text(insert))
+            sessao.execute(text("INSERT INTO controle_rollups (tabela, versao_dados) VALUES (:t, :v)"),
+                           {"t": tabela, "v": versao})
+        sessao.commit()
+        crud.estado_dados_cache.clear()
+        try:
+            yield sessao
+        finally:
+            for tabela in ROLLUPS:
+                sessao.execute(text(f"DELETE FROM {tabela}"))
+            sessao.execute(text("DELETE FROM controle_rollups"))
+            sessao.commit()
+            crud.estado_dados_cache.clear()
+
+
+@pytest.mark.parametrize("pedido, esperado", [
+    (_pedido(["nome_loja", "mes"]), "agg_vendas_mes_loja"),
+    (_pedido(["nome_departamento"], filtros={"nome_loja": "Loja 001"}), "agg_vendas_mes_loja_departamento"),
+    # Produto não tem rollup em dia; período quebrado só a tabela de fatos atende
+    (_pedido(["nome_marca"]), None),
+    (_pedido(["nome_loja"], data_final=date(2024, 2, 15)), None),
+])
+def test_escolhe_o_rollup_mais_agregado(db, pedido, esperado):
+    from app import crud
+
+    rollup = crud._plan_sales_source(db, pedido)
+    assert (rollup.__tablename__ if rollup is not None else None) == esperado
+
+
+def test_rollup_responde_igual_a_tabela_de_fatos(db):
+    from app import crud
+
+    pedido = _pedido(["mes", "nome_departamento"])
+    colunas, pelo_rollup = _arredondadas(crud.run_dynamic_query_rows(db, pedido))
+
+    db.execute(text("DELETE FROM controle_rollups"))
+    db.commit()
+    crud.estado_dados_cache.clear()
+    assert crud._plan_sales_source(db, pedido) is None
+    assert _arredondadas(crud.run_dynamic_query_rows(db, pedido)) == (colunas, pelo_rollup)
+
+
+def test_rollup_de_versao_antiga_nao_e_usado(db):
+    from app import crud
+
+    db.execute(text("UPDATE controle_rollups SET versao_dados = versao_dados - 1"))
+    db.commit()
+    crud.estado_dados_cache.clear()
+    assert crud._plan_sales_source(db, _pedido(["nome_loja"])) is None
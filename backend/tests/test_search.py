@@ -0,0 +1,61 @@
+# backend/tests/test_search.py
+# Índice de busca de produtos (app/search.py).
+import time
+
+import pytest
+
+from app.search import CAMPOS_RESULTADO, ProductSearchIndex, _Indice, normalizar, trigramas
+
+
+def _produto(i, codigo, nome, marca=None, fornecedor=None):
+    return {**dict.fromkeys(CAMPOS_RESULTADO), "id": i, "product_code": codigo, "product_name": nome,
+            "marca": marca, "fornecedor": fornecedor}
+
+
+@pytest.fixture
+def indice():
+    """Índice montado à mão, sem banco (a versão não é relida dentro do intervalo)."""
+    busca = ProductSearchIndex(intervalo_verificacao=3600)
+    busca._indice = _Indice(1, [
+        _produto(1, "CAF001", "Café Pilão Tradicional 500g", "Pilão", "JDE"),
+        _produto(2, "CAF002", "Café Melitta Extra Forte", "Melitta"),
+        _produto(3, "ACU010", "Açúcar Refinado União 1kg", "União"),
+        _produto(4, "CAF0010", "Cafeteira Elétrica", "Mondial"),
+    ])
+    busca._verificado_em = time.monotonic()
+    return busca
+
+
+def _codigos(resultado):
+    return [p["product_code"] for p in resultado]
+
+
+def test_normalizar_e_trigramas():
+    assert normalizar("  Café  PILÃO ") == "cafe pilao"
+    assert normalizar(None) == ""
+    assert trigramas("ab") == {"  a", " ab", "ab "}
+
+
+def test_busca_por_prefixo_sem_acento(indice):
+    assert _codigos(indice.search(None, "acucar")) == ["ACU010"]
+    assert set(_codigos(indice.search(None, "pil"))) == {"CAF001"}
+    # Duas palavras: quem casa com as duas vem antes
+    assert _codigos(indice.search(None, "cafe melitta"))[0] == "CAF002"
+
+
+def test_codigo_exato_vem_primeiro(indice):
+    assert _codigos(indice.search(None, "caf001"))[:2] == ["CAF001", "CAF0010"]
+    assert _codigos(indice.search(None, "caf", limite=2)) == ["CAF001", "CAF0010"]
+
+
+def test_busca_aproximada_tolera_erro_de_digitacao(indice):
+    assert "CAF002" in _codigos(indice.search(None, "melita"))
+    assert indice.search(None, "xyz") == []
+    assert indice.search(None, "   ") == []
+
+
+def test_busca_pelo_endpoint(client):
+    resposta = client.get("/api/search/produtos", params={"q": "SKU000007"})
+    assert resposta.status_code == 200
+    assert resposta.json()[0]["product_code"] == "SKU000007"
+    assert client.get("/api/search/produtos", params={"q": ""}).status_code == 422
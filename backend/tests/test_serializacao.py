@@ -0,0 +1,56 @@
+# backend/tests/test_serializacao.py
+# JSON do resultado do /api/query (export.json_resultado), com e sem orjson.
+import json
+from datetime import date
+from decimal import Decimal
+
+import pytest
+
+from app import export
+
+COLUNAS = ["mes", "nome_loja", "venda_liquida", "estoque_atual"]
+LINHAS = [("2024-01", "Loja 001", Decimal("10.50"), 3), ("2024-02", None, 7.25, None)]
+
+
+@pytest.fixture(params=["orjson", "json"])
+def serializador(request, monkeypatch):
+    if request.param == "orjson":
+        pytest.importorskip("orjson")
+    else:
+        monkeypatch.setattr(export, "orjson", None)
+    return request.param
+
+
+def test_formato_linhas(serializador):
+    assert json.loads(export.json_resultado(COLUNAS, LINHAS)) == [
+        {"mes": "2024-01", "nome_loja": "Loja 001", "venda_liquida": 10.5, "estoque_atual": 3},
+        {"mes": "2024-02", "nome_loja": None, "venda_liquida": 7.25, "estoque_atual": None},
+    ]
+
+
+def test_formato_colunar(serializador):
+    assert json.loads(export.json_resultado(COLUNAS, LINHAS, "colunar")) == {
+        "colunas": COLUNAS,
+        "total": 2,
+        "valores": [["2024-01", "2024-02"], ["Loja 001", None], [10.5, 7.25], [3, None]],
+    }
+    vazio = json.loads(export.json_resultado(COLUNAS, [], "colunar"))
+    assert vazio == {"colunas": COLUNAS, "total": 0, "valores": [[], [], [], []]}
+
+
+def test_datas_e_tipos_desconhecidos(serializador):
+    assert json.loads(export.json_bytes({"data": date(2024, 1, 31)})) == {"data": "2024-01-31"}
+    with pytest.raises(TypeError):
+        export.json_bytes({"x": object()})
+
+
+def test_colunar_pelo_endpoint(client):
+    pedido = {
+        "data_inicial": "2024-01-01", "data_final": "2024-02-29", "dimensoes": ["nome_loja"],
+        "metricas": [{"nome": "venda_liquida", "agregacao": "SUM"}],
+    }
+    linhas = client.post("/api/query", json=pedido).json()
+    colunar = client.post("/api/query?formato=colunar", json=pedido).json()
+
+    assert colunar["total"] == len(linhas)
+    assert [dict(zip(colunar["colunas"], linha)) for linha in zip(*colunar["valores"])] == linhas
@@ -0,0 +1,84 @@
+# backend/tests/test_snapshots.py
+# Catálogo de snapshots de estoque (app/snapshots.py) no SQLite.
+from datetime import date
+
+import pytest
+from sqlalchemy import func
+
+from app import models, schemas
+
+
+@pytest.fixture
+def db(sqlite_data_mart):
+    from app.db import SessionLocal
+
+    with SessionLocal() as sessao:
+        yield sessao
+
+
+@pytest.fixture
+def catalogo():
+    from app.snapshots import SnapshotCatalog
+
+    return SnapshotCatalog()
+
+
+def test_catalogo_igual_ao_fato_estoque(db, catalogo):
+    e = models.FatoEstoque
+    por_data = dict(db.query(e.data_snapshot, func.count(e.id)).group_by(e.data_snapshot).all())
+    assert catalogo.dates(db) == sorted(por_data)
+    assert all(catalogo.rows(db, data) == linhas for data, linhas in por_data.items())
+    assert catalogo.rows(db, date(1999, 1, 1)) == 0
+
+
+def test_ultimo_snapshot_ate_a_data(db, catalogo):
+    datas = catalogo.dates(db)
+    assert catalogo.latest_on_or_before(db, datas[1]) == datas[1]
+    assert catalogo.latest_on_or_before(db, datas[2] - (datas[2] - datas[1]) / 2) == datas[1]
+    assert catalogo.latest_on_or_before(db, datas[0].replace(year=2000)) is None
+    assert catalogo.latest_on_or_before(db, date(2099, 1, 1)) == datas[-1]
+
+
+def test_recarrega_quando_a_versao_muda(db, catalogo):
+    from app import crud
+
+    antes = catalogo.dates(db)
+    db.add(models.CatalogoSnapshotEstoque(data_snapshot=date(2030, 1, 1), linhas=1))
+    db.commit()
+    try:
+        crud.estado_dados_cache.clear()
+        assert catalogo.dates(db) == antes
+        db.query(models.VersaoDados).update({"versao": models.VersaoDados.versao + 1})
+        db.commit()
+        crud.estado_dados_cache.clear()
+        assert catalogo.dates(db)[-1] == date(2030, 1, 1)
+    finally:
+        db.query(models.CatalogoSnapshotEstoque).filter_by(data_snapshot=date(2030, 1, 1)).delete()
+        db.query(models.VersaoDados).update({"versao": models.VersaoDados.versao - 1})
+        db.commit()
+        crud.estado_dados_cache.clear()
+
+
+def _estoque_total(db, estoque_modo, data_final):
+    from app import crud
+
+    pedido = schemas.QueryRequest(data_inicial=date(2024, 1, 1), data_final=data_final, dimensoes=["nome_loja"],
+                                  metricas=[{"nome": "estoque_atual", "agregacao": "SUM"}], estoque_modo=estoque_modo)
+    _, linhas = crud.run_dynamic_query_rows(db, pedido)
+    return sum(linha[1] for linha in linhas)
+
+
+def _estoque_no_snapshot(db, data_snapshot):
+    e = models.FatoEstoque
+    return db.query(func.sum(e.closing_stock_quantity)).filter(e.data_snapshot == data_snapshot).scalar()
+
+
+def test_estoque_pelo_snapshot_do_catalogo(db):
+    from app.snapshots import snapshot_catalog
+
+    data_final = date(2024, 1, 20)
+    snapshot = snapshot_catalog.latest_on_or_before(db, data_final)
+    assert snapshot < data_final
+    # data_final: último snapshot até o fim do período; atual: o último de todos
+    assert _estoque_total(db, "data_final", data_final) == _estoque_no_snapshot(db, snapshot)
+    assert _estoque_total(db, "atual", data_final) == _estoque_no_snapshot(db, snapshot_catalog.dates(db)[-1])